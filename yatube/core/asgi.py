@@ -0,0 +1,191 @@
+"""ASGI-обработчик для Django 2.2.
+
+Django до 3.0 не умеет ASGI, а ORM синхронный и привязан к потоку,
+поэтому представления остаются синхронными: запрос целиком исполняет
+обычный WSGIHandler в пуле потоков. Выигрыш в другом — приём тела
+запроса и отдачу ответа медленным клиентам ведёт цикл событий, и
+поток пула занят только на время работы самого Django.
+"""
+import asyncio
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+# Ключ environ, по которому представление узнаёт, что его исполняет
+# ASGIHandler, а не воркер WSGI
+ENVIRON_KEY = 'core.asgi'
+
+
+def served_by_asgi(request) -> bool:
+    """Можно ли представлению ждать, не занимая воркер WSGI."""
+    return bool(request.META.get(ENVIRON_KEY))
+
+
+def environ_from_scope(scope, body) -> dict:
+    """WSGI environ из ASGI scope; body — файл с телом запроса."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('127.0.0.1', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        # WSGI передаёт путь байтами UTF-8, прочитанными как latin-1
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'REMOTE_ADDR': client[0],
+        'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+        'CONTENT_LENGTH': str(body.seek(0, 2)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+        ENVIRON_KEY: True,
+    }
+    body.seek(0)
+    for name, value in scope.get('headers', ()):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = name if name == 'CONTENT_TYPE' else f'HTTP_{name}'
+        if key in environ:
+            separator = '; ' if key == 'HTTP_COOKIE' else ','
+            value = environ[key] + separator + value
+        environ[key] = value
+    return environ
+
+
+class ASGIHandler:
+    """ASGI-приложение поверх WSGI-приложения Django и пула потоков."""
+
+    def __init__(self, wsgi_application, max_workers=None, executor=None,
+                 stream_executor=None):
+        self.wsgi_application = wsgi_application
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers, thread_name_prefix='asgi'
+        )
+        # фабрика пула на один потоковый ответ
+        self.stream_executor = stream_executor or (
+            lambda: ThreadPoolExecutor(1, thread_name_prefix='asgi-stream')
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError(f'Тип соединения не поддерживается: '
+                             f'{scope["type"]}')
+        body = await self.read_body(receive)
+        if body is None:
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            status, headers, chunks, response = await loop.run_in_executor(
+                self.executor, self.run_wsgi, environ_from_scope(scope, body)
+            )
+        finally:
+            body.close()
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': headers,
+        })
+        if response is None:
+            await send({'type': 'http.response.body', 'body': chunks})
+            return
+        await self.stream(chunks, response, receive, send)
+
+    async def stream(self, chunks, response, receive, send):
+        """Отдать потоковый ответ, пока клиент не ушёл.
+
+        Порции готовит отдельный поток этого ответа: долгий SSE не
+        занимает пул запросов, а close() с сигналом request_finished
+        исполняется в том же потоке, что открывал соединения с БД
+        генератора. Ожидание порции соревнуется с http.disconnect.
+        """
+        loop = asyncio.get_running_loop()
+        executor = self.stream_executor()
+        disconnect = asyncio.ensure_future(self.wait_disconnect(receive))
+        try:
+            while True:
+                chunk = loop.run_in_executor(executor, next, chunks, None)
+                await asyncio.wait(
+                    {chunk, disconnect}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if disconnect.done():
+                    return
+                if chunk.result() is None:
+                    await send({'type': 'http.response.body', 'body': b''})
+                    return
+                await send({
+                    'type': 'http.response.body',
+                    'body': chunk.result(),
+                    'more_body': True,
+                })
+        finally:
+            disconnect.cancel()
+            # после ухода клиента close() дождётся текущей порции
+            await loop.run_in_executor(executor, response.close)
+            executor.shutdown(wait=False)
+
+    async def wait_disconnect(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    async def read_body(self, receive):
+        """Тело запроса во временный файл; None, если клиент ушёл."""
+        body = tempfile.SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        )
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return None
+            body.write(message.get('body', b''))
+            if not message.get('more_body'):
+                return body
+
+    def run_wsgi(self, environ):
+        """Запрос через WSGI-приложение целиком в одном потоке.
+
+        Обычный ответ собирается и закрывается здесь же, чтобы сигнал
+        request_finished закрыл соединения с БД того потока, который
+        их открыл.
+        """
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [
+                (name.lower().encode('latin-1'), value.encode('latin-1'))
+                for name, value in headers
+            ]
+
+        response = self.wsgi_application(environ, start_response)
+        if getattr(response, 'streaming', False):
+            return (
+                started['status'], started['headers'], iter(response),
+                response,
+            )
+        try:
+            content = b''.join(response)
+        finally:
+            response.close()
+        return started['status'], started['headers'], content, None
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
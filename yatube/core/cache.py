@@ -0,0 +1,236 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY,'
+    ' value BLOB NOT NULL,'
+    ' expires REAL,'
+    ' accessed REAL NOT NULL,'
+    ' size INTEGER NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    # Число записей и объём держат триггеры: COUNT(*) и SUM(size) на
+    # каждую запись читали бы всю таблицу вместе со страницами BLOB
+    'CREATE TABLE IF NOT EXISTS cache_usage ('
+    ' id INTEGER PRIMARY KEY CHECK (id = 0),'
+    ' entries INTEGER NOT NULL,'
+    ' size INTEGER NOT NULL)',
+    'CREATE TRIGGER IF NOT EXISTS cache_usage_insert AFTER INSERT ON cache '
+    'BEGIN UPDATE cache_usage'
+    ' SET entries = entries + 1, size = size + NEW.size; END',
+    'CREATE TRIGGER IF NOT EXISTS cache_usage_delete AFTER DELETE ON cache '
+    'BEGIN UPDATE cache_usage'
+    ' SET entries = entries - 1, size = size - OLD.size; END',
+    'CREATE TRIGGER IF NOT EXISTS cache_usage_update'
+    ' AFTER UPDATE OF size ON cache '
+    'BEGIN UPDATE cache_usage SET size = size - OLD.size + NEW.size; END',
+    # файл кэша без cache_usage: посчитать один раз
+    'INSERT OR IGNORE INTO cache_usage (id, entries, size)'
+    ' SELECT 0, (SELECT COUNT(*) FROM cache),'
+    ' (SELECT TOTAL(size) FROM cache)'
+    ' WHERE NOT EXISTS (SELECT 1 FROM cache_usage)',
+)
+
+
+class SQLiteCache(BaseCache):
+    """Общий для всех процессов кэш в файле SQLite.
+
+    Работает без внешних сервисов: воркеры gunicorn на одной машине
+    видят записи и инвалидацию друг друга. Переполнение по числу
+    записей (MAX_ENTRIES) или по объёму (MAX_SIZE, байт) вытесняет
+    давно не читанные ключи (LRU).
+
+    Время чтения обновляется не чаще раза в ACCESS_RESOLUTION секунд
+    на ключ и без ожидания блокировки: запись на каждое попадание
+    выстроила бы чтения всех воркеров в очередь за одной блокировкой
+    записи SQLite.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        options = params.get('OPTIONS', {})
+        self._max_size = int(options.get('MAX_SIZE', 0))
+        self._busy_timeout = float(options.get('BUSY_TIMEOUT', 5))
+        self._access_resolution = float(options.get('ACCESS_RESOLUTION', 60))
+        self._local = threading.local()
+
+    @property
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(
+                self._path,
+                timeout=self._busy_timeout,
+                isolation_level=None,
+            )
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                db.execute(statement)
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def _fetch(self, key):
+        """(значение, время чтения) живого ключа; истёкшие удаляет _cull."""
+        row = self._db.execute(
+            'SELECT value, expires, accessed FROM cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[1] is not None and row[1] <= time.time():
+            return None
+        return row[0], row[2]
+
+    def _touch_accessed(self, key, accessed):
+        now = time.time()
+        if now - accessed < self._access_resolution:
+            return
+        try:
+            self._db.execute('PRAGMA busy_timeout = 0')
+            self._db.execute(
+                'UPDATE cache SET accessed = ? WHERE key = ?', (now, key)
+            )
+        except sqlite3.OperationalError:
+            # база занята записью: LRU подождёт следующего чтения
+            pass
+        finally:
+            self._db.execute(
+                f'PRAGMA busy_timeout = {int(self._busy_timeout * 1000)}'
+            )
+
+    def _store(self, key, value, timeout, only_expired=False):
+        """Вставить или заменить ключ; only_expired — заменить, только
+        если старое значение истекло (add). Вернуть число записанных строк.
+        """
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        expires = self.get_backend_timeout(timeout)
+        # UPDATE, а не REPLACE: удаление при REPLACE не вызывает триггер
+        condition = (
+            ' WHERE cache.expires IS NOT NULL'
+            ' AND cache.expires <= excluded.accessed'
+            if only_expired else ''
+        )
+        cursor = self._db.execute(
+            'INSERT INTO cache (key, value, expires, accessed, size) '
+            'VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value,'
+            ' expires = excluded.expires, accessed = excluded.accessed,'
+            ' size = excluded.size' + condition,
+            (key, blob, expires, time.time(), len(blob)),
+        )
+        return cursor.rowcount
+
+    def _usage(self):
+        return self._db.execute(
+            'SELECT entries, size FROM cache_usage'
+        ).fetchone()
+
+    def _over_limits(self, count, size):
+        return count > self._max_entries or (
+            self._max_size and size > self._max_size
+        )
+
+    def _cull(self):
+        if not self._over_limits(*self._usage()):
+            return
+        self._db.execute(
+            'DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?',
+            (time.time(),),
+        )
+        count, size = self._usage()
+        if count > self._max_entries:
+            self._db.execute(
+                'DELETE FROM cache WHERE key IN ('
+                ' SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+                (max(count // self._cull_frequency,
+                     count - self._max_entries),),
+            )
+            count, size = self._usage()
+        if self._max_size and size > self._max_size:
+            self._db.execute(
+                'DELETE FROM cache WHERE key IN ('
+                ' SELECT key FROM ('
+                '  SELECT key, size, SUM(size) OVER ('
+                '   ORDER BY accessed ROWS UNBOUNDED PRECEDING) AS freed'
+                '  FROM cache)'
+                ' WHERE freed - size < ?)',
+                (size - self._max_size,),
+            )
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        row = self._fetch(key)
+        if row is None:
+            return default
+        blob, accessed = row
+        self._touch_accessed(key, accessed)
+        return pickle.loads(blob)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._store(key, value, timeout)
+        self._cull()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        added = self._store(key, value, timeout, only_expired=True)
+        if added:
+            self._cull()
+        return bool(added)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        cursor = self._db.execute(
+            'UPDATE cache SET expires = ? WHERE key = ?',
+            (self.get_backend_timeout(timeout), key),
+        )
+        return bool(cursor.rowcount)
+
+    def incr(self, key, delta=1, version=None):
+        """Атомарно между процессами: чтение и запись под одной блокировкой."""
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._db.execute('BEGIN IMMEDIATE')
+        try:
+            row = self._fetch(key)
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            self._db.execute(
+                'UPDATE cache SET value = ?, size = ?, accessed = ? '
+                'WHERE key = ?',
+                (blob, len(blob), time.time(), key),
+            )
+        except BaseException:
+            self._db.execute('ROLLBACK')
+            raise
+        self._db.execute('COMMIT')
+        return value
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._db.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._fetch(key) is not None
+
+    def clear(self):
+        self._db.execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        """Соединение живёт весь поток: так не платим за открытие файла."""
@@ -0,0 +1,28 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        'Копирует primary SQLite в файлы реплик из DATABASE_REPLICAS '
+        'через backup API: локальная замена репликации.'
+    )
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('Реплики не заданы: YATUBE_DB_REPLICAS пуст.')
+        primary = connections['default']
+        if primary.vendor != 'sqlite':
+            raise CommandError('Копировать файлом можно только SQLite.')
+        primary.ensure_connection()
+        for alias in settings.DATABASE_REPLICAS:
+            connections[alias].close()
+            replica = sqlite3.connect(connections[alias].settings_dict['NAME'])
+            try:
+                primary.connection.backup(replica)
+            finally:
+                replica.close()
+            self.stdout.write(self.style.SUCCESS(f'{alias}: скопирована'))
@@ -0,0 +1,295 @@
+"""Метрики запросов по представлениям.
+
+Middleware заводит RequestMetrics на время запроса; в него пишут
+обёртка выполнения SQL, бэкенд шаблонов и кэш фрагментов лент.
+Итоги копятся в памяти процесса и отдаются в формате Prometheus.
+
+Под gunicorn с несколькими воркерами /metrics/ отвечает случайный
+воркер. С METRICS_DIR каждый воркер не реже раза в
+METRICS_FLUSH_INTERVAL секунд сбрасывает свои итоги в отдельный файл,
+а /metrics/ складывает файлы всех воркеров. Без него у каждой серии
+есть метка worker, чтобы счётчики разных процессов не смешивались.
+"""
+import os
+import pickle
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+
+_local = threading.local()
+_lock = threading.Lock()
+_views = {}
+_template_renders = Counter()
+_template_times = Counter()
+_flush = {'pid': None, 'name': None, 'at': 0.0}
+
+
+class RequestMetrics:
+    """Счётчики одного запроса. Экземпляр — это и execute_wrapper."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_time = 0.0
+        self.queries = 0
+        self.statements = Counter()
+        self.template_time = 0.0
+        self.template_renders = Counter()
+        self.template_times = Counter()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            self.statements[hash((sql, repr(params)))] += 1
+
+    @property
+    def duplicates(self):
+        """Запросы, повторившие уже выполненный SQL с теми же параметрами."""
+        return sum(count - 1 for count in self.statements.values())
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self, duration):
+        """Значение заголовка Server-Timing, длительности в мс."""
+        parts = [
+            f'total;dur={duration * 1000:.1f}',
+            f'db;dur={self.db_time * 1000:.1f};'
+            f'desc="{self.queries} queries, {self.duplicates} dup"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+        ]
+        if self.cache_hits or self.cache_misses:
+            parts.append(
+                f'cache;desc="{self.cache_hits} hit, '
+                f'{self.cache_misses} miss"'
+            )
+        return ', '.join(parts)
+
+
+class ViewStats:
+    """Накопленные метрики одного представления."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.requests = 0
+        self.duration = 0.0
+        self.db_time = 0.0
+        self.queries = 0
+        self.duplicates = 0
+        self.template_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def add(self, metrics, duration):
+        self.requests += 1
+        self.duration += duration
+        for index, bound in enumerate(self.buckets):
+            if duration <= bound:
+                self.bucket_counts[index] += 1
+        self.db_time += metrics.db_time
+        self.queries += metrics.queries
+        self.duplicates += metrics.duplicates
+        self.template_time += metrics.template_time
+        self.cache_hits += metrics.cache_hits
+        self.cache_misses += metrics.cache_misses
+
+    def merge(self, other):
+        """Прибавить итоги того же представления из другого воркера."""
+        self.bucket_counts = [
+            count + other_count for count, other_count
+            in zip(self.bucket_counts, other.bucket_counts)
+        ]
+        for attribute in ('requests', 'duration', 'db_time', 'queries',
+                          'duplicates', 'template_time', 'cache_hits',
+                          'cache_misses'):
+            setattr(self, attribute,
+                    getattr(self, attribute) + getattr(other, attribute))
+
+
+def start():
+    _local.metrics = RequestMetrics()
+    return _local.metrics
+
+
+def stop():
+    _local.metrics = None
+
+
+def current():
+    return getattr(_local, 'metrics', None)
+
+
+def template_rendered(duration):
+    metrics = current()
+    if metrics is not None:
+        metrics.template_time += duration
+
+
+def template_timed(name, duration):
+    """Время рендеринга одного шаблона вместе с вложенными в него."""
+    metrics = current()
+    if metrics is not None:
+        metrics.template_renders[name] += 1
+        metrics.template_times[name] += duration
+
+
+def cache_lookup(hit):
+    metrics = current()
+    if metrics is not None:
+        if hit:
+            metrics.cache_hits += 1
+        else:
+            metrics.cache_misses += 1
+
+
+def record(view, metrics, duration):
+    with _lock:
+        stats = _views.get(view)
+        if stats is None:
+            stats = _views[view] = ViewStats(settings.METRICS_BUCKETS)
+        stats.add(metrics, duration)
+        _template_renders.update(metrics.template_renders)
+        _template_times.update(metrics.template_times)
+        if time.monotonic() - _flush['at'] >= settings.METRICS_FLUSH_INTERVAL:
+            flush()
+
+
+def worker_file():
+    """Файл итогов этого процесса; после fork у воркера он свой."""
+    if _flush['pid'] != os.getpid():
+        # pid может достаться новому воркеру: уникальная часть не даёт
+        # ему затереть итоги прежнего, и счётчики не убывают
+        _flush['pid'] = os.getpid()
+        _flush['name'] = f'{os.getpid()}-{uuid.uuid4().hex}.pickle'
+    return os.path.join(settings.METRICS_DIR, _flush['name'])
+
+
+def flush():
+    """Записать итоги процесса в METRICS_DIR; вызывать под _lock."""
+    _flush['at'] = time.monotonic()
+    if not settings.METRICS_DIR:
+        return
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    data = pickle.dumps(
+        (_views, _template_renders, _template_times),
+        pickle.HIGHEST_PROTOCOL,
+    )
+    # rename атомарен: читатель не увидит файл записанным наполовину
+    descriptor, path = tempfile.mkstemp(dir=settings.METRICS_DIR)
+    with os.fdopen(descriptor, 'wb') as file:
+        file.write(data)
+    os.replace(path, worker_file())
+
+
+def collected():
+    """Итоги всех воркеров из METRICS_DIR; вызывать под _lock."""
+    flush()
+    views, renders, times = {}, Counter(), Counter()
+    for name in os.listdir(settings.METRICS_DIR):
+        if not name.endswith('.pickle'):
+            continue
+        try:
+            with open(os.path.join(settings.METRICS_DIR, name), 'rb') as file:
+                worker_views, worker_renders, worker_times = pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            continue
+        for view, stats in worker_views.items():
+            if view in views:
+                views[view].merge(stats)
+            else:
+                views[view] = stats
+        renders.update(worker_renders)
+        times.update(worker_times)
+    return views, renders, times
+
+
+def reset():
+    with _lock:
+        _views.clear()
+        _template_renders.clear()
+        _template_times.clear()
+        _flush['at'] = 0.0
+
+
+COUNTERS = (
+    ('db_duration_seconds_total', 'db_time',
+     'Время в запросах к БД.'),
+    ('db_queries_total', 'queries', 'SQL-запросы.'),
+    ('db_duplicate_queries_total', 'duplicates',
+     'Повторные SQL-запросы с теми же параметрами.'),
+    ('template_duration_seconds_total', 'template_time',
+     'Время рендеринга шаблонов.'),
+    ('cache_hits_total', 'cache_hits', 'Попадания в кэш фрагментов.'),
+    ('cache_misses_total', 'cache_misses', 'Промахи кэша фрагментов.'),
+)
+
+
+def label(view):
+    return view.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def prometheus() -> str:
+    """Накопленные метрики в текстовом формате Prometheus."""
+    with _lock:
+        if settings.METRICS_DIR:
+            views, renders, times = collected()
+            worker = ''
+        else:
+            views, renders, times = _views, _template_renders, _template_times
+            worker = f',worker="{os.getpid()}"'
+        views = sorted(views.items())
+        prefix = settings.METRICS_PREFIX
+        lines = [
+            f'# HELP {prefix}_request_duration_seconds Время ответа.',
+            f'# TYPE {prefix}_request_duration_seconds histogram',
+        ]
+        for view, stats in views:
+            name = f'{prefix}_request_duration_seconds'
+            labels = f'view="{label(view)}"{worker}'
+            for bound, count in zip(stats.buckets, stats.bucket_counts):
+                lines.append(
+                    f'{name}_bucket{{{labels},le="{bound}"}} {count}'
+                )
+            lines += [
+                f'{name}_bucket{{{labels},le="+Inf"}} {stats.requests}',
+                f'{name}_sum{{{labels}}} {stats.duration}',
+                f'{name}_count{{{labels}}} {stats.requests}',
+            ]
+        for suffix, attribute, description in COUNTERS:
+            name = f'{prefix}_{suffix}'
+            lines += [
+                f'# HELP {name} {description}',
+                f'# TYPE {name} counter',
+            ]
+            lines += [
+                f'{name}{{view="{label(view)}"{worker}}} '
+                f'{getattr(stats, attribute)}'
+                for view, stats in views
+            ]
+        lines += template_lines(prefix, renders, times, worker)
+    return '\n'.join(lines) + '\n'
+
+
+def template_lines(prefix, renders, times, worker=''):
+    name = f'{prefix}_template_render_seconds'
+    lines = [
+        f'# HELP {name} Рендеринг шаблона вместе с include и extends.',
+        f'# TYPE {name} summary',
+    ]
+    for template, count in sorted(renders.items()):
+        labels = f'template="{label(template)}"{worker}'
+        lines += [
+            f'{name}_sum{{{labels}}} {times[template]}',
+            f'{name}_count{{{labels}}} {count}',
+        ]
+    return lines
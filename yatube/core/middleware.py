@@ -0,0 +1,97 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from core import metrics, routers
+
+
+class InstrumentationMiddleware:
+    """Время, SQL, шаблоны и кэш каждого запроса по имени представления.
+
+    Стоит первым в MIDDLEWARE, чтобы total покрывал всю обработку.
+    SQL считается через execute_wrapper, поэтому работает и без DEBUG,
+    а на запрос приходится лишь несколько вызовов perf_counter().
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_metrics = metrics.start()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(request_metrics)
+                    )
+                response = self.get_response(request)
+        finally:
+            metrics.stop()
+        duration = request_metrics.elapsed()
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else '<unresolved>'
+        metrics.record(view, request_metrics, duration)
+        if settings.METRICS_SERVER_TIMING and self.show_timing(request):
+            response['Server-Timing'] = request_metrics.server_timing(
+                duration
+            )
+        return response
+
+    def show_timing(self, request):
+        """Время и число запросов к БД — не для посторонних."""
+        if settings.DEBUG:
+            return True
+        user = getattr(request, 'user', None)
+        return user is not None and user.is_staff
+
+
+class ReplicaMiddleware:
+    """Чтение с реплик для REPLICA_VIEWS и read-your-writes после записи.
+
+    Запрос, который что-то записал в БД (create_post, add_comment,
+    подписка, вход), ставит cookie: ещё REPLICA_PIN_SECONDS все чтения
+    этого клиента идут на primary, пока реплики догоняют его запись.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        routers.start_request(read_from_replica=False)
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = routers.finish_request()
+        if wrote:
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE,
+                str(int(time.time()) + settings.REPLICA_PIN_SECONDS),
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        routers.start_request(
+            read_from_replica=(
+                request.method in ('GET', 'HEAD')
+                and request.resolver_match.view_name
+                in settings.REPLICA_VIEWS
+                and not self.pinned(request)
+            )
+        )
+
+    def pinned(self, request):
+        try:
+            until = int(request.COOKIES.get(settings.REPLICA_PIN_COOKIE, 0))
+        except ValueError:
+            return False
+        return until >= time.time()
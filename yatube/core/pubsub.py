@@ -0,0 +1,198 @@
+"""Публикация и подписка на события.
+
+broker() отдаёт брокер из settings.PUBSUB_BACKEND. У брокера два
+метода: publish(channel, message) и subscribe(channels). Подписка
+копит сообщения своих каналов; get(timeout) ждёт не дольше timeout
+секунд и отдаёт накопленное списком пар (канал, сообщение).
+"""
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict, deque
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+
+@lru_cache(maxsize=None)
+def broker():
+    return import_string(settings.PUBSUB_BACKEND)()
+
+
+@receiver(setting_changed)
+def reset_broker(setting, **kwargs):
+    if setting == 'PUBSUB_BACKEND':
+        broker.cache_clear()
+
+
+class Subscription(ABC):
+    def __init__(self, broker, channels):
+        self.broker = broker
+        self.channels = frozenset(channels)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @abstractmethod
+    def get(self, timeout):
+        """Накопленные пары (канал, сообщение); ждёт до timeout секунд."""
+
+    def close(self):
+        pass
+
+
+class LocalSubscription(Subscription):
+    def __init__(self, broker, channels, max_pending):
+        super().__init__(broker, channels)
+        # медленный подписчик теряет старые сообщения, а не память
+        self.pending = deque(maxlen=max_pending)
+        self.ready = threading.Event()
+
+    def deliver(self, channel, message):
+        self.pending.append((channel, message))
+        self.ready.set()
+
+    def get(self, timeout):
+        self.ready.wait(timeout)
+        self.ready.clear()
+        messages = []
+        while self.pending:
+            messages.append(self.pending.popleft())
+        return messages
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """Подписчики в памяти процесса.
+
+    Годится для одного процесса с потоками (runserver, yatube.asgi);
+    публикации других воркеров сюда не доходят — для них CacheBroker.
+    """
+
+    def __init__(self, max_pending=100):
+        self.max_pending = max_pending
+        self.lock = threading.Lock()
+        self.subscribers = defaultdict(set)
+
+    def publish(self, channel, message):
+        with self.lock:
+            subscribers = list(self.subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(channel, message)
+
+    def subscribe(self, channels):
+        subscription = LocalSubscription(self, channels, self.max_pending)
+        with self.lock:
+            for channel in subscription.channels:
+                self.subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for channel in subscription.channels:
+                subscribers = self.subscribers.get(channel)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.subscribers[channel]
+
+
+class CacheSubscription(Subscription):
+    def __init__(self, broker, channels):
+        super().__init__(broker, channels)
+        self.last = broker.sequences(self.channels)
+        self.missing = set()
+
+    def poll(self):
+        """Новые сообщения по номерам со времени прошлого опроса.
+
+        Номер уже выдан, а сообщение ещё не записано: его заберёт
+        следующий опрос; не нашлось и тогда — истекло, пропускаем.
+        """
+        current = self.broker.sequences(self.channels)
+        found = self.broker.messages(
+            (channel, number)
+            for channel, last in self.last.items()
+            for number in range(last + 1, current[channel] + 1)
+        )
+        messages = []
+        for channel, last in sorted(self.last.items()):
+            for number in range(last + 1, current[channel] + 1):
+                if (channel, number) in found:
+                    messages.append((channel, found[channel, number]))
+                elif (channel, number) not in self.missing:
+                    self.missing.add((channel, number))
+                    current[channel] = number - 1
+                    break
+        self.missing = {
+            (channel, number) for channel, number in self.missing
+            if number > current[channel]
+        }
+        self.last = current
+        return messages
+
+    def get(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            messages = self.poll()
+            remaining = deadline - time.monotonic()
+            if messages or remaining <= 0:
+                return messages
+            time.sleep(min(self.broker.poll_interval, remaining))
+
+
+class CacheBroker:
+    """Каналы в общем кэше: публикации видны всем воркерам.
+
+    Нужен кэш, общий для процессов (core.cache.SQLiteCache, file).
+    Канал — счётчик сообщений и сами сообщения под их номерами;
+    подписка опрашивает счётчики раз в poll_interval секунд.
+    """
+
+    SEQUENCE_KEY = 'pubsub:{channel}:seq'
+    MESSAGE_KEY = 'pubsub:{channel}:{number}'
+
+    def __init__(self, poll_interval=0.5, ttl=60):
+        self.poll_interval = poll_interval
+        self.ttl = ttl
+
+    def publish(self, channel, message):
+        key = self.SEQUENCE_KEY.format(channel=channel)
+        cache.add(key, 0, None)
+        number = cache.incr(key)
+        cache.set(
+            self.MESSAGE_KEY.format(channel=channel, number=number),
+            message,
+            self.ttl,
+        )
+
+    def subscribe(self, channels):
+        return CacheSubscription(self, channels)
+
+    def sequences(self, channels) -> dict:
+        keys = {
+            self.SEQUENCE_KEY.format(channel=channel): channel
+            for channel in channels
+        }
+        found = cache.get_many(keys)
+        return {channel: found.get(key, 0) for key, channel in keys.items()}
+
+    def messages(self, wanted) -> dict:
+        keys = {
+            self.MESSAGE_KEY.format(channel=channel, number=number): (
+                channel, number
+            )
+            for channel, number in wanted
+        }
+        found = cache.get_many(keys)
+        return {keys[key]: message for key, message in found.items()}
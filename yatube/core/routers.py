@@ -0,0 +1,45 @@
+import random
+import threading
+
+from django.conf import settings
+
+_state = threading.local()
+
+
+def start_request(read_from_replica):
+    """Выбрать базу для чтения на весь запрос: реплика одна и та же."""
+    _state.replica = None
+    if read_from_replica and settings.DATABASE_REPLICAS:
+        _state.replica = random.choice(settings.DATABASE_REPLICAS)
+    _state.wrote = False
+
+
+def finish_request():
+    """Вернуть чтение на primary; True, если запрос что-то записал."""
+    wrote = getattr(_state, 'wrote', False)
+    _state.replica = None
+    _state.wrote = False
+    return wrote
+
+
+class ReplicaRouter:
+    """Чтение в представлениях из REPLICA_VIEWS — с реплики, остальное
+    и все записи — с primary ('default').
+
+    Какие запросы читают с реплики, решает ReplicaMiddleware; вне
+    запроса (команды, тесты, фоновые потоки) всё идёт на primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        return getattr(_state, 'replica', None) or 'default'
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # на репликах те же данные, что и на primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
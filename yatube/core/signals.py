@@ -0,0 +1,20 @@
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def apply_pragmas(sender, connection, **kwargs):
+    """PRAGMA из DATABASES[alias]['PRAGMAS'] для каждого соединения SQLite.
+
+    journal_mode=WAL хранится в самом файле БД, а synchronous,
+    mmap_size, cache_size и прочие действуют только на соединение,
+    поэтому их ставят заново при каждом подключении.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = connection.settings_dict.get('PRAGMAS') or {}
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
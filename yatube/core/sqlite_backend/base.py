@@ -0,0 +1,28 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """SQLite с выбором режима транзакций (OPTIONS['transaction_mode']).
+
+    Обычный BEGIN берёт блокировку записи только на первой записи, и
+    если к этому моменту пишет другое соединение, SQLite сразу отвечает
+    "database is locked", не дожидаясь busy timeout. BEGIN IMMEDIATE
+    берёт блокировку в начале atomic(), поэтому конкурирующие писатели
+    ждут своей очереди.
+    """
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        mode = kwargs.pop('transaction_mode', 'DEFERRED').upper()
+        if mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f'transaction_mode должен быть одним из {TRANSACTION_MODES}'
+            )
+        self.transaction_mode = mode
+        return kwargs
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {self.transaction_mode}')
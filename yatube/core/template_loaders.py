@@ -0,0 +1,35 @@
+import time
+
+from django.template import Template
+from django.template.loaders import cached
+
+from core import metrics
+
+
+class TimedTemplate(Template):
+    """Шаблон, который пишет в core.metrics время каждого рендеринга.
+
+    Перехвачен _render, а не render: через него рендерятся и include,
+    и родители {% extends %}, поэтому время видно по каждому файлу.
+    """
+
+    def _render(self, context):
+        started = time.perf_counter()
+        try:
+            return super()._render(context)
+        finally:
+            metrics.template_timed(self.name, time.perf_counter() - started)
+
+
+class Loader(cached.Loader):
+    """cached.Loader, отдающий TimedTemplate.
+
+    Шаблон компилируется один раз на процесс и на ключ кэша, так что
+    класс скомпилированного объекта подменяется тоже один раз.
+    """
+
+    def get_template(self, template_name, skip=None):
+        template = super().get_template(template_name, skip)
+        if type(template) is Template:
+            template.__class__ = TimedTemplate
+        return template
@@ -1,7 +1,32 @@
+import asyncio
+import io
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import Executor, Future
 from http import HTTPStatus
 
-from django.test import TestCase, Client
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import (
+    Client, RequestFactory, SimpleTestCase, TestCase, override_settings,
+)
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection
+from django.db.utils import ConnectionHandler
+from django.urls import ResolverMatch, reverse
+
+from core import metrics, pubsub
+from core.asgi import ASGIHandler, ENVIRON_KEY, environ_from_scope
+from core.cache import SQLiteCache
+from core.middleware import ReplicaMiddleware
+from core.routers import ReplicaRouter
 
 User = get_user_model()
 
@@ -17,3 +42,470 @@ class ViewTestClass(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+def write_from_child(location, key, value):
+    SQLiteCache(location, {}).set(key, value)
+
+
+class SQLiteCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.location = os.path.join(directory, 'cache.sqlite3')
+        self.cache = SQLiteCache(self.location, {})
+
+    def test_write_visible_across_processes(self):
+        """Запись одного процесса видна другому."""
+        self.cache.set('shared', 'from parent')
+        child = multiprocessing.get_context('fork').Process(
+            target=write_from_child,
+            args=(self.location, 'shared', 'from child'),
+        )
+        child.start()
+        child.join(30)
+        self.assertEqual(child.exitcode, 0)
+        self.assertEqual(self.cache.get('shared'), 'from child')
+
+    def test_incr_add_and_expiry(self):
+        self.assertTrue(self.cache.add('counter', 1))
+        self.assertFalse(self.cache.add('counter', 5))
+        self.assertEqual(self.cache.incr('counter'), 2)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.cache.set('expired', 'value', -1)
+        self.assertIsNone(self.cache.get('expired'))
+
+    def test_least_recently_used_evicted(self):
+        """При переполнении вытесняются давно не читанные ключи."""
+        cache = SQLiteCache(self.location, {'OPTIONS': {
+            'MAX_ENTRIES': 3, 'CULL_FREQUENCY': 3, 'ACCESS_RESOLUTION': 0,
+        }})
+        for key in ('a', 'b', 'c'):
+            cache.set(key, key)
+        cache.get('a')
+        cache.set('d', 'd')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'a')
+        self.assertEqual(cache.get('d'), 'd')
+
+    def test_reads_do_not_wait_for_write_lock(self):
+        """Попадание читается, пока другой процесс держит запись."""
+        cache = SQLiteCache(self.location, {'OPTIONS': {
+            'BUSY_TIMEOUT': 1, 'ACCESS_RESOLUTION': 0,
+        }})
+        cache.set('key', 'value')
+        writer = sqlite3.connect(self.location, isolation_level=None)
+        self.addCleanup(writer.close)
+        writer.execute('BEGIN IMMEDIATE')
+        try:
+            started = time.monotonic()
+            self.assertEqual(cache.get('key'), 'value')
+            self.assertLess(time.monotonic() - started, 0.5)
+        finally:
+            writer.execute('ROLLBACK')
+
+    def test_size_limit(self):
+        cache = SQLiteCache(self.location, {'OPTIONS': {'MAX_SIZE': 3000}})
+        for key in ('a', 'b', 'c'):
+            cache.set(key, 'x' * 1000)
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('c'))
+
+    def test_usage_kept_by_triggers(self):
+        """Число записей и объём не пересчитываются по таблице."""
+        self.cache.set('a', 'x' * 100)
+        self.cache.set('a', 'x' * 10)
+        self.cache.set('b', 1)
+        self.cache.incr('b', 1000)
+        self.cache.add('c', 1)
+        self.cache.delete('c')
+        self.assertEqual(
+            tuple(self.cache._usage()),
+            self.cache._db.execute(
+                'SELECT COUNT(*), SUM(size) FROM cache'
+            ).fetchone(),
+        )
+
+    def test_add_of_live_key_writes_nothing(self):
+        self.cache.set('key', 'value')
+        changes = self.cache._db.total_changes
+        self.assertFalse(self.cache.add('key', 'other'))
+        self.assertEqual(self.cache._db.total_changes, changes)
+        self.assertEqual(self.cache.get('key'), 'value')
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+
+    def test_server_timing_header(self):
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('posts:index'))
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'^total;dur=[\d.]+, db;dur=[\d.]+;')
+        self.assertIn('tpl;dur=', timing)
+        self.assertIn('cache;desc="0 hit, 1 miss"', timing)
+
+    def test_duplicate_queries_counted(self):
+        request_metrics = metrics.start()
+        try:
+            with connection.execute_wrapper(request_metrics):
+                for _ in range(3):
+                    list(User.objects.filter(username='same'))
+                list(User.objects.filter(username='other'))
+        finally:
+            metrics.stop()
+        self.assertEqual(request_metrics.queries, 4)
+        self.assertEqual(request_metrics.duplicates, 2)
+
+    def test_server_timing_hidden_from_visitors(self):
+        response = self.client.get(reverse('posts:index'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def metrics_dir(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        return directory
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_prometheus_endpoint(self):
+        self.client.get(reverse('posts:index'))
+        with self.settings(METRICS_DIR=self.metrics_dir()):
+            self.client.get(reverse('posts:index'))
+            response = self.client.get(
+                reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret'
+            )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        body = response.content.decode()
+        self.assertIn('yatube_request_duration_seconds_count'
+                      '{view="posts:index"} 2', body)
+        self.assertIn('yatube_cache_hits_total{view="posts:index"} 1', body)
+        self.assertIn('yatube_request_duration_seconds_bucket'
+                      '{view="posts:index",le="+Inf"} 2', body)
+        self.assertIn('yatube_db_queries_total{view="posts:index"}', body)
+
+    def test_template_render_timed_per_template(self):
+        self.client.get(reverse('posts:index'))
+        body = metrics.prometheus()
+        for template in ('posts/index.html', 'base.html',
+                         'posts/includes/paginator.html'):
+            with self.subTest(template=template):
+                self.assertIn(
+                    'yatube_template_render_seconds_count'
+                    f'{{template="{template}",worker="{os.getpid()}"}} 1',
+                    body,
+                )
+
+    def test_workers_summed_through_metrics_dir(self):
+        """С METRICS_DIR /metrics/ складывает итоги всех воркеров."""
+        directory = self.metrics_dir()
+        with self.settings(METRICS_DIR=directory):
+            self.client.get(reverse('posts:index'))
+            # итоги другого воркера — тот же файл под другим именем
+            with metrics._lock:
+                metrics.flush()
+            shutil.copy(
+                metrics.worker_file(), os.path.join(directory, 'other.pickle')
+            )
+            self.client.get(reverse('posts:index'))
+            body = metrics.prometheus()
+        self.assertIn('yatube_request_duration_seconds_count'
+                      '{view="posts:index"} 3', body)
+        self.assertIn('yatube_template_render_seconds_count'
+                      '{template="base.html"} 3', body)
+        self.assertNotIn('worker=', body)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_forbidden_without_token(self):
+        """Локальный адрес прокси сам по себе доступа не даёт."""
+        for headers in ({}, {'HTTP_AUTHORIZATION': 'Bearer wrong'}):
+            with self.subTest(headers=headers):
+                response = self.client.get(
+                    reverse('metrics'), REMOTE_ADDR='127.0.0.1', **headers
+                )
+                self.assertEqual(
+                    response.status_code, HTTPStatus.FORBIDDEN
+                )
+
+
+class ProductionDatabaseProfileTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'db.sqlite3')
+        handler = ConnectionHandler({
+            'default': {
+                **settings.DATABASE_PROFILES['production'],
+                'NAME': self.path,
+            }
+        })
+        self.connection = handler['default']
+
+    def tearDown(self):
+        self.connection.close()
+        shutil.rmtree(self.directory)
+
+    def test_pragmas_applied_on_connect(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA temp_store')
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+    def test_atomic_takes_write_lock_immediately(self):
+        self.connection.ensure_connection()
+        self.connection._start_transaction_under_autocommit()
+        other = sqlite3.connect(self.path, timeout=0)
+        try:
+            with self.assertRaisesMessage(
+                sqlite3.OperationalError, 'database is locked'
+            ):
+                other.execute('BEGIN IMMEDIATE')
+        finally:
+            other.close()
+            self.connection.cursor().execute('ROLLBACK')
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = ReplicaRouter()
+
+    def handle(self, request, view_name, write=False):
+        """Прогнать запрос через ReplicaMiddleware; вернуть базу чтения."""
+        routed = {}
+
+        def view(request):
+            routed['read'] = self.router.db_for_read(User)
+            if write:
+                self.router.db_for_write(User)
+            return HttpResponse()
+
+        def get_response(request):
+            # так middleware вызывает Django после разрешения URL
+            middleware.process_view(request, view, (), {})
+            return view(request)
+
+        middleware = ReplicaMiddleware(get_response)
+        request.resolver_match = ResolverMatch(view, (), {})
+        request.resolver_match.view_name = view_name
+        response = middleware(request)
+        return routed['read'], response
+
+    def test_read_only_views_use_replica(self):
+        read, response = self.handle(self.factory.get('/'), 'posts:index')
+        self.assertEqual(read, 'replica1')
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+        self.assertEqual(self.router.db_for_read(User), 'default')
+
+    def test_other_views_and_writes_use_primary(self):
+        read, _ = self.handle(
+            self.factory.get('/create/'), 'posts:create_post'
+        )
+        self.assertEqual(read, 'default')
+        read, _ = self.handle(self.factory.post('/'), 'posts:index')
+        self.assertEqual(read, 'default')
+        self.assertEqual(self.router.db_for_write(User), 'default')
+
+    def test_reads_pinned_to_primary_after_write(self):
+        _, response = self.handle(
+            self.factory.post('/posts/1/comment/'), 'posts:add_comment',
+            write=True,
+        )
+        cookie = response.cookies[settings.REPLICA_PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_PIN_SECONDS)
+        request = self.factory.get('/')
+        request.COOKIES[settings.REPLICA_PIN_COOKIE] = cookie.value
+        read, _ = self.handle(request, 'posts:post_detail')
+        self.assertEqual(read, 'default')
+        request.COOKIES[settings.REPLICA_PIN_COOKIE] = str(
+            int(time.time()) - 1
+        )
+        read, _ = self.handle(request, 'posts:post_detail')
+        self.assertEqual(read, 'replica1')
+
+
+class InlineExecutor(Executor):
+    """Задачи в текущем потоке: данные TestCase видны только ему."""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+class StreamingApplication:
+    """WSGI-приложение с бесконечным потоковым ответом."""
+
+    streaming = True
+
+    def __init__(self):
+        self.threads = set()
+        self.closed_in = None
+
+    def __call__(self, environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/event-stream')])
+        return self
+
+    def __iter__(self):
+        while True:
+            self.threads.add(threading.current_thread().name)
+            time.sleep(0.01)
+            yield b'ping'
+
+    def close(self):
+        self.closed_in = threading.current_thread().name
+
+
+class ASGIHandlerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.application = ASGIHandler(
+            WSGIHandler(), executor=InlineExecutor()
+        )
+
+    def call(self, scope, messages):
+        sent = []
+        incoming = iter(messages)
+
+        async def receive():
+            return next(incoming)
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(self.application(scope, receive, send))
+        return sent
+
+    def test_get_request(self):
+        sent = self.call(
+            {
+                'type': 'http',
+                'method': 'GET',
+                'path': reverse('posts:index'),
+                'query_string': b'page=1',
+                'headers': [(b'host', b'localhost')],
+            },
+            [{'type': 'http.request', 'body': b''}],
+        )
+        start, body = sent
+        self.assertEqual(start['status'], HTTPStatus.OK)
+        self.assertIn(
+            (b'content-type', b'text/html; charset=utf-8'), start['headers']
+        )
+        self.assertIn('Последние обновления', body['body'].decode())
+
+    def test_stream_stops_on_disconnect(self):
+        """Поток идёт в своём потоке и закрывается там же, когда клиент
+        уходит."""
+        wsgi = StreamingApplication()
+        application = ASGIHandler(wsgi, executor=InlineExecutor())
+        sent = []
+
+        async def receive():
+            if not sent:
+                return {'type': 'http.request', 'body': b''}
+            await asyncio.sleep(0.05)
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(asyncio.wait_for(application(
+            {'type': 'http', 'method': 'GET', 'path': '/'}, receive, send
+        ), timeout=5))
+        self.assertEqual(sent[0]['status'], HTTPStatus.OK)
+        self.assertEqual(sent[1]['body'], b'ping')
+        self.assertTrue(all(message.get('more_body') for message in sent[1:]))
+        self.assertEqual(len(wsgi.threads), 1)
+        self.assertEqual(wsgi.closed_in, wsgi.threads.pop())
+        self.assertTrue(wsgi.closed_in.startswith('asgi-stream'))
+
+    def test_disconnect_before_body(self):
+        sent = self.call(
+            {'type': 'http', 'method': 'POST', 'path': '/'},
+            [{'type': 'http.disconnect'}],
+        )
+        self.assertEqual(sent, [])
+
+    def test_lifespan(self):
+        sent = self.call(
+            {'type': 'lifespan'},
+            [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}],
+        )
+        self.assertEqual(
+            [message['type'] for message in sent],
+            ['lifespan.startup.complete', 'lifespan.shutdown.complete'],
+        )
+
+    def test_environ_from_scope(self):
+        environ = environ_from_scope(
+            {
+                'method': 'POST',
+                'path': '/profile/имя/',
+                'headers': [
+                    (b'content-type', b'application/x-www-form-urlencoded'),
+                    (b'content-length', b'999'),
+                    (b'cookie', b'a=1'),
+                    (b'cookie', b'b=2'),
+                ],
+            },
+            io.BytesIO(b'text=1'),
+        )
+        self.assertEqual(
+            environ['PATH_INFO'].encode('latin-1').decode(), '/profile/имя/'
+        )
+        self.assertEqual(environ['CONTENT_LENGTH'], '6')
+        self.assertEqual(
+            environ['CONTENT_TYPE'], 'application/x-www-form-urlencoded'
+        )
+        self.assertEqual(environ['HTTP_COOKIE'], 'a=1; b=2')
+        self.assertEqual(environ['wsgi.input'].read(), b'text=1')
+        self.assertTrue(environ[ENVIRON_KEY])
+
+
+class PubSubTests(SimpleTestCase):
+    def check_broker(self, broker):
+        with broker.subscribe(['a', 'b']) as subscription:
+            broker.publish('a', 1)
+            broker.publish('c', 2)
+            broker.publish('b', 3)
+            self.assertEqual(
+                sorted(subscription.get(timeout=1)), [('a', 1), ('b', 3)]
+            )
+            self.assertEqual(subscription.get(timeout=0.01), [])
+
+    def test_local_broker(self):
+        broker = pubsub.LocalBroker(max_pending=2)
+        self.check_broker(broker)
+        with broker.subscribe(['a']) as subscription:
+            for number in range(3):
+                broker.publish('a', number)
+            self.assertEqual(subscription.get(timeout=0), [('a', 1), ('a', 2)])
+        self.assertEqual(dict(broker.subscribers), {})
+
+    def test_cache_broker(self):
+        cache.clear()
+        broker = pubsub.CacheBroker(poll_interval=0.01)
+        broker.publish('a', 0)
+        self.check_broker(broker)
+
+    def test_cache_broker_waits_for_unwritten_message(self):
+        cache.clear()
+        broker = pubsub.CacheBroker(poll_interval=0.01)
+        subscription = broker.subscribe(['a'])
+        cache.set(broker.SEQUENCE_KEY.format(channel='a'), 2)
+        cache.set(broker.MESSAGE_KEY.format(channel='a', number=2), 'b')
+        self.assertEqual(subscription.poll(), [])
+        cache.set(broker.MESSAGE_KEY.format(channel='a', number=1), 'a')
+        self.assertEqual(subscription.poll(), [('a', 'a'), ('a', 'b')])
+
+    @override_settings(PUBSUB_BACKEND='core.pubsub.CacheBroker')
+    def test_backend_setting(self):
+        self.assertIsInstance(pubsub.broker(), pubsub.CacheBroker)
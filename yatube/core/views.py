@@ -1,6 +1,12 @@
 from http import HTTPStatus
 
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+
+from core import metrics as request_metrics
 
 
 def permission_denied(request, exception):
@@ -15,3 +21,23 @@ def page_not_found(request, exception):
 def server_error(request):
     return render(request, 'core/500.html',
                   status=HTTPStatus.INTERNAL_SERVER_ERROR)
+
+
+def metrics_allowed(request) -> bool:
+    token = settings.METRICS_TOKEN
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    if token and constant_time_compare(authorization, f'Bearer {token}'):
+        return True
+    if request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS:
+        return True
+    return request.user.is_staff
+
+
+def metrics(request):
+    """Метрики процесса для Prometheus: по METRICS_TOKEN или staff."""
+    if not metrics_allowed(request):
+        raise PermissionDenied
+    return HttpResponse(
+        request_metrics.prometheus(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
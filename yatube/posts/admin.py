@@ -1,6 +1,8 @@
 from django.contrib import admin
 
+from . import search
 from .models import Post, Group
+from .paginators import ApproximateCountPaginator
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -15,6 +17,15 @@ class PostAdmin(admin.ModelAdmin):
     search_fields = ('text',)
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
+    # список и «всего N» без COUNT(*) по всей таблице
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по индексу FTS5 вместо LIKE '%...%' по всей таблице."""
+        if not search_term:
+            return queryset, False
+        return search.matching(queryset, search_term), False
 
 
 admin.site.register(Post, PostAdmin)
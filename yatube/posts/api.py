@@ -0,0 +1,372 @@
+"""JSON API лент и пакетной подписки.
+
+Ленты отдаются теми же queryset-ами и курсорами, что и HTML. ETag
+собирается из версий областей page_cache и самого свежего pub_date,
+поэтому на условный GET с совпавшим ETag ответ 304 уходит после
+одного агрегирующего запроса, без выборки и сериализации постов.
+"""
+import hashlib
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import (
+    condition, require_POST, require_safe,
+)
+
+from core import pubsub
+from core.asgi import served_by_asgi
+from posts import follow_graph, follows, live, page_cache
+from posts.feeds import FEED_ORDERING, comment_queryset, feed_queryset
+from posts.models import Group, Post, User
+from posts.paginators import CommentPaginator, CursorPaginator
+from posts.timeline import TIMELINE_ORDERING, timeline_posts
+
+
+def api_login_required(view):
+    """Как login_required, но вместо редиректа на форму входа — 401."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse(
+                {'detail': 'Требуется авторизация.'}, status=401
+            )
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def index_feed(request):
+    return Post.objects.all(), ['index']
+
+
+def group_feed(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return group.posts.all(), [f'group:{group.pk}']
+
+
+def profile_feed(request, username):
+    author = get_object_or_404(User, username=username)
+    return author.posts.all(), [f'author:{author.pk}']
+
+
+def post_feed(request, post_id):
+    return Post.objects.filter(pk=post_id), [f'post:{post_id}']
+
+
+def follow_feed(request):
+    # Новый пост любого автора поднимает версию index, а подписка
+    # и отписка — версию follow:<id> читателя.
+    user = request.user
+    return timeline_posts(user), ['index', f'follow:{user.pk}']
+
+
+FEEDS = {
+    'index': index_feed,
+    'group_posts': group_feed,
+    'profile': profile_feed,
+    'post_detail': post_feed,
+    'follow_index': follow_feed,
+}
+
+
+def feed_state(request, view, **kwargs):
+    """(queryset, ETag, newest pub_date); считается один раз на запрос.
+
+    condition() вызывает функции ETag и Last-Modified по отдельности,
+    а затем само представление — все три берут состояние отсюда.
+    """
+    state = getattr(request, '_api_feed_state', None)
+    if state is None:
+        posts, scopes = FEEDS[view](request, **kwargs)
+        newest = posts.aggregate(newest=Max('pub_date'))['newest']
+        parts = [view, request.GET.urlencode()]
+        parts += [
+            f'{scope}:{page_cache.scope_version(scope)}' for scope in scopes
+        ]
+        parts.append(newest.isoformat() if newest else '')
+        etag = hashlib.sha1('|'.join(parts).encode()).hexdigest()
+        state = request._api_feed_state = (posts, etag, newest)
+    return state
+
+
+def conditional(view_name):
+    """Условный GET для представления API: ETag и Last-Modified."""
+    return condition(
+        etag_func=lambda request, **kwargs: (
+            feed_state(request, view_name, **kwargs)[1]
+        ),
+        last_modified_func=lambda request, **kwargs: (
+            feed_state(request, view_name, **kwargs)[2]
+        ),
+    )
+
+
+def serialize_post(post) -> dict:
+    group = None
+    if post.group_id is not None:
+        group = {'slug': post.group.slug, 'title': post.group.title}
+    return {
+        'id': post.pk,
+        'text': post.text,
+        'pub_date': post.pub_date.isoformat(),
+        'author': {
+            'username': post.author.username,
+            'full_name': post.author.get_full_name(),
+        },
+        'group': group,
+        'image': post.image.url if post.image else None,
+        'thumbnail': post.thumbnail_url or None,
+        'sources': post.sources,
+        'comment_count': post.comment_count,
+    }
+
+
+def feed_response(request, posts, ordering=FEED_ORDERING):
+    paginator = CursorPaginator(
+        feed_queryset(posts, ordering), settings.POST_COUNT, ordering
+    )
+    page_obj = paginator.get_page(
+        after=request.GET.get('after'), before=request.GET.get('before')
+    )
+    return JsonResponse(
+        {
+            'results': [serialize_post(post) for post in page_obj],
+            'next': page_obj.next_cursor,
+            'previous': page_obj.previous_cursor,
+        },
+        json_dumps_params={'ensure_ascii': False},
+    )
+
+
+@require_safe
+@conditional('index')
+def index(request):
+    posts, _, _ = feed_state(request, 'index')
+    return feed_response(request, posts)
+
+
+@require_safe
+@conditional('group_posts')
+def group_posts(request, slug):
+    posts, _, _ = feed_state(request, 'group_posts', slug=slug)
+    return feed_response(request, posts)
+
+
+@require_safe
+@conditional('profile')
+def profile(request, username):
+    posts, _, _ = feed_state(request, 'profile', username=username)
+    return feed_response(request, posts)
+
+
+@require_safe
+@conditional('post_detail')
+def post_detail(request, post_id):
+    posts, _, newest = feed_state(request, 'post_detail', post_id=post_id)
+    if newest is None:
+        return JsonResponse({'detail': 'Пост не найден.'}, status=404)
+    post = feed_queryset(posts).get()
+    return JsonResponse(
+        serialize_post(post), json_dumps_params={'ensure_ascii': False}
+    )
+
+
+@require_safe
+@api_login_required
+@conditional('follow_index')
+def follow_index(request):
+    posts, _, _ = feed_state(request, 'follow_index')
+    return feed_response(request, posts, TIMELINE_ORDERING)
+
+
+def comments_etag(request, post_id):
+    # комментарии сбрасывают версию области post:<id>
+    version = page_cache.scope_version(f'post:{post_id}')
+    raw = f'comments|{post_id}|{version}|{request.GET.urlencode()}'
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def serialize_comment(comment) -> dict:
+    return {
+        'id': comment.pk,
+        'text': comment.text,
+        'created': comment.created.isoformat(),
+        'author': {
+            'username': comment.author.username,
+            'full_name': comment.author.get_full_name(),
+        },
+    }
+
+
+@require_safe
+@condition(etag_func=comments_etag)
+def post_comments(request, post_id):
+    """Следующая порция комментариев для «показать ещё»: ?after=курсор."""
+    page_obj = CommentPaginator(
+        comment_queryset(post_id), settings.COMMENTS_PER_PAGE
+    ).get_page(after=request.GET.get('after'))
+    return JsonResponse(
+        {
+            'results': [serialize_comment(comment) for comment in page_obj],
+            'next': page_obj.next_cursor,
+        },
+        json_dumps_params={'ensure_ascii': False},
+    )
+
+
+@require_safe
+@api_login_required
+def follow_suggestions(request):
+    """«Возможно, вы знакомы»: на кого подписаны ваши авторы."""
+    ranked = follow_graph.suggestions(request.user.pk)
+    users = User.objects.only('username', 'first_name', 'last_name')
+    users = users.in_bulk([author_id for author_id, _ in ranked])
+    return JsonResponse(
+        {
+            'results': [
+                {
+                    'username': users[author_id].username,
+                    'name': users[author_id].get_full_name(),
+                    'followed_by': mutual,
+                }
+                for author_id, mutual in ranked if author_id in users
+            ],
+        },
+        json_dumps_params={'ensure_ascii': False},
+    )
+
+
+def usernames_of(data, field) -> list:
+    usernames = data.get(field, [])
+    if not isinstance(usernames, list) or not all(
+        isinstance(username, str) for username in usernames
+    ):
+        raise ValueError(f'{field} должен быть списком имён пользователей.')
+    return usernames
+
+
+@require_POST
+@api_login_required
+@transaction.atomic
+def follow_batch(request):
+    """Подписка и отписка пачкой: {"follow": [...], "unfollow": [...]}.
+
+    Вместо запроса на каждого автора и редиректа на ленту — один
+    bulk_create, один DELETE и короткий JSON с итогом.
+    """
+    try:
+        data = json.loads(request.body.decode())
+        if not isinstance(data, dict):
+            raise ValueError('Ожидается JSON-объект.')
+        follow = usernames_of(data, 'follow')
+        unfollow = usernames_of(data, 'unfollow')
+    except ValueError as error:
+        return JsonResponse({'detail': str(error)}, status=400)
+    if len(follow) + len(unfollow) > settings.FOLLOW_BATCH_LIMIT:
+        return JsonResponse(
+            {'detail': f'Не больше {settings.FOLLOW_BATCH_LIMIT} авторов '
+                       f'за запрос.'},
+            status=400,
+        )
+    if set(follow) & set(unfollow):
+        return JsonResponse(
+            {'detail': 'Автор и в follow, и в unfollow.'}, status=400
+        )
+    ids = dict(
+        User.objects.filter(username__in=follow + unfollow)
+        .values_list('username', 'pk')
+    )
+    usernames = {pk: username for username, pk in ids.items()}
+    user_id = request.user.pk
+    followed = follows.follow_many(
+        user_id, [ids[name] for name in follow if name in ids]
+    )
+    unfollowed = follows.unfollow_many(
+        user_id, [ids[name] for name in unfollow if name in ids]
+    )
+    return JsonResponse(
+        {
+            'followed': [usernames[pk] for pk in followed],
+            'unfollowed': [usernames[pk] for pk in unfollowed],
+            'unknown': sorted(set(follow + unfollow) - set(ids)),
+            'following_count': len(follow_graph.following_ids(user_id)),
+        },
+        json_dumps_params={'ensure_ascii': False},
+    )
+
+
+def last_seen_post(value):
+    """id поста, который клиент уже видел; None, если это не число."""
+    try:
+        return max(int(value or 0), 0)
+    except ValueError:
+        return None
+
+
+@require_safe
+@api_login_required
+def follow_updates(request):
+    """Новые посты подписок после ?after=<id поста>.
+
+    Под WSGI ответ уходит сразу: ожидание держало бы воркер, поэтому
+    клиент сам повторяет запрос через poll секунд. Под core.asgi,
+    если новых постов нет, запрос ждёт публикации не дольше
+    FOLLOW_POLL_TIMEOUT секунд. Без after отдаётся только last —
+    id последнего поста подписок, с которого начинать опрос.
+    """
+    after = last_seen_post(request.GET.get('after'))
+    if after is None:
+        return JsonResponse(
+            {'detail': 'after должен быть id поста.'}, status=400
+        )
+    if not after:
+        posts = []
+        after = live.latest_post_id(request.user)
+    elif not served_by_asgi(request):
+        posts = live.missed_posts(request.user, after)
+    else:
+        channels = live.followed_channels(request.user)
+        with pubsub.broker().subscribe(channels) as subscription:
+            posts = live.missed_posts(request.user, after)
+            if not posts:
+                posts = live.wait_for_posts(
+                    subscription, settings.FOLLOW_POLL_TIMEOUT
+                )
+    return JsonResponse({
+        'posts': posts,
+        'last': max((post['id'] for post in posts), default=after),
+        'poll': 0 if served_by_asgi(request)
+        else settings.FOLLOW_POLL_INTERVAL,
+    })
+
+
+@require_safe
+@api_login_required
+def follow_stream(request):
+    """Server-sent events с новыми постами подписок.
+
+    После обрыва EventSource присылает Last-Event-ID, и поток
+    начинается с постов, опубликованных за время переподключения.
+    Выключен, пока не задан FOLLOW_STREAM_ENABLED.
+    """
+    if not settings.FOLLOW_STREAM_ENABLED:
+        return JsonResponse(
+            {'detail': 'Поток отключён, используйте long-poll.'}, status=404
+        )
+    after = last_seen_post(request.META.get('HTTP_LAST_EVENT_ID')) or 0
+    subscription = pubsub.broker().subscribe(
+        live.followed_channels(request.user)
+    )
+    missed = live.missed_posts(request.user, after) if after else []
+    response = StreamingHttpResponse(
+        live.event_stream(subscription, missed),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # nginx не должен копить поток в буфере
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,537 @@
+"""Нагрузочный прогон представлений posts на синтетических данных.
+
+seed() наполняет базу: пользователи, подписки со степенным
+распределением популярности авторов, посты, комментарии и картинки.
+run() гоняет представления через тестовый клиент и собирает
+задержки, число SQL-запросов и пик выделенной памяти на запрос.
+"""
+import asyncio
+import io
+import json
+import platform
+import random
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from itertools import accumulate
+from urllib.parse import urlencode
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import OperationalError, connection, connections
+from django.template import loader
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from faker import Faker
+from PIL import Image
+
+from core import metrics
+from core.asgi import ASGIHandler, environ_from_scope
+from posts import bulk, thumbnails
+from posts.counters import rebuild_counters, stale_counters
+from posts.models import Group, Post
+from posts.paginators import WindowedPaginator
+
+User = get_user_model()
+
+VIEWS = (
+    'index',
+    'group_posts',
+    'profile',
+    'post_detail',
+    'follow_index',
+    'add_comment',
+)
+
+
+def zipf_weights(count, exponent):
+    """Накопленные веса: i-й по популярности автор ~ 1 / i ** exponent.
+
+    Накопленные, чтобы random.choices не пересчитывал их при каждом
+    вызове.
+    """
+    return list(accumulate(
+        1 / rank ** exponent for rank in range(1, count + 1)
+    ))
+
+
+def follow_rows(user_ids, weights, rng, mean_following):
+    """Подписки: число подписок читателя и выбор авторов — степенные."""
+    number = 0
+    for user_id in user_ids:
+        wanted = min(
+            int(rng.paretovariate(1.5) * mean_following / 3),
+            len(user_ids) - 1,
+        )
+        authors = set(rng.choices(user_ids, cum_weights=weights, k=wanted))
+        authors.discard(user_id)
+        for author_id in sorted(authors):
+            number += 1
+            yield {'id': number, 'user_id': user_id, 'author_id': author_id}
+
+
+def post_rows(count, user_ids, weights, group_ids, images, rng, fake):
+    now = timezone.now()
+    authors = rng.choices(user_ids, cum_weights=weights, k=count)
+    for number, author_id in enumerate(authors, 1):
+        yield {
+            'id': number,
+            'text': fake.paragraph(),
+            'pub_date': now - timedelta(minutes=count - number),
+            'author_id': author_id,
+            'group_id': rng.choice(group_ids) if rng.random() < 0.7 else '',
+            'image': rng.choice(images) if images else '',
+        }
+
+
+def comment_rows(count, posts, user_ids, rng, fake):
+    now = timezone.now()
+    for number in range(1, count + 1):
+        yield {
+            'id': number,
+            'post_id': rng.randint(1, posts),
+            'author_id': rng.choice(user_ids),
+            'text': fake.sentence(),
+            'created': now,
+        }
+
+
+def make_images(count, rng):
+    """Несколько картинок в MEDIA_ROOT, общих для многих постов."""
+    names = []
+    for number in range(count):
+        color = tuple(rng.randrange(256) for _ in range(3))
+        content = io.BytesIO()
+        Image.new('RGB', (1200, 800), color).save(content, 'JPEG')
+        content.seek(0)
+        names.append(
+            default_storage.save(f'posts/bench-{number}.jpg', content)
+        )
+    return names
+
+
+def seed(users=100, posts=1000, comments=2000, groups=10, images=5,
+         mean_following=20, exponent=1.1, batch_size=1000, random_seed=0):
+    """Наполнить пустую базу; возвращает сводку о данных."""
+    rng = random.Random(random_seed)
+    fake = Faker('ru_RU')
+    fake.seed_instance(random_seed)
+    User.objects.bulk_create(
+        User(pk=number, username=f'bench{number}', password='!')
+        for number in range(1, users + 1)
+    )
+    Group.objects.bulk_create(
+        Group(pk=number, title=fake.word(), slug=f'bench-{number}',
+              description=fake.sentence())
+        for number in range(1, groups + 1)
+    )
+    user_ids = list(range(1, users + 1))
+    weights = zipf_weights(users, exponent)
+    image_names = make_images(images, rng)
+    tables = {
+        'follows': follow_rows(user_ids, weights, rng, mean_following),
+        'posts': post_rows(posts, user_ids, weights, list(
+            range(1, groups + 1)), image_names, rng, fake),
+        'comments': comment_rows(comments, posts, user_ids, rng, fake),
+    }
+    summary = {'users': users, 'groups': groups, 'images': images}
+    for table, rows in tables.items():
+        summary[table] = sum(bulk.import_batches(table, rows, batch_size))
+    if image_names:
+        thumbnails.store_derivatives(thumbnails.render_derivatives(
+            image_names
+        ))
+    rebuild_counters(stale_counters())
+    return summary
+
+
+def percentile(values, percent):
+    """Процентиль методом ближайшего ранга; пусто — 0."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(int(round(percent / 100 * len(ordered))) - 1, 0)
+    return ordered[index]
+
+
+class Scenario:
+    """Случайные, но воспроизводимые запросы к представлениям."""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.user_ids = list(
+            User.objects.order_by('pk').values_list('pk', flat=True)
+        )
+        self.weights = zipf_weights(len(self.user_ids), 1.1)
+        self.slugs = list(Group.objects.values_list('slug', flat=True))
+        self.last_post = Post.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        ).first()
+
+    def page(self):
+        return {'page': self.rng.choice((1, 1, 1, 2, 3))}
+
+    def request(self, view):
+        """(метод, url, данные) для очередного запроса к view."""
+        rng = self.rng
+        name = f'posts:{view}'
+        if view == 'group_posts':
+            url = reverse(name, kwargs={'slug': rng.choice(self.slugs)})
+        elif view == 'profile':
+            author = rng.choices(self.user_ids, cum_weights=self.weights)[0]
+            url = reverse(name, kwargs={'username': f'bench{author}'})
+        elif view in ('post_detail', 'add_comment'):
+            post_id = rng.randint(1, self.last_post)
+            url = reverse(name, kwargs={'post_id': post_id})
+            if view == 'add_comment':
+                return 'post', url, {'text': 'Комментарий из бенчмарка'}
+            return 'get', url, {}
+        else:
+            url = reverse(name)
+        return 'get', url, self.page()
+
+
+def measure(client, method, url, data, trace_memory):
+    if trace_memory:
+        tracemalloc.start()
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        getattr(client, method)(url, data)
+        elapsed = time.perf_counter() - started
+    peak = 0
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return elapsed, len(queries), peak
+
+
+def run(views=VIEWS, requests=200, warmup=10, memory_samples=20,
+        cold_cache=False, random_seed=0):
+    """Прогнать представления; результаты по каждому view."""
+    rng = random.Random(random_seed)
+    scenario = Scenario(rng)
+    client = Client()
+    results = {}
+    for view in views:
+        reader = rng.choices(
+            scenario.user_ids, cum_weights=scenario.weights
+        )[0]
+        client.force_login(User.objects.get(pk=reader))
+        timings, queries, peaks = [], [], []
+        for number in range(warmup + requests + memory_samples):
+            if cold_cache:
+                cache.clear()
+            method, url, data = scenario.request(view)
+            trace_memory = number >= warmup + requests
+            elapsed, count, peak = measure(
+                client, method, url, data, trace_memory
+            )
+            if trace_memory:
+                peaks.append(peak)
+            elif number >= warmup:
+                timings.append(elapsed)
+                queries.append(count)
+        results[view] = summarize(timings, queries, peaks)
+    return results
+
+
+def summarize(timings, queries, peaks):
+    return {
+        'requests': len(timings),
+        'p50_ms': round(percentile(timings, 50) * 1000, 3),
+        'p95_ms': round(percentile(timings, 95) * 1000, 3),
+        'p99_ms': round(percentile(timings, 99) * 1000, 3),
+        'mean_ms': round(sum(timings) / len(timings) * 1000, 3),
+        'queries_mean': round(sum(queries) / len(queries), 2),
+        'queries_max': max(queries),
+        'alloc_peak_kb': (
+            round(percentile(peaks, 50) / 1024, 1) if peaks else None
+        ),
+    }
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'cache': settings.CACHES['default']['BACKEND'],
+        'feed_pagination': settings.FEED_PAGINATION,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Просадки p95 относительно прошлого прогона больше threshold."""
+    regressions = []
+    for view, current in results.items():
+        before = baseline.get('results', {}).get(view)
+        if not before or not before['p95_ms']:
+            continue
+        change = current['p95_ms'] / before['p95_ms'] - 1
+        if change > threshold:
+            regressions.append((view, before['p95_ms'], current['p95_ms']))
+    return regressions
+
+
+def save(path, report):
+    with open(path, 'w', encoding='utf-8') as stream:
+        json.dump(report, stream, ensure_ascii=False, indent=2)
+
+
+def write_request(client, scenario, post_share):
+    if scenario.rng.random() < post_share:
+        url = reverse('posts:create_post')
+        return client.post(url, {'text': 'Пост из бенчмарка записи'})
+    return client.post(*scenario.request('add_comment')[1:])
+
+
+def write_worker(number, requests, post_share, barrier, report):
+    """Поток-писатель: create_post и add_comment от случайного автора."""
+    timings, errors = [], 0
+    try:
+        scenario = Scenario(random.Random(number))
+        client = Client()
+        client.force_login(
+            User.objects.get(pk=scenario.rng.choice(scenario.user_ids))
+        )
+        barrier.wait()
+        for _ in range(requests):
+            started = time.perf_counter()
+            try:
+                response = write_request(client, scenario, post_share)
+            except OperationalError:
+                errors += 1
+                continue
+            if response.status_code == 302:
+                timings.append(time.perf_counter() - started)
+            else:
+                errors += 1
+    except BaseException:
+        barrier.abort()
+        raise
+    finally:
+        connections.close_all()
+    report[number] = (timings, errors)
+
+
+def write_load(threads=8, requests=50, post_share=0.3):
+    """Параллельные запросы на запись; пропускная способность и ошибки."""
+    barrier = threading.Barrier(threads + 1)
+    report = {}
+    workers = [
+        threading.Thread(
+            target=write_worker,
+            args=(number, requests, post_share, barrier, report),
+        )
+        for number in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    timings = [t for thread_timings, _ in report.values()
+               for t in thread_timings]
+    errors = sum(thread_errors for _, thread_errors in report.values())
+    return {
+        'threads': threads,
+        'requests': threads * requests,
+        'succeeded': len(timings),
+        'errors': errors,
+        'writes_per_second': round(len(timings) / elapsed, 1),
+        'p50_ms': round(percentile(timings, 50) * 1000, 3),
+        'p95_ms': round(percentile(timings, 95) * 1000, 3),
+    }
+
+
+READ_VIEWS = ('index', 'group_posts', 'profile', 'post_detail')
+
+
+def read_scopes(count, rng):
+    """ASGI scope анонимных GET-запросов к лентам и страницам постов."""
+    scenario = Scenario(rng)
+    scopes = []
+    for _ in range(count):
+        _, url, data = scenario.request(rng.choice(READ_VIEWS))
+        scopes.append({
+            'type': 'http',
+            'method': 'GET',
+            'path': url,
+            'query_string': urlencode(data).encode(),
+            'headers': [(b'host', b'testserver')],
+            'server': ('testserver', 80),
+            'client': ('127.0.0.1', 0),
+        })
+    return scopes
+
+
+def wsgi_request(application, scope, client_delay):
+    """Запрос в потоке WSGI-сервера: поток ждёт и отдачу клиенту."""
+    status = {}
+
+    def start_response(line, headers, exc_info=None):
+        status['code'] = int(line.split(' ', 1)[0])
+
+    response = application(environ_from_scope(scope, io.BytesIO()),
+                           start_response)
+    try:
+        for _ in response:
+            time.sleep(client_delay)
+    finally:
+        response.close()
+    return status['code']
+
+
+async def asgi_request(application, scope, client_delay):
+    """Тот же запрос через ASGI: отдачу клиенту ждёт цикл событий."""
+    status = {}
+    requests = [{'type': 'http.request', 'body': b''}]
+
+    async def receive():
+        if requests:
+            return requests.pop()
+        # клиент не уходит: после тела receive() ждёт разрыва
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status['code'] = message['status']
+        else:
+            await asyncio.sleep(client_delay)
+
+    await application(scope, receive, send)
+    return status['code']
+
+
+async def drive(mode, application, executor, scopes, clients, client_delay):
+    """clients клиентов шлют запросы по очереди, каждый ждёт ответа."""
+    loop = asyncio.get_running_loop()
+    timings, errors = [], []
+
+    async def client(requests):
+        for scope in requests:
+            started = time.perf_counter()
+            if mode == 'asgi':
+                code = await asgi_request(application, scope, client_delay)
+            else:
+                code = await loop.run_in_executor(
+                    executor, wsgi_request, application, scope, client_delay
+                )
+            if code == 200:
+                timings.append(time.perf_counter() - started)
+            else:
+                errors.append(code)
+
+    await asyncio.gather(*(
+        client(scopes[number::clients]) for number in range(clients)
+    ))
+    return timings, errors
+
+
+def serve_load(mode, clients=32, requests=20, workers=8, client_delay=0.02,
+               random_seed=0):
+    """Пропускная способность чтения через WSGI или ASGI.
+
+    В обоих режимах Django работает в workers потоках. WSGI-сервер
+    держит поток, пока ответ уходит клиенту (client_delay на порцию),
+    ASGI отдаёт ответ из цикла событий и сразу освобождает поток.
+    """
+    scopes = read_scopes(clients * requests, random.Random(random_seed))
+    executor = ThreadPoolExecutor(workers)
+    application = WSGIHandler()
+    if mode == 'asgi':
+        application = ASGIHandler(application, executor=executor)
+    started = time.perf_counter()
+    try:
+        timings, errors = asyncio.run(drive(
+            mode, application, executor, scopes, clients, client_delay
+        ))
+    finally:
+        executor.shutdown(wait=True)
+    elapsed = time.perf_counter() - started
+    return {
+        'clients': clients,
+        'workers': workers,
+        'client_delay_ms': round(client_delay * 1000, 3),
+        'requests': len(scopes),
+        'errors': len(errors),
+        'requests_per_second': round(len(timings) / elapsed, 1),
+        'p50_ms': round(percentile(timings, 50) * 1000, 3),
+        'p95_ms': round(percentile(timings, 95) * 1000, 3),
+    }
+
+
+TEMPLATE_SIZES = (10, 100, 1000)
+
+
+def index_page(size):
+    """Страница ленты из size постов в памяти, без запросов к БД."""
+    author = User(pk=1, username='bench1', first_name='Имя',
+                  last_name='Фамилия')
+    group = Group(pk=1, title='Группа', slug='bench-group')
+    now = timezone.now()
+    posts = [
+        Post(
+            pk=number,
+            text=f'Текст поста {number} ' * 5,
+            author=author,
+            group=group if number % 2 else None,
+            pub_date=now - timedelta(minutes=number),
+        )
+        for number in range(1, size + 1)
+    ]
+    return WindowedPaginator(posts, size).page(1)
+
+
+def render_index(sizes=TEMPLATE_SIZES, repeat=20, warmup=3):
+    """Время рендеринга posts/index.html по размерам страницы.
+
+    Кэш фрагментов выключен (feed_cache_key=None), поэтому меряется
+    сам шаблон: циклы, include и {% url %} на каждый пост. Разбивка
+    по шаблонам берётся из core.metrics, если загрузчик их меряет.
+    """
+    request = RequestFactory().get(reverse('posts:index'))
+    request.user = AnonymousUser()
+    template = loader.get_template('posts/index.html')
+    results = {}
+    for size in sizes:
+        context = {'page_obj': index_page(size), 'feed_cache_key': None}
+        for _ in range(warmup):
+            template.render(context, request)
+        timings = []
+        render_metrics = metrics.start()
+        try:
+            for _ in range(repeat):
+                started = time.perf_counter()
+                template.render(context, request)
+                timings.append(time.perf_counter() - started)
+        finally:
+            metrics.stop()
+        results[str(size)] = {
+            'posts': size,
+            'p50_ms': round(percentile(timings, 50) * 1000, 3),
+            'p95_ms': round(percentile(timings, 95) * 1000, 3),
+            'per_post_us': round(
+                percentile(timings, 50) / size * 1_000_000, 1
+            ),
+            'templates': {
+                name: {
+                    'renders': render_metrics.template_renders[name] // repeat,
+                    'ms': round(seconds / repeat * 1000, 3),
+                }
+                for name, seconds in
+                render_metrics.template_times.most_common()
+            },
+        }
+    return results
@@ -0,0 +1,204 @@
+"""Потоковый импорт и экспорт данных постов в NDJSON и CSV.
+
+Экспорт читает таблицу итератором по batch_size строк, импорт пишет
+её bulk_create такими же пачками, поэтому память не растёт с размером
+файла. bulk_create не шлёт сигналы, так что ленты подписок
+раскладываются здесь же, а счётчики и кэш страниц пересчитываются
+после импорта.
+"""
+import csv
+import json
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from django.db import transaction
+
+from posts import search, timeline
+from posts.models import Comment, Follow, Group, Post
+
+FORMATS = ('ndjson', 'csv')
+
+# Колонки файла; внешние ключи — по id, как в фикстурах Django
+TABLES = {
+    'groups': (Group, ('id', 'title', 'slug', 'description')),
+    'posts': (
+        Post,
+        ('id', 'text', 'pub_date', 'author_id', 'group_id', 'image'),
+    ),
+    'comments': (
+        Comment, ('id', 'post_id', 'author_id', 'text', 'created')
+    ),
+    'follows': (Follow, ('id', 'user_id', 'author_id')),
+}
+
+
+def format_for(path, default='ndjson'):
+    """Формат по расширению файла: .csv или всё остальное — NDJSON."""
+    if path and path.lower().endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def export_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def export_rows(table, batch_size):
+    """Строки таблицы словарями, итератором без загрузки всей выборки."""
+    model, columns = TABLES[table]
+    rows = (
+        model.objects
+        .order_by('pk')
+        .values_list(*columns)
+        .iterator(chunk_size=batch_size)
+    )
+    for row in rows:
+        yield dict(zip(columns, map(export_value, row)))
+
+
+def write_rows(stream, rows, columns, file_format):
+    if file_format == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=columns)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            yield row
+        return
+    for row in rows:
+        stream.write(json.dumps(row, ensure_ascii=False))
+        stream.write('\n')
+        yield row
+
+
+def read_rows(stream, file_format):
+    if file_format == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def build_object(model, columns, row):
+    """Объект модели из строки файла; пустая строка CSV — это NULL."""
+    missing = [column for column in columns if column not in row]
+    if missing:
+        raise ValueError(f'нет колонок: {", ".join(missing)}')
+    values = {}
+    for column in columns:
+        field = model._meta.get_field(column)
+        value = row[column]
+        if value == '' and field.null:
+            value = None
+        values[field.attname] = field.to_python(value)
+    return model(**values)
+
+
+@contextmanager
+def keep_dates(model):
+    """Не подменять даты из файла текущим временем (auto_now_add)."""
+    fields = [
+        field for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now_add', False)
+    ]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def after_batch(table, objects):
+    """То, что при обычном сохранении делают сигналы posts.signals."""
+    if table == 'posts':
+        timeline.fan_out_posts(objects)
+        search.index_posts((post.pk, post.text) for post in objects)
+    elif table == 'follows':
+        timeline.backfill_many(
+            [(follow.user_id, follow.author_id) for follow in objects]
+        )
+
+
+def import_batches(table, rows, batch_size, ignore_conflicts=False):
+    """Записать строки пачками; отдаёт размер каждой записанной пачки."""
+    model, columns = TABLES[table]
+    batch = []
+    with keep_dates(model):
+        for row in rows:
+            batch.append(build_object(model, columns, row))
+            if len(batch) >= batch_size:
+                yield store_batch(table, batch, ignore_conflicts)
+                batch = []
+        if batch:
+            yield store_batch(table, batch, ignore_conflicts)
+
+
+def new_objects(table, objects):
+    """Объекты пачки, которые bulk_create(ignore_conflicts) запишет.
+
+    Строки с занятым id (а у подписок — и с занятой парой user/author)
+    он молча пропускает, как и повторы внутри пачки: ленты и поиск
+    должны видеть только то, что действительно попало в БД.
+    """
+    model, _ = TABLES[table]
+    seen = set(model.objects.filter(
+        pk__in=[obj.pk for obj in objects if obj.pk is not None]
+    ).values_list('pk', flat=True))
+    pairs = set()
+    if table == 'follows':
+        pairs = set(Follow.objects.filter(
+            user_id__in={follow.user_id for follow in objects},
+            author_id__in={follow.author_id for follow in objects},
+        ).values_list('user_id', 'author_id'))
+    stored = []
+    for obj in objects:
+        pair = (obj.user_id, obj.author_id) if table == 'follows' else None
+        if obj.pk in seen or pair in pairs:
+            continue
+        if obj.pk is not None:
+            seen.add(obj.pk)
+        if pair is not None:
+            pairs.add(pair)
+        stored.append(obj)
+    return stored
+
+
+def store_batch(table, objects, ignore_conflicts):
+    model, _ = TABLES[table]
+    with transaction.atomic():
+        stored = objects
+        if ignore_conflicts and table in ('posts', 'follows'):
+            stored = new_objects(table, objects)
+        model.objects.bulk_create(
+            objects, ignore_conflicts=ignore_conflicts
+        )
+        after_batch(table, stored)
+    return len(objects)
+
+
+class Progress:
+    """Сколько строк обработано и с какой скоростью."""
+
+    def __init__(self, stream, table):
+        self.stream = stream
+        self.table = table
+        self.rows = 0
+        self.started = time.monotonic()
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def add(self, rows):
+        self.rows += rows
+        rate = self.rows / max(self.elapsed(), 1e-6)
+        self.stream.write(
+            f'{self.table}: {self.rows} строк, {rate:.0f} строк/с'
+        )
+
+    def done(self):
+        return f'{self.table}: {self.rows} строк за {self.elapsed():.1f} с'
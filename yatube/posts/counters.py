@@ -0,0 +1,178 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import (
+    Count, F, IntegerField, OuterRef, Q, QuerySet, Subquery,
+)
+from django.db.models.functions import Coalesce, Greatest
+
+from posts.models import (
+    AuthorStats, Comment, Follow, Group, Post, TableCount, User,
+)
+
+TABLE_COUNT_KEY = 'table_count:{table}'
+COUNTED_MODELS = (Post, Comment)
+
+
+def count_of(model, field):
+    """Коррелированный подзапрос: число строк model, где field = pk."""
+    rows = (
+        model.objects
+        .filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+
+def actual_author_stats(user_ids=None):
+    users = User.objects.annotate(
+        actual_posts=count_of(Post, 'author'),
+        actual_followers=count_of(Follow, 'author'),
+        actual_following=count_of(Follow, 'user'),
+    )
+    if user_ids is not None:
+        users = users.filter(pk__in=user_ids)
+    return users
+
+
+def rebuild_author(user_id):
+    user = actual_author_stats([user_id]).get()
+    stats, _ = AuthorStats.objects.update_or_create(
+        user_id=user_id,
+        defaults={
+            'posts_count': user.actual_posts,
+            'followers_count': user.actual_followers,
+            'following_count': user.actual_following,
+        },
+    )
+    return stats
+
+
+def author_stats(user):
+    """Счётчики пользователя; недостающая строка пересчитывается."""
+    try:
+        return user.stats
+    except AuthorStats.DoesNotExist:
+        return rebuild_author(user.pk)
+
+
+def bumped(field, delta):
+    """F(field) + delta, но не меньше нуля.
+
+    Счётчик расходится с данными после записей без сигналов, например
+    bulk_create; уйди он ниже нуля, CHECK положительного поля сорвал бы
+    удаление самой строки. Расхождение чинит rebuild_counters.
+    """
+    if delta < 0:
+        return Greatest(F(field) + delta, 0)
+    return F(field) + delta
+
+
+def bump_author(user_id, field, delta):
+    """Строки ещё нет — её целиком посчитает author_stats() при чтении."""
+    AuthorStats.objects.filter(user_id=user_id).update(
+        **{field: bumped(field, delta)}
+    )
+
+
+def bump_authors(user_ids, field, delta):
+    """bump_author() для пачки пользователей одним UPDATE."""
+    AuthorStats.objects.filter(user_id__in=user_ids).update(
+        **{field: bumped(field, delta)}
+    )
+
+
+def bump_group(group_id, delta):
+    if group_id is not None:
+        Group.objects.filter(pk=group_id).update(
+            posts_count=bumped('posts_count', delta)
+        )
+
+
+def bump_post_comments(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comment_count=bumped('comment_count', delta)
+    )
+
+
+def stale_counters():
+    """Строки, в которых счётчики расходятся с реальными данными."""
+    posts = Post.objects.annotate(
+        actual=count_of(Comment, 'post')
+    ).exclude(comment_count=F('actual'))
+    groups = Group.objects.annotate(
+        actual=count_of(Post, 'group')
+    ).exclude(posts_count=F('actual'))
+    authors = actual_author_stats().annotate(
+        stored_posts=F('stats__posts_count'),
+        stored_followers=F('stats__followers_count'),
+        stored_following=F('stats__following_count'),
+    ).filter(
+        Q(stored_posts__isnull=True)
+        | ~Q(stored_posts=F('actual_posts'))
+        | ~Q(stored_followers=F('actual_followers'))
+        | ~Q(stored_following=F('actual_following'))
+    )
+    return {'posts': posts, 'groups': groups, 'authors': authors}
+
+
+def rebuild_counters(stale):
+    for post in stale['posts'].only('pk'):
+        Post.objects.filter(pk=post.pk).update(comment_count=post.actual)
+    for group in stale['groups'].only('pk'):
+        Group.objects.filter(pk=group.pk).update(posts_count=group.actual)
+    for user in stale['authors'].only('pk'):
+        rebuild_author(user.pk)
+
+
+def is_whole_table(queryset) -> bool:
+    """queryset без фильтров, среза и DISTINCT — все строки таблицы.
+
+    Не QuerySet (например, timeline.HybridTimeline) всей таблицей
+    не бывает.
+    """
+    if not isinstance(queryset, QuerySet):
+        return False
+    query = queryset.query
+    return query.can_filter() and not query.where and not query.distinct
+
+
+def cached_table_count(model):
+    return cache.get(TABLE_COUNT_KEY.format(table=model._meta.db_table))
+
+
+def approximate_count(model):
+    """Число строк таблицы из TableCount; None, если его не ведут.
+
+    Значение живёт в кэше TABLE_COUNT_TTL секунд, так что может
+    отставать от таблицы на записи за это время.
+    """
+    table = model._meta.db_table
+    key = TABLE_COUNT_KEY.format(table=table)
+    rows = cache.get(key)
+    if rows is None:
+        rows = (
+            TableCount.objects.filter(table=table)
+            .values_list('rows', flat=True)
+            .first()
+        )
+        if rows is None:
+            return None
+        cache.set(key, rows, settings.TABLE_COUNT_TTL)
+    return rows
+
+
+def refresh_table_counts(models=COUNTED_MODELS) -> dict:
+    """Пересчитать TableCount заново: на СУБД без триггеров — по
+    расписанию, на SQLite — если строки меняли в обход триггеров."""
+    counts = {}
+    for model in models:
+        table = model._meta.db_table
+        counts[table] = model.objects.count()
+        TableCount.objects.update_or_create(
+            table=table, defaults={'rows': counts[table]}
+        )
+        cache.delete(TABLE_COUNT_KEY.format(table=table))
+    return counts
@@ -0,0 +1,89 @@
+"""Производные картинок постов: несколько ширин и современные форматы.
+
+Модуль не импортирует Django, поэтому его функции можно выполнять
+в пуле процессов, запущенном через spawn.
+"""
+import os
+
+from PIL import Image, ImageOps
+
+MIME_TYPES = {
+    'AVIF': 'image/avif',
+    'WEBP': 'image/webp',
+    'JPEG': 'image/jpeg',
+}
+EXTENSIONS = {'AVIF': 'avif', 'WEBP': 'webp', 'JPEG': 'jpg'}
+
+
+def supported_formats(formats):
+    """Форматы, которые умеет записывать установленный Pillow."""
+    Image.init()
+    return [name for name in formats if name in Image.SAVE]
+
+
+def strip_metadata(path, quality=90):
+    """Перекодировать оригинал без EXIF, развернув его по ориентации.
+
+    Возвращает True, если файл был перезаписан.
+    """
+    with Image.open(path) as image:
+        image_format = image.format
+        if image_format not in ('JPEG', 'PNG', 'WEBP'):
+            return False
+        if not image.info.get('exif') and not image.getexif():
+            return False
+        cleaned = ImageOps.exif_transpose(image)
+        cleaned.info.pop('exif', None)
+        temporary = f'{path}.tmp'
+        cleaned.save(temporary, image_format, quality=quality)
+    os.replace(temporary, path)
+    return True
+
+
+def target_widths(source_width, widths):
+    """Ширины не больше исходной; самая узкая делается всегда."""
+    widths = sorted(widths)
+    return [w for w in widths if w <= source_width] or widths[:1]
+
+
+def render(source_path, media_root, stem, widths, formats, aspect,
+           quality=80):
+    """Сохранить производные и вернуть [(format, width, name), ...].
+
+    name — путь относительно media_root, как у FileField.
+    """
+    directory = os.path.join('posts', 'derivatives')
+    os.makedirs(os.path.join(media_root, directory), exist_ok=True)
+    rendered = []
+    with Image.open(source_path) as source:
+        source = ImageOps.exif_transpose(source)
+        if source.mode not in ('RGB', 'RGBA'):
+            source = source.convert('RGBA' if 'A' in source.mode else 'RGB')
+        for width in target_widths(source.width, widths):
+            size = (width, max(round(width / aspect), 1))
+            resized = ImageOps.fit(
+                source, size, Image.LANCZOS, centering=(0.5, 0.5)
+            )
+            for image_format in formats:
+                image = resized
+                if image_format == 'JPEG' and image.mode != 'RGB':
+                    image = image.convert('RGB')
+                name = os.path.join(
+                    directory,
+                    f'{stem}-{width}.{EXTENSIONS[image_format]}',
+                )
+                image.save(
+                    os.path.join(media_root, name),
+                    image_format,
+                    quality=quality,
+                )
+                rendered.append((image_format, width, name))
+    return rendered
+
+
+def render_or_none(*args):
+    """render() для пула: битая или пропавшая картинка не роняет пачку."""
+    try:
+        return render(*args)
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,65 @@
+from posts.models import Comment, Post
+
+# Порядок лент и поля, по которым курсор ищет позицию: (дата, id).
+FEED_ORDERING = ('pub_date', 'pk')
+
+# Колонки, которые выводят шаблоны лент: остальное не читаем из БД.
+FEED_FIELDS = (
+    'id',
+    'text',
+    'pub_date',
+    'image',
+    'thumbnail_url',
+    'image_sources',
+    'comment_count',
+    'author',
+    'author__username',
+    'author__first_name',
+    'author__last_name',
+    'group',
+    'group__slug',
+    'group__title',
+)
+
+
+def feed_queryset(posts=None, ordering=FEED_ORDERING):
+    """Общий queryset для всех лент постов.
+
+    Автор и группа подтягиваются одним JOIN, число комментариев
+    берётся из денормализованного счётчика Post.comment_count.
+    """
+    if posts is None:
+        posts = Post.objects.all()
+    return (
+        posts
+        .select_related('author', 'group')
+        .only(*FEED_FIELDS)
+        .order_by(*(f'-{field}' for field in ordering))
+    )
+
+
+def post_queryset():
+    """Страница поста: автор со счётчиками и группа тем же запросом."""
+    return Post.objects.select_related('author__stats', 'group')
+
+
+COMMENT_FIELDS = (
+    'id',
+    'text',
+    'created',
+    'post',
+    'author',
+    'author__username',
+    'author__first_name',
+    'author__last_name',
+)
+
+
+def comment_queryset(post_id):
+    """Комментарии поста: автор тем же запросом, без лишних колонок."""
+    return (
+        Comment.objects
+        .filter(post_id=post_id)
+        .select_related('author')
+        .only(*COMMENT_FIELDS)
+    )
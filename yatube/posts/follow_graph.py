@@ -0,0 +1,116 @@
+"""Граф подписок с кэшем.
+
+Подписки пользователя хранятся в кэше отсортированным массивом id
+авторов (array в байтах, по 8 байт на автора): проверка подписки —
+двоичный поиск, а «возможно, вы знакомы» собирается из подписок тех,
+на кого читатель подписан, одним get_many. Ключ пользователя
+сбрасывают сигналы Follow, то есть profile_follow и profile_unfollow.
+"""
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from posts.counters import author_stats
+from posts.models import Follow
+
+GENERATION_KEY = 'follow_graph:generation'
+FOLLOWING_KEY = 'follow_graph:{generation}:following:{user_id}'
+TYPECODE = 'q'
+
+
+def following_keys(user_ids) -> dict:
+    generation = cache.get(GENERATION_KEY, 1)
+    return {
+        FOLLOWING_KEY.format(generation=generation, user_id=user_id): user_id
+        for user_id in user_ids
+    }
+
+
+def load_following(user_ids) -> dict:
+    following = {user_id: array(TYPECODE) for user_id in user_ids}
+    for user_id, author_id in (
+        Follow.objects
+        .filter(user_id__in=user_ids)
+        .order_by('user_id', 'author_id')
+        .values_list('user_id', 'author_id')
+    ):
+        following[user_id].append(author_id)
+    return following
+
+
+def following_sets(user_ids) -> dict:
+    """Подписки нескольких пользователей: кэш, недостающие — одним
+    запросом."""
+    keys = following_keys(user_ids)
+    following = {}
+    for key, data in cache.get_many(keys).items():
+        following[keys[key]] = array(TYPECODE, data)
+    missing = [user_id for user_id in keys.values()
+               if user_id not in following]
+    if missing:
+        loaded = load_following(missing)
+        cache.set_many(
+            {
+                key: loaded[user_id].tobytes()
+                for key, user_id in keys.items() if user_id in loaded
+            },
+            settings.FOLLOW_GRAPH_TTL,
+        )
+        following.update(loaded)
+    return following
+
+
+def following_ids(user_id) -> array:
+    return following_sets([user_id])[user_id]
+
+
+def is_following(user_id, author_id) -> bool:
+    ids = following_ids(user_id)
+    index = bisect_left(ids, author_id)
+    return index < len(ids) and ids[index] == author_id
+
+
+def counts(user) -> dict:
+    stats = author_stats(user)
+    return {
+        'followers': stats.followers_count,
+        'following': stats.following_count,
+    }
+
+
+def suggestions(user_id, limit=None) -> list:
+    """Пары (id автора, сколько подписок читателя на него подписаны).
+
+    Смотрим подписки не больше FOLLOW_SUGGESTIONS_SOURCES авторов
+    читателя, чтобы цена не росла с числом его подписок.
+    """
+    limit = limit or settings.FOLLOW_SUGGESTIONS_LIMIT
+    following = following_ids(user_id)
+    known = set(following)
+    known.add(user_id)
+    sources = following[:settings.FOLLOW_SUGGESTIONS_SOURCES]
+    mutual = Counter()
+    for ids in following_sets(sources).values():
+        mutual.update(author_id for author_id in ids
+                      if author_id not in known)
+    ranked = sorted(mutual.items(), key=lambda item: (-item[1], item[0]))
+    return ranked[:limit]
+
+
+def invalidate(user_id):
+    keys = list(following_keys([user_id]))
+    cache.delete_many(keys)
+    # до коммита другой запрос мог закэшировать старые подписки
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_all():
+    """Устарить подписки всех пользователей, например после импорта."""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 2, None)
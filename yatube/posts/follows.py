@@ -0,0 +1,64 @@
+"""Подписка и отписка пачкой.
+
+Онбординг подписывает на десятки авторов сразу: вместо запроса
+на каждого — один bulk_create и один DELETE. Ни тот, ни другой
+не шлёт сигналы Follow, поэтому счётчики, ленты и кэши, которые
+обычно правят сигналы, правятся здесь же, пачкой, в той же транзакции.
+"""
+from django.db import connection, transaction
+
+from posts import counters, follow_graph, page_cache, timeline
+from posts.models import Follow
+
+
+def followed_changed(user_id, author_ids, delta):
+    counters.bump_author(
+        user_id, 'following_count', delta * len(author_ids)
+    )
+    counters.bump_authors(author_ids, 'followers_count', delta)
+    follow_graph.invalidate(user_id)
+    page_cache.invalidate(f'follow:{user_id}')
+
+
+@transaction.atomic
+def follow_many(user_id, author_ids) -> list:
+    """Подписать на авторов; вернуть id тех, подписка на кого новая."""
+    wanted = set(author_ids) - {user_id}
+    existing = Follow.objects.filter(
+        user_id=user_id, author_id__in=wanted
+    ).values_list('author_id', flat=True)
+    added = sorted(wanted.difference(existing))
+    if not added:
+        return added
+    Follow.objects.bulk_create(
+        [Follow(user_id=user_id, author_id=author_id) for author_id in added],
+        ignore_conflicts=True,
+    )
+    followed_changed(user_id, added, 1)
+    timeline.backfill_many((user_id, author_id) for author_id in added)
+    return added
+
+
+@transaction.atomic
+def unfollow_many(user_id, author_ids) -> list:
+    """Отписать от авторов; вернуть id тех, подписка на кого была."""
+    follows = Follow.objects.filter(
+        user_id=user_id, author_id__in=set(author_ids)
+    )
+    removed = sorted(follows.values_list('author_id', flat=True))
+    if not removed:
+        return removed
+    # Не follows.delete(): при подключённых сигналах он выбирает строки
+    # и шлёт post_delete на каждую, а follow_deleted правит счётчики
+    # и ленту поштучно. Всё это делается ниже пачкой, поэтому здесь
+    # обычный DELETE через курсор, как в posts.search.
+    placeholders = ', '.join(['%s'] * len(removed))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {Follow._meta.db_table} '
+            f'WHERE user_id = %s AND author_id IN ({placeholders})',
+            [user_id, *removed],
+        )
+    followed_changed(user_id, removed, -1)
+    timeline.purge_many(user_id, removed)
+    return removed
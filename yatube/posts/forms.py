@@ -1,6 +1,7 @@
 from django import forms
 
 from .models import Post, Comment
+from .uploads import pixel_limit_error
 
 from django.utils.translation import gettext_lazy as _
 
@@ -26,6 +27,33 @@ class PostForm(forms.ModelForm):
             })
         }
 
+    def __init__(self, *args, rejected_uploads=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rejected_uploads = rejected_uploads or {}
+
+    def clean_image(self):
+        if 'image' in self.rejected_uploads:
+            raise forms.ValidationError(self.rejected_uploads['image'])
+        image = self.cleaned_data.get('image')
+        # ImageField уже открыл файл и оставил объект PIL в image.image
+        header = getattr(image, 'image', None)
+        if header is not None:
+            error = pixel_limit_error(*header.size)
+            if error:
+                raise forms.ValidationError(error)
+        return image
+
+    def save(self, commit=True):
+        post = super().save(commit=False)
+        if 'image' in self.changed_data:
+            # старые миниатюра и srcset больше не подходят, новые
+            # сделает воркер
+            post.thumbnail_url = ''
+            post.image_sources = ''
+        if commit:
+            post.save()
+        return post
+
 
 class CommentForm(forms.ModelForm):
     """Форма для добавления комментария."""
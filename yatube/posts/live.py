@@ -0,0 +1,98 @@
+"""Новые посты подписок без перезагрузки ленты.
+
+После коммита нового поста его id уходит в канал автора через
+core.pubsub. Под core.asgi long-poll и SSE подписываются на каналы
+всех авторов читателя и держат соединение, пока нечего отдать; под
+WSGI страница опрашивает api/follow/updates/ с растущей паузой.
+"""
+import json
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+
+from core import pubsub
+from posts import follow_graph
+from posts.models import Post
+
+# Через сколько миллисекунд EventSource переподключается
+STREAM_RETRY_MS = 3000
+
+
+def author_channel(author_id) -> str:
+    return f'author:{author_id}'
+
+
+def announce_post(post):
+    """Сообщить подписчикам автора о посте, когда он виден в БД."""
+    message = {'id': post.pk, 'author': post.author_id}
+    transaction.on_commit(
+        lambda: pubsub.broker().publish(
+            author_channel(post.author_id), message
+        )
+    )
+
+
+def followed_channels(user) -> list:
+    return [
+        author_channel(author_id)
+        for author_id in follow_graph.following_ids(user.pk)
+    ]
+
+
+def latest_post_id(user) -> int:
+    """id последнего поста подписок: с него клиент начинает опрос."""
+    return Post.objects.filter(author__following__user=user).aggregate(
+        last=Max('pk')
+    )['last'] or 0
+
+
+def missed_posts(user, after) -> list:
+    """Посты подписок новее поста after, который клиент уже видел."""
+    return [
+        {'id': post_id, 'author': author_id}
+        for post_id, author_id in Post.objects
+        .filter(author__following__user=user, pk__gt=after)
+        .order_by('pk')
+        .values_list('pk', 'author_id')[:settings.FOLLOW_UPDATES_LIMIT]
+    ]
+
+
+def wait_for_posts(subscription, timeout) -> list:
+    return [message for _, message in subscription.get(timeout)]
+
+
+def event(message) -> str:
+    return (
+        f'id: {message["id"]}\nevent: post\n'
+        f'data: {json.dumps(message)}\n\n'
+    )
+
+
+def event_stream(subscription, missed):
+    """Поток SSE: пропущенные посты, затем новые по мере публикации.
+
+    Пустой комментарий раз в FOLLOW_STREAM_HEARTBEAT секунд не даёт
+    прокси закрыть соединение; через FOLLOW_STREAM_MAX_SECONDS поток
+    завершается, и EventSource переподключается с Last-Event-ID.
+    """
+    deadline = time.monotonic() + settings.FOLLOW_STREAM_MAX_SECONDS
+    try:
+        yield f'retry: {STREAM_RETRY_MS}\n\n'
+        for message in missed:
+            yield event(message)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            messages = wait_for_posts(
+                subscription,
+                min(settings.FOLLOW_STREAM_HEARTBEAT, remaining),
+            )
+            if not messages:
+                yield ': ping\n\n'
+            for message in messages:
+                yield event(message)
+    finally:
+        subscription.close()
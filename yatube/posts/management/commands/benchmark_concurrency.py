@@ -0,0 +1,93 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test.utils import (
+    override_settings, setup_test_environment, teardown_test_environment,
+)
+
+from posts import benchmark
+from posts.management.commands.benchmark_views import BENCHMARK_CACHES
+from posts.management.commands.benchmark_writes import file_test_database
+
+MODES = ('wsgi', 'asgi')
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает WSGI и ASGI (yatube.asgi) под параллельными чтениями '
+        'лент и страниц постов медленными клиентами: запросов в секунду '
+        'и задержки при одинаковом числе потоков Django.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--modes', nargs='+', default=list(MODES), choices=MODES
+        )
+        parser.add_argument(
+            '--profile',
+            default='production',
+            choices=sorted(settings.DATABASE_PROFILES),
+        )
+        parser.add_argument('--clients', type=int, default=32)
+        parser.add_argument(
+            '--requests', type=int, default=20, help='Запросов на клиента.'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.ASGI_THREADS,
+            help='Потоков Django в обоих режимах.',
+        )
+        parser.add_argument(
+            '--client-delay-ms',
+            type=float,
+            default=20,
+            help='Сколько клиент принимает каждую порцию ответа.',
+        )
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=500)
+        parser.add_argument('--comments', type=int, default=1000)
+        parser.add_argument('--output', help='Сохранить отчёт в JSON.')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        try:
+            with file_test_database(options['profile']) as directory:
+                with override_settings(
+                    CACHES=BENCHMARK_CACHES, MEDIA_ROOT=directory
+                ):
+                    benchmark.seed(
+                        users=options['users'],
+                        posts=options['posts'],
+                        comments=options['comments'],
+                        images=0,
+                    )
+                    connections['default'].close()
+                    report = {
+                        mode: benchmark.serve_load(
+                            mode,
+                            clients=options['clients'],
+                            requests=options['requests'],
+                            workers=options['workers'],
+                            client_delay=options['client_delay_ms'] / 1000,
+                        )
+                        for mode in options['modes']
+                    }
+        finally:
+            teardown_test_environment()
+        self.stdout.write(
+            f'{"режим":<8}{"запросов/с":>12}{"ошибок":>8}'
+            f'{"p50 мс":>10}{"p95 мс":>10}'
+        )
+        for mode, result in report.items():
+            self.stdout.write(
+                f'{mode:<8}{result["requests_per_second"]:>12}'
+                f'{result["errors"]:>8}{result["p50_ms"]:>10}'
+                f'{result["p95_ms"]:>10}'
+            )
+        if options['output']:
+            benchmark.save(options['output'], report)
+        else:
+            self.stdout.write(json.dumps(report, ensure_ascii=False))
@@ -0,0 +1,81 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет рендеринг posts/index.html со страницей из 10, 100 и '
+        '1000 постов без БД и кэша фрагментов, с разбивкой по шаблонам.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            nargs='+',
+            type=int,
+            default=list(benchmark.TEMPLATE_SIZES),
+            help='Постов на странице.',
+        )
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--output', help='Сохранить отчёт в JSON-файл.')
+        parser.add_argument(
+            '--baseline', help='JSON прошлого прогона для сравнения.'
+        )
+        parser.add_argument(
+            '--max-regression',
+            type=float,
+            default=0.2,
+            help='Допустимый рост p95 относительно --baseline.',
+        )
+
+    def handle(self, *args, **options):
+        report = {
+            'environment': {
+                **benchmark.environment(),
+                'template_loaders': settings.TEMPLATES[0]['OPTIONS'].get(
+                    'loaders'
+                ),
+            },
+            'results': benchmark.render_index(
+                sizes=options['sizes'],
+                repeat=options['repeat'],
+                warmup=options['warmup'],
+            ),
+        }
+        self.print_report(report)
+        if options['output']:
+            benchmark.save(options['output'], report)
+        if options['baseline']:
+            self.check_baseline(report, options)
+
+    def print_report(self, report):
+        self.stdout.write(
+            f'{"постов":>8}{"p50 мс":>10}{"p95 мс":>10}{"мкс/пост":>10}'
+        )
+        for result in report['results'].values():
+            self.stdout.write(
+                f'{result["posts"]:>8}{result["p50_ms"]:>10}'
+                f'{result["p95_ms"]:>10}{result["per_post_us"]:>10}'
+            )
+        largest = list(report['results'].values())[-1]
+        for name, template in largest['templates'].items():
+            self.stdout.write(
+                f'  {name:<40}{template["renders"]:>6}{template["ms"]:>10}'
+            )
+
+    def check_baseline(self, report, options):
+        with open(options['baseline'], encoding='utf-8') as stream:
+            baseline = json.load(stream)
+        regressions = benchmark.compare(
+            report['results'], baseline, options['max_regression']
+        )
+        for size, before, after in regressions:
+            self.stderr.write(f'{size} постов: p95 {before} -> {after} мс')
+        if regressions:
+            raise CommandError(f'Замедлилось размеров: {len(regressions)}')
+        self.stdout.write(self.style.SUCCESS('Регрессий нет.'))
@@ -0,0 +1,149 @@
+import json
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    override_settings, setup_test_environment, teardown_test_environment,
+)
+
+from posts import benchmark
+
+# Отдельный кэш, чтобы прогон не трогал кэш работающего сайта
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark',
+    }
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт тестовую БД, наполняет её синтетическими данными и '
+        'замеряет задержки, число запросов и память представлений posts.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--posts', type=int, default=5000)
+        parser.add_argument('--comments', type=int, default=10000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--images', type=int, default=5)
+        parser.add_argument(
+            '--mean-following',
+            type=int,
+            default=20,
+            help='Среднее число подписок читателя.',
+        )
+        parser.add_argument(
+            '--exponent',
+            type=float,
+            default=1.1,
+            help='Показатель степени в популярности авторов (Zipf).',
+        )
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument(
+            '--memory-samples',
+            type=int,
+            default=20,
+            help='Сколько запросов повторить под tracemalloc.',
+        )
+        parser.add_argument(
+            '--views',
+            nargs='+',
+            choices=benchmark.VIEWS,
+            default=benchmark.VIEWS,
+        )
+        parser.add_argument(
+            '--cold-cache',
+            action='store_true',
+            help='Очищать кэш перед каждым запросом.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--output', help='Сохранить отчёт в JSON-файл.'
+        )
+        parser.add_argument(
+            '--baseline', help='JSON прошлого прогона для сравнения.'
+        )
+        parser.add_argument(
+            '--max-regression',
+            type=float,
+            default=0.2,
+            help='Допустимый рост p95 относительно --baseline.',
+        )
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True
+        )
+        try:
+            with tempfile.TemporaryDirectory() as media_root:
+                with override_settings(
+                    CACHES=BENCHMARK_CACHES, MEDIA_ROOT=media_root
+                ):
+                    report = self.benchmark(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        self.print_report(report)
+        if options['output']:
+            benchmark.save(options['output'], report)
+        if options['baseline']:
+            self.check_baseline(report, options)
+
+    def benchmark(self, options):
+        dataset = benchmark.seed(
+            users=options['users'],
+            posts=options['posts'],
+            comments=options['comments'],
+            groups=options['groups'],
+            images=options['images'],
+            mean_following=options['mean_following'],
+            exponent=options['exponent'],
+            random_seed=options['seed'],
+        )
+        self.stdout.write(f'Данные: {json.dumps(dataset)}')
+        results = benchmark.run(
+            views=options['views'],
+            requests=options['requests'],
+            warmup=options['warmup'],
+            memory_samples=options['memory_samples'],
+            cold_cache=options['cold_cache'],
+            random_seed=options['seed'],
+        )
+        return {
+            'environment': benchmark.environment(),
+            'dataset': dataset,
+            'cold_cache': options['cold_cache'],
+            'results': results,
+        }
+
+    def print_report(self, report):
+        self.stdout.write(
+            f'{"view":<14}{"p50 мс":>10}{"p95 мс":>10}{"p99 мс":>10}'
+            f'{"запросов":>10}{"память КБ":>11}'
+        )
+        for view, result in report['results'].items():
+            self.stdout.write(
+                f'{view:<14}{result["p50_ms"]:>10}{result["p95_ms"]:>10}'
+                f'{result["p99_ms"]:>10}{result["queries_mean"]:>10}'
+                f'{str(result["alloc_peak_kb"]):>11}'
+            )
+
+    def check_baseline(self, report, options):
+        with open(options['baseline'], encoding='utf-8') as stream:
+            baseline = json.load(stream)
+        regressions = benchmark.compare(
+            report['results'], baseline, options['max_regression']
+        )
+        for view, before, after in regressions:
+            self.stderr.write(f'{view}: p95 {before} -> {after} мс')
+        if regressions:
+            raise CommandError(
+                f'Замедлилось представлений: {len(regressions)}'
+            )
+        self.stdout.write(self.style.SUCCESS('Регрессий нет.'))
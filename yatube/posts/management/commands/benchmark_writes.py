@@ -0,0 +1,121 @@
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test.utils import (
+    override_settings, setup_test_environment, teardown_test_environment,
+)
+
+from posts import benchmark
+from posts.management.commands.benchmark_views import BENCHMARK_CACHES
+
+
+def reopen_default():
+    """Соединение потока создано со старым ENGINE — пересоздать его."""
+    connections['default'].close()
+    del connections['default']
+    return connections['default']
+
+
+@contextmanager
+def file_test_database(profile):
+    """Файловая тестовая БД с настройками профиля; отдаёт её каталог.
+
+    Потокам нужна общая база в файле: тестовая БД в памяти у каждого
+    соединения своя.
+    """
+    database = connections.databases['default']
+    saved = dict(database)
+    with tempfile.TemporaryDirectory() as directory:
+        database.update(settings.DATABASE_PROFILES[profile])
+        database['TEST'] = {
+            **saved.get('TEST', {}),
+            'NAME': os.path.join(directory, 'benchmark.sqlite3'),
+        }
+        connection = reopen_default()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True
+        )
+        try:
+            yield directory
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            database.clear()
+            database.update(saved)
+            reopen_default()
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает профили БД из DATABASE_PROFILES под параллельными '
+        'create_post и add_comment: записей в секунду и ошибок '
+        '"database is locked".'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--profiles',
+            nargs='+',
+            default=sorted(settings.DATABASE_PROFILES),
+            choices=sorted(settings.DATABASE_PROFILES),
+        )
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument(
+            '--requests', type=int, default=50, help='Запросов на поток.'
+        )
+        parser.add_argument(
+            '--post-share',
+            type=float,
+            default=0.3,
+            help='Доля create_post среди запросов, остальное add_comment.',
+        )
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=500)
+        parser.add_argument('--output', help='Сохранить отчёт в JSON.')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        try:
+            report = {
+                profile: self.run_profile(profile, options)
+                for profile in options['profiles']
+            }
+        finally:
+            teardown_test_environment()
+        self.stdout.write(
+            f'{"профиль":<12}{"записей/с":>11}{"ошибок":>8}'
+            f'{"p50 мс":>10}{"p95 мс":>10}'
+        )
+        for profile, result in report.items():
+            self.stdout.write(
+                f'{profile:<12}{result["writes_per_second"]:>11}'
+                f'{result["errors"]:>8}{result["p50_ms"]:>10}'
+                f'{result["p95_ms"]:>10}'
+            )
+        if options['output']:
+            benchmark.save(options['output'], report)
+        else:
+            self.stdout.write(json.dumps(report, ensure_ascii=False))
+
+    def run_profile(self, profile, options):
+        """Файловая тестовая БД с настройками профиля, затем нагрузка."""
+        with file_test_database(profile) as directory:
+            with override_settings(
+                CACHES=BENCHMARK_CACHES, MEDIA_ROOT=directory
+            ):
+                benchmark.seed(
+                    users=options['users'],
+                    posts=options['posts'],
+                    comments=0,
+                    images=0,
+                )
+                connections['default'].close()
+                return benchmark.write_load(
+                    threads=options['threads'],
+                    requests=options['requests'],
+                    post_share=options['post_share'],
+                )
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+
+from posts import page_cache, thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Делает производные (ширины и форматы для srcset) картинок '
+        'постов, уже лежащих в MEDIA_ROOT/posts/.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересоздать производные и у обработанных постов.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Сколько картинок отдавать пулу процессов за раз.',
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='')
+        if not options['all']:
+            posts = posts.filter(image_sources='')
+        names = list(
+            posts.order_by('image').values_list('image', flat=True).distinct()
+        )
+        batch_size = options['batch_size']
+        done = 0
+        for start in range(0, len(names), batch_size):
+            batch = names[start:start + batch_size]
+            sources = thumbnails.render_derivatives(batch)
+            thumbnails.store_derivatives(sources)
+            for post in Post.objects.filter(image__in=sources).only(
+                'author', 'group'
+            ):
+                page_cache.invalidate(*page_cache.post_scopes(post))
+            done += len(sources)
+            self.stdout.write(
+                f'{start + len(batch)}/{len(names)}: '
+                f'готово {done}, пропущено {start + len(batch) - done}'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Обработано картинок: {done}'))
@@ -0,0 +1,67 @@
+import re
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.feeds import comment_queryset, feed_queryset, post_queryset
+from posts.models import Follow, Group, Post, User
+from posts.paginators import CommentPaginator
+from posts.timeline import TIMELINE_ORDERING, timeline_posts
+
+# SQLite: «SCAN posts_post» без индекса; PostgreSQL: «Seq Scan on ...».
+FULL_SCAN = re.compile(r'\bSCAN\b(?!.*\bUSING\b)|\bSeq Scan\b')
+TEMP_SORT = re.compile(r'USE TEMP B-TREE|\bSort\b')
+
+
+def view_queries():
+    """Запросы, которые выполняют представления posts.
+
+    Собраны теми же функциями, что и в представлениях, с тем же
+    порядком и LIMIT: план — тот, что выполняется на сайте.
+    """
+    page = settings.POST_COUNT
+    group = Group.objects.first() or Group(pk=0)
+    user = User.objects.first() or User(pk=0)
+    post = Post.objects.first() or Post(pk=0)
+    comments = CommentPaginator(
+        comment_queryset(post.pk), settings.COMMENTS_PER_PAGE
+    )
+    return {
+        'index': feed_queryset()[:page],
+        'group_posts': feed_queryset(group.posts.all())[:page],
+        'profile': feed_queryset(user.posts.all())[:page],
+        # get_object_or_404 -> get(): фильтр без ORDER BY
+        'post_detail': post_queryset().filter(pk=post.pk).order_by(),
+        'post_detail comments': comments.object_list.order_by(
+            *comments.ordering
+        )[:comments.per_page + 1],
+        'follow_index': feed_queryset(
+            timeline_posts(user), TIMELINE_ORDERING
+        )[:page],
+        'profile_follow': Follow.objects.filter(user=user, author=user),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполняет EXPLAIN для запросов представлений posts '
+        'и находит полные сканирования таблиц.'
+    )
+
+    def handle(self, *args, **options):
+        full_scans = []
+        for name, queryset in view_queries().items():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            for line in queryset.explain().splitlines():
+                if FULL_SCAN.search(line):
+                    full_scans.append(name)
+                    self.stdout.write(self.style.ERROR(f'  {line}'))
+                elif TEMP_SORT.search(line):
+                    self.stdout.write(self.style.WARNING(f'  {line}'))
+                else:
+                    self.stdout.write(f'  {line}')
+        if full_scans:
+            raise CommandError(
+                'Полное сканирование таблицы: ' + ', '.join(full_scans)
+            )
+        self.stdout.write(self.style.SUCCESS('Полных сканирований нет.'))
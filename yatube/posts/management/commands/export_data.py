@@ -0,0 +1,58 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from posts import bulk
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает группы, посты, комментарии или подписки в NDJSON '
+        'или CSV, читая таблицу пачками.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('table', choices=sorted(bulk.TABLES))
+        parser.add_argument(
+            '--output',
+            default='-',
+            help='Файл для выгрузки; по умолчанию stdout.',
+        )
+        parser.add_argument(
+            '--format',
+            choices=bulk.FORMATS,
+            help='Формат; по умолчанию по расширению файла.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Сколько строк читать из БД за раз.',
+        )
+
+    def handle(self, *args, **options):
+        output = options['output']
+        if output == '-':
+            self.export(sys.stdout, options)
+            return
+        with open(output, 'w', encoding='utf-8', newline='') as stream:
+            self.export(stream, options)
+
+    def export(self, stream, options):
+        table = options['table']
+        batch_size = options['batch_size']
+        file_format = options['format'] or bulk.format_for(options['output'])
+        _, columns = bulk.TABLES[table]
+        # прогресс идёт в stderr: в stdout могут писаться сами данные
+        progress = bulk.Progress(self.stderr, table)
+        pending = 0
+        for _ in bulk.write_rows(
+            stream, bulk.export_rows(table, batch_size), columns, file_format
+        ):
+            pending += 1
+            if pending == batch_size:
+                progress.add(pending)
+                pending = 0
+        if pending:
+            progress.add(pending)
+        self.stderr.write(self.style.SUCCESS(f'Выгружено: {progress.done()}'))
@@ -0,0 +1,71 @@
+import sys
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from posts import bulk, follow_graph, page_cache, timeline
+from posts.counters import (
+    rebuild_counters, refresh_table_counts, stale_counters,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает группы, посты, комментарии или подписки из NDJSON '
+        'или CSV пачками через bulk_create, затем пересчитывает '
+        'счётчики и сбрасывает кэш страниц.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('table', choices=sorted(bulk.TABLES))
+        parser.add_argument('path', help='Файл с данными; - для stdin.')
+        parser.add_argument(
+            '--format',
+            choices=bulk.FORMATS,
+            help='Формат; по умолчанию по расширению файла.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько строк записывать одним bulk_create.',
+        )
+        parser.add_argument(
+            '--ignore-conflicts',
+            action='store_true',
+            help='Пропускать строки с уже занятыми id.',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if path == '-':
+            self.load(sys.stdin, options)
+        else:
+            with open(path, encoding='utf-8', newline='') as stream:
+                self.load(stream, options)
+        rebuild_counters(stale_counters())
+        refresh_table_counts()
+        cache.delete(timeline.PULL_AUTHORS_KEY)
+        follow_graph.invalidate_all()
+        page_cache.invalidate_all()
+
+    def load(self, stream, options):
+        table = options['table']
+        file_format = options['format'] or bulk.format_for(options['path'])
+        progress = bulk.Progress(self.stdout, table)
+        batches = bulk.import_batches(
+            table,
+            bulk.read_rows(stream, file_format),
+            options['batch_size'],
+            ignore_conflicts=options['ignore_conflicts'],
+        )
+        try:
+            for stored in batches:
+                progress.add(stored)
+        except (ValueError, ValidationError, IntegrityError) as error:
+            raise CommandError(
+                f'Строка {progress.rows + 1} и далее не загружены: {error}'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Загружено: {progress.done()}'))
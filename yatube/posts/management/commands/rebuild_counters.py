@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.counters import rebuild_counters, stale_counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет денормализованные счётчики постов, комментариев '
+        'и подписок с данными и пересчитывает расхождения.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить, ничего не исправляя.',
+        )
+
+    def handle(self, *args, **options):
+        stale = stale_counters()
+        total = 0
+        for name, queryset in stale.items():
+            count = queryset.count()
+            total += count
+            self.stdout.write(f'{name}: расхождений {count}')
+        if options['check']:
+            if total:
+                raise CommandError(f'Устаревших счётчиков: {total}')
+            self.stdout.write(self.style.SUCCESS('Счётчики в порядке.'))
+            return
+        rebuild_counters(stale)
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано строк: {total}'))
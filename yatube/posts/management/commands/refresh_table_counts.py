@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import refresh_table_counts
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает число строк больших таблиц (TableCount), '
+        'по которому Paginator и админка обходятся без COUNT(*).'
+    )
+
+    def handle(self, *args, **options):
+        for table, rows in refresh_table_counts().items():
+            self.stdout.write(f'{table}: {rows}')
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_post_thumbnail_url'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_sources',
+            field=models.TextField(blank=True, editable=False),
+        ),
+    ]
@@ -0,0 +1,52 @@
+from django.db import migrations, models
+
+COUNTED_TABLES = ('posts_post', 'posts_comment')
+
+
+def create_triggers(apps, schema_editor):
+    TableCount = apps.get_model('posts', 'TableCount')
+    for table in COUNTED_TABLES:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {table}')
+            rows = cursor.fetchone()[0]
+        TableCount.objects.create(table=table, rows=rows)
+        if schema_editor.connection.vendor != 'sqlite':
+            continue
+        for event, delta in (('INSERT', '+ 1'), ('DELETE', '- 1')):
+            schema_editor.execute(
+                f'CREATE TRIGGER {table}_count_{event.lower()} '
+                f'AFTER {event} ON {table} BEGIN '
+                f'UPDATE posts_tablecount SET rows = rows {delta} '
+                f"WHERE \"table\" = '{table}'; END"
+            )
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table in COUNTED_TABLES:
+        for event in ('insert', 'delete'):
+            schema_editor.execute(
+                f'DROP TRIGGER IF EXISTS {table}_count_{event}'
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_post_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TableCount',
+            fields=[
+                ('table', models.CharField(
+                    max_length=100, primary_key=True, serialize=False
+                )),
+                ('rows', models.BigIntegerField(default=0)),
+                ('refreshed', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
@@ -1,3 +1,5 @@
+import json
+
 from django.db import models
 from django.contrib.auth import get_user_model
 
@@ -12,6 +14,7 @@ class Group(models.Model):
         verbose_name='slug'
     )
     description = models.TextField()
+    posts_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.title
@@ -37,13 +40,43 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True,
     )
+    thumbnail_url = models.CharField(
+        max_length=255,
+        blank=True,
+        editable=False,
+    )
+    # JSON: [{"type": "image/webp", "srcset": "... 320w, ... 640w"}, ...]
+    image_sources = models.TextField(blank=True, editable=False)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='post_pub_date_idx',
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date_idx',
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
+    @property
+    def sources(self):
+        """Варианты картинки для <picture>: форматы и ширины."""
+        try:
+            return json.loads(self.image_sources)
+        except ValueError:
+            return []
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
@@ -66,6 +99,14 @@ class Comment(models.Model):
         auto_now_add=True,
     )
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['post', 'created'],
+                name='comment_post_created_idx',
+            ),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -80,3 +121,80 @@ class Follow(models.Model):
         related_name='following',
         help_text='Автор поста',
     )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'],
+                name='follow_unique_user_author',
+            ),
+        ]
+
+
+class TimelineEntry(models.Model):
+    """Строка материализованной ленты подписок пользователя.
+
+    Заполняется при публикации поста (fan-out on write), поэтому
+    чтение ленты — это отрезок индекса (user, -pub_date, -post).
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_feed_idx',
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='timeline_unique_user_post',
+            ),
+        ]
+
+
+class AuthorStats(models.Model):
+    """Денормализованные счётчики пользователя.
+
+    Поддерживаются сигналами posts.signals; пересчитываются командой
+    rebuild_counters.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+    )
+    posts_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+
+
+class TableCount(models.Model):
+    """Число строк большой таблицы для Paginator без COUNT(*).
+
+    На SQLite его держат триггеры INSERT/DELETE из миграции 0011;
+    команда refresh_table_counts пересчитывает строки заново.
+    """
+    table = models.CharField(max_length=100, primary_key=True)
+    rows = models.BigIntegerField(default=0)
+    refreshed = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.table}: {self.rows}'
@@ -0,0 +1,66 @@
+from django.core.cache import cache
+
+from posts.paginators import encode_cursor
+
+VERSION_KEY = 'feed:version:{scope}'
+# Общая версия всех областей: её поднимают массовые изменения данных
+ALL_SCOPES = '*'
+
+
+def scope_version(scope: str) -> str:
+    """Версия области вместе с общей версией, одним походом в кэш."""
+    keys = [VERSION_KEY.format(scope=name) for name in (ALL_SCOPES, scope)]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            versions[key] = 1
+            cache.add(key, 1, None)
+    return '.'.join(str(versions[key]) for key in keys)
+
+
+def invalidate(*scopes):
+    """Поднять версию области: все её закэшированные страницы устаревают."""
+    for scope in scopes:
+        key = VERSION_KEY.format(scope=scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 2, None)
+
+
+def invalidate_all():
+    """Устарить все страницы сразу, например после импорта данных."""
+    invalidate(ALL_SCOPES)
+
+
+def page_key(page_obj, view: str, scope: str) -> str:
+    """Ключ фрагмента ленты: представление, область, версия и страница.
+
+    Страница берётся из page_obj, уже после пагинации: ?page=01,
+    ?page=abc или ?page=999999 получают ключ той страницы, которую
+    на самом деле показывают, а не новую копию фрагмента.
+    """
+    if getattr(page_obj, 'is_cursor', False):
+        # страница курсора определяется своим первым постом
+        first = page_obj[0] if page_obj else None
+        page = 'c' + (
+            encode_cursor(first, page_obj.paginator.seek_fields[0])
+            if first is not None else ''
+        )
+    else:
+        page = page_obj.number
+    return 'feed:page:{view}:{scope}:v{version}:{page}'.format(
+        view=view,
+        scope=scope,
+        version=scope_version(scope),
+        page=page,
+    )
+
+
+def post_scopes(post, group_id=None):
+    """Области, на которые влияет пост."""
+    scopes = ['index', f'author:{post.author_id}', f'post:{post.pk}']
+    for group in {post.group_id, group_id}:
+        if group is not None:
+            scopes.append(f'group:{group}')
+    return scopes
@@ -0,0 +1,307 @@
+import base64
+import binascii
+from collections.abc import Sequence
+from datetime import datetime
+
+from django.conf import settings
+from django.core.paginator import (
+    EmptyPage, PageNotAnInteger, Paginator,
+)
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.dateparse import parse_datetime
+
+from posts import counters
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class WindowedPaginator(Paginator):
+    """Paginator, чья навигация не растёт с числом страниц.
+
+    Вместо page_range во весь список страниц шаблон получает
+    page_obj.page_range: первые и последние on_ends номеров, окно
+    on_each_side вокруг текущей и ELLIPSIS на месте пропусков.
+    """
+    ELLIPSIS = '…'
+    on_each_side = 2
+    on_ends = 1
+    # count — только нижняя граница, последняя страница неизвестна
+    count_is_estimate = False
+
+    def _get_page(self, *args, **kwargs):
+        page = super()._get_page(*args, **kwargs)
+        page.page_range = self.get_elided_page_range(page.number)
+        return page
+
+    def get_elided_page_range(self, number) -> list:
+        on_each_side, on_ends = self.on_each_side, self.on_ends
+        last = self.num_pages
+        if (
+            not self.count_is_estimate
+            and last <= (on_each_side + on_ends) * 2 + 1
+        ):
+            return list(self.page_range)
+        # многоточие заменяет хотя бы две страницы, иначе — сам номер
+        pages = list(range(1, on_ends + 1))
+        start = number - on_each_side
+        if start > on_ends + 2:
+            pages.append(self.ELLIPSIS)
+        else:
+            start = on_ends + 1
+        if self.count_is_estimate:
+            # дальше известно только, есть ли следующая страница
+            pages += range(start, number + 1)
+            if number < self.num_pages:
+                pages += [number + 1, self.ELLIPSIS]
+            return pages
+        end = number + on_each_side
+        if end >= last - on_ends - 1:
+            end = last - on_ends
+        pages += range(start, end + 1)
+        if end < last - on_ends:
+            pages.append(self.ELLIPSIS)
+        return pages + list(range(last - on_ends + 1, last + 1))
+
+
+class ApproximateCountPaginator(WindowedPaginator):
+    """Paginator, у которого count не дороже LIMIT-а.
+
+    Строки считаются по голому queryset, без JOIN-ов и колонок, и не
+    дальше EXACT_COUNT_LIMIT. Для всей таблицы (queryset без
+    фильтров) за этим порогом берётся TableCount — число строк, которое
+    держат триггеры, а пока оно в кэше, не нужен и этот LIMIT. Для
+    выборок count за порогом — оценка снизу, которую уточняет каждая
+    страница: лишняя строка в выборке значит, что строк больше,
+    её нехватка — что это конец.
+    """
+
+    @cached_property
+    def count(self):
+        rows = self.object_list.order_by().values('pk')
+        limit = settings.EXACT_COUNT_LIMIT
+        whole_table = counters.is_whole_table(rows)
+        if whole_table:
+            cached = counters.cached_table_count(rows.model)
+            if cached is not None and cached > limit:
+                return cached
+        count = rows[:limit + 1].count()
+        if count <= limit:
+            return count
+        if whole_table:
+            approximate = counters.approximate_count(rows.model)
+            if approximate is not None:
+                return max(approximate, count)
+        self.count_is_estimate = True
+        return count
+
+    def validate_number(self, number):
+        if not (self.count and self.count_is_estimate):
+            return super().validate_number(number)
+        # за оценкой страницы тоже есть, пока есть строки
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('Номер страницы не целое число')
+        if number < 1:
+            raise EmptyPage('Номер страницы меньше 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.count_is_estimate:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage('На этой странице нет результатов')
+        seen = bottom + len(rows)
+        if len(rows) > self.per_page:
+            self.__dict__['count'] = max(self.count, seen)
+        else:
+            self.__dict__['count'] = seen
+            self.count_is_estimate = False
+        self.__dict__.pop('num_pages', None)
+        return self._get_page(rows[:self.per_page], number, self)
+
+
+class FeedPaginator(ApproximateCountPaginator):
+    """Paginator ленты.
+
+    Если число постов уже известно из денормализованных счётчиков,
+    его передают в count и COUNT(*) не выполняется вовсе.
+    """
+
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        if count is not None:
+            self.__dict__['count'] = count
+
+
+def encode_cursor(obj, date_field='pub_date') -> str:
+    """Курсор — позиция строки в ленте: (дата, id)."""
+    raw = f'{getattr(obj, date_field).isoformat()}|{obj.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: str) -> tuple:
+    padding = '=' * (-len(token) % 4)
+    try:
+        raw = base64.urlsafe_b64decode(token + padding).decode()
+        pub_date, pk = raw.split('|')
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor(token)
+    if not isinstance(pub_date, datetime):
+        raise InvalidCursor(token)
+    return pub_date, pk
+
+
+class CursorPage(Sequence):
+    """Страница ленты без COUNT(*) и OFFSET.
+
+    Повторяет интерфейс django.core.paginator.Page, который нужен
+    шаблонам: has_next/has_previous, has_other_pages и итерацию.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self.object_list)} items>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next:
+            return encode_cursor(
+                self.object_list[-1], self.paginator.seek_fields[0]
+            )
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous:
+            return encode_cursor(
+                self.object_list[0], self.paginator.seek_fields[0]
+            )
+        return None
+
+
+class CursorPaginator:
+    """Keyset-пагинация по (pub_date, id).
+
+    Каждая страница — один запрос вида
+    WHERE (pub_date, id) < (:pub_date, :id) ORDER BY ... LIMIT n + 1,
+    поэтому её стоимость не зависит от глубины.
+    """
+    date_field = 'pub_date'
+    descending = True
+
+    def __init__(self, object_list, per_page, ordering=None):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        # поля (дата, id), по которым лента отсортирована, например
+        # timeline.TIMELINE_ORDERING
+        self.seek_fields = ordering or (self.date_field, 'pk')
+
+    @property
+    def ordering(self):
+        sign = '-' if self.descending else ''
+        return tuple(f'{sign}{field}' for field in self.seek_fields)
+
+    @property
+    def reverse_ordering(self):
+        sign = '' if self.descending else '-'
+        return tuple(f'{sign}{field}' for field in self.seek_fields)
+
+    def _seek(self, date, pk, forward):
+        """Строки дальше позиции (forward) или перед ней в порядке ленты.
+
+        Условие записано как date <= :date AND NOT (date = :date
+        AND pk >= :pk): диапазон по дате — один отрезок индекса
+        (…, pub_date, id), а не MULTI-INDEX OR с сортировкой.
+        """
+        before = forward == self.descending
+        date_field, pk_field = self.seek_fields
+        date_lookup = 'lte' if before else 'gte'
+        pk_lookup = 'gte' if before else 'lte'
+        return self.object_list.filter(
+            Q(**{f'{date_field}__{date_lookup}': date})
+            & ~Q(**{date_field: date, f'{pk_field}__{pk_lookup}': pk})
+        )
+
+    def get_page(self, after=None, before=None):
+        """Вернуть страницу; битый курсор ведёт на первую страницу."""
+        try:
+            if before:
+                return self._page_before(*decode_cursor(before))
+            if after:
+                return self._page_after(*decode_cursor(after))
+        except InvalidCursor:
+            pass
+        return self._first_page()
+
+    def _slice(self, queryset):
+        return list(queryset[:self.per_page + 1])
+
+    def _first_page(self):
+        rows = self._slice(self.object_list.order_by(*self.ordering))
+        return CursorPage(
+            rows[:self.per_page], self,
+            has_next=len(rows) > self.per_page,
+            has_previous=False,
+        )
+
+    def _page_after(self, date, pk):
+        rows = self._slice(
+            self._seek(date, pk, forward=True).order_by(*self.ordering)
+        )
+        return CursorPage(
+            rows[:self.per_page], self,
+            has_next=len(rows) > self.per_page,
+            has_previous=True,
+        )
+
+    def _page_before(self, date, pk):
+        rows = self._slice(
+            self._seek(date, pk, forward=False).order_by(
+                *self.reverse_ordering
+            )
+        )
+        if not rows:
+            return self._first_page()
+        page_rows = rows[:self.per_page]
+        page_rows.reverse()
+        return CursorPage(
+            page_rows, self,
+            has_next=True,
+            has_previous=len(rows) > self.per_page,
+        )
+
+
+class CommentPaginator(CursorPaginator):
+    """Комментарии от старых к новым, «показать ещё» — курсором after."""
+    date_field = 'created'
+    descending = False
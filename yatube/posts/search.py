@@ -0,0 +1,153 @@
+"""Полнотекстовый поиск по постам.
+
+На SQLite это виртуальная таблица FTS5 posts_post_fts (rowid = id
+поста): инвертированный индекс с ранжированием bm25 и подсветкой.
+Сигналы Post и импорт держат её в синхроне с posts_post. На других
+СУБД поиск сводится к icontains без ранжирования.
+"""
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from posts.feeds import feed_queryset
+from posts.models import Post
+
+FTS_TABLE = 'posts_post_fts'
+# Маркеры подсветки из области частного использования Unicode:
+# в тексте постов их нет, и они переживают экранирование HTML
+MARK_START = '\ue000'
+MARK_END = '\ue001'
+MAX_TERMS = 8
+SNIPPET_TOKENS = 24
+WORD = re.compile(r'\w+')
+
+
+def enabled() -> bool:
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(query: str) -> str:
+    """Запрос пользователя -> выражение MATCH без синтаксиса FTS5.
+
+    Каждое слово берётся в кавычки как префикс, слова связаны AND,
+    поэтому кавычки, скобки и NEAR из запроса не ломают разбор.
+    """
+    words = WORD.findall(query.lower())[:MAX_TERMS]
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def index_posts(posts):
+    """Переиндексировать посты: [(id, text), ...]."""
+    rows = [(post_id, text) for post_id, text in posts]
+    if not enabled() or not rows:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+            [(post_id,) for post_id, _ in rows],
+        )
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, text) VALUES (%s, %s)', rows
+        )
+
+
+def unindex_post(post_id):
+    if enabled():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id]
+            )
+
+
+def rebuild():
+    """Собрать индекс заново по всей таблице постов."""
+    if enabled():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, text) '
+                'SELECT id, text FROM posts_post'
+            )
+
+
+def matching(queryset, query):
+    """Отфильтровать queryset постов по индексу (для админки)."""
+    expression = match_expression(query)
+    if not expression:
+        return queryset.none()
+    if not enabled():
+        return queryset.filter(text__icontains=query)
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        (expression,),
+    ))
+
+
+def highlight(snippet: str):
+    """Фрагмент с маркерами -> безопасный HTML с <mark>."""
+    return mark_safe(
+        escape(snippet)
+        .replace(MARK_START, '<mark>')
+        .replace(MARK_END, '</mark>')
+    )
+
+
+class SearchResults:
+    """Ранжированная выдача для Paginator: count() и срезы.
+
+    Каждый срез — один запрос к индексу с LIMIT/OFFSET и один
+    запрос постов ленты по найденным id.
+    """
+
+    def __init__(self, query):
+        self.expression = match_expression(query)
+
+    def count(self):
+        if not self.expression:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT COUNT(*) FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s',
+                [self.expression],
+            )
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        if not self.expression:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid, snippet({FTS_TABLE}, 0, %s, %s, %s, %s) '
+                f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                'ORDER BY rank LIMIT %s OFFSET %s',
+                [
+                    MARK_START, MARK_END, '…', SNIPPET_TOKENS,
+                    self.expression,
+                    index.stop - index.start, index.start,
+                ],
+            )
+            snippets = dict(cursor.fetchall())
+        posts = feed_queryset(Post.objects.filter(pk__in=snippets)).in_bulk()
+        found = []
+        for post_id, snippet in snippets.items():
+            post = posts.get(post_id)
+            if post is not None:
+                post.snippet = highlight(snippet)
+                found.append(post)
+        return found
+
+
+def search_posts(query):
+    """Объект для Paginator: выдача индекса или, без FTS5, queryset."""
+    if enabled():
+        return SearchResults(query)
+    return matching(feed_queryset(), query)
@@ -0,0 +1,80 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from posts import counters, follow_graph, live, page_cache, search, timeline
+from posts.models import Comment, Follow, Post
+
+
+def comment_scopes(comment):
+    try:
+        return page_cache.post_scopes(comment.post)
+    except Post.DoesNotExist:
+        return [f'post:{comment.post_id}']
+
+
+@receiver(pre_save, sender=Post)
+def remember_group(sender, instance, **kwargs):
+    """Запомнить прежнюю группу, чтобы поправить счётчики при смене."""
+    instance._previous_group_id = None
+    if instance.pk is not None:
+        instance._previous_group_id = (
+            Post.objects.filter(pk=instance.pk)
+            .values_list('group_id', flat=True)
+            .first()
+        )
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    page_cache.invalidate(
+        *page_cache.post_scopes(instance, instance._previous_group_id)
+    )
+    search.index_posts([(instance.pk, instance.text)])
+    if created:
+        counters.bump_author(instance.author_id, 'posts_count', 1)
+        counters.bump_group(instance.group_id, 1)
+        timeline.fan_out_post(instance)
+        live.announce_post(instance)
+    elif instance._previous_group_id != instance.group_id:
+        counters.bump_group(instance._previous_group_id, -1)
+        counters.bump_group(instance.group_id, 1)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    page_cache.invalidate(*page_cache.post_scopes(instance))
+    search.unindex_post(instance.pk)
+    counters.bump_author(instance.author_id, 'posts_count', -1)
+    counters.bump_group(instance.group_id, -1)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_post_comments(instance.post_id, 1)
+    page_cache.invalidate(*comment_scopes(instance))
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.bump_post_comments(instance.post_id, -1)
+    page_cache.invalidate(*comment_scopes(instance))
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_author(instance.author_id, 'followers_count', 1)
+        counters.bump_author(instance.user_id, 'following_count', 1)
+        timeline.backfill(instance.user_id, instance.author_id)
+        follow_graph.invalidate(instance.user_id)
+        page_cache.invalidate(f'follow:{instance.user_id}')
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.bump_author(instance.author_id, 'followers_count', -1)
+    counters.bump_author(instance.user_id, 'following_count', -1)
+    timeline.purge(instance.user_id, instance.author_id)
+    follow_graph.invalidate(instance.user_id)
+    page_cache.invalidate(f'follow:{instance.user_id}')
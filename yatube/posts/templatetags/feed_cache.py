@@ -0,0 +1,41 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+
+from core import metrics
+
+register = template.Library()
+
+
+class FeedCacheNode(template.Node):
+    def __init__(self, nodelist, key):
+        self.nodelist = nodelist
+        self.key = key
+
+    def render(self, context):
+        key = self.key.resolve(context)
+        if not key:
+            return self.nodelist.render(context)
+        content = cache.get(key)
+        # попадания и промахи считает core.metrics в памяти процесса:
+        # счётчик в общем кэше брал бы блокировку записи на каждый рендер
+        metrics.cache_lookup(content is not None)
+        if content is None:
+            content = self.nodelist.render(context)
+            cache.set(key, content, settings.FEED_CACHE_TTL)
+        return content
+
+
+@register.tag
+def feedcache(parser, token):
+    """{% feedcache feed_cache_key %} ... {% endfeedcache %}
+
+    Ключ строит posts.page_cache.page_key: в нём версия области,
+    которую сбрасывают сигналы Post и Comment.
+    """
+    bits = token.split_contents()
+    if len(bits) != 2:
+        raise template.TemplateSyntaxError(f'{bits[0]} ожидает ключ')
+    nodelist = parser.parse(('endfeedcache',))
+    parser.delete_first_token()
+    return FeedCacheNode(nodelist, parser.compile_filter(bits[1]))
@@ -0,0 +1,412 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+import json
+import threading
+
+from django.conf import settings
+from django.test import (
+    Client, TestCase, TransactionTestCase, override_settings,
+)
+from django.urls import reverse
+
+from core import pubsub
+from core.asgi import ENVIRON_KEY
+from .. import counters, follow_graph, follows
+from ..models import Comment, Follow, Group, Post, TimelineEntry
+
+
+User = get_user_model()
+
+
+class FeedApiTests(TestCase):
+    """JSON-ленты и условные GET-запросы."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='api-reader')
+        cls.author = User.objects.create_user(
+            username='api-writer', first_name='Имя', last_name='Фамилия'
+        )
+        cls.group = Group.objects.create(
+            title='Группа API', slug='api-group', description='Описание'
+        )
+        for number in range(3):
+            cls.post = Post.objects.create(
+                text=f'Пост {number}', author=cls.author, group=cls.group
+            )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.guest = Client()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_feeds_return_posts(self):
+        urls = (
+            reverse('posts:api_index'),
+            reverse('posts:api_group_posts', kwargs={'slug': 'api-group'}),
+            reverse('posts:api_profile', kwargs={'username': 'api-writer'}),
+            reverse('posts:api_follow_index'),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.reader_client.get(url)
+                self.assertEqual(response.status_code, 200)
+                data = response.json()
+                self.assertEqual(len(data['results']), 3)
+                self.assertEqual(data['results'][0]['id'], self.post.pk)
+                self.assertEqual(
+                    data['results'][0]['author']['full_name'], 'Имя Фамилия'
+                )
+                self.assertEqual(
+                    data['results'][0]['group']['slug'], 'api-group'
+                )
+                self.assertTrue(response.has_header('ETag'))
+                self.assertTrue(response.has_header('Last-Modified'))
+
+    def test_post_detail(self):
+        response = self.guest.get(
+            reverse('posts:api_post_detail', kwargs={'post_id': self.post.pk})
+        )
+        self.assertEqual(response.json()['text'], 'Пост 2')
+        response = self.guest.get(
+            reverse('posts:api_post_detail', kwargs={'post_id': 10 ** 6})
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_not_modified_skips_serialization(self):
+        url = reverse('posts:api_index')
+        etag = self.guest.get(url)['ETag']
+        self.assertTrue(etag.startswith('"'))
+        # только MAX(pub_date): посты не выбираются
+        with self.assertNumQueries(1):
+            response = self.guest.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_if_modified_since(self):
+        url = reverse('posts:api_profile', kwargs={'username': 'api-writer'})
+        last_modified = self.guest.get(url)['Last-Modified']
+        response = self.guest.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes_with_feed(self):
+        url = reverse('posts:api_index')
+        etag = self.guest.get(url)['ETag']
+        self.post.text = 'Исправленный пост'
+        self.post.save()
+        response = self.guest.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        etag = response['ETag']
+        Post.objects.create(text='Новый пост', author=self.author)
+        response = self.guest.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['text'], 'Новый пост')
+
+    def test_follow_etag_changes_on_unfollow(self):
+        url = reverse('posts:api_follow_index')
+        etag = self.reader_client.get(url)['ETag']
+        Follow.objects.filter(user=self.reader).delete()
+        response = self.reader_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+
+    def test_follow_cursor_pages(self):
+        """Курсор ленты подписок ищет позицию по колонкам TimelineEntry."""
+        for _ in range(settings.POST_COUNT - 2):
+            Post.objects.create(text='Ещё пост', author=self.author)
+        url = reverse('posts:api_follow_index')
+        first = self.reader_client.get(url).json()
+        second = self.reader_client.get(url, {'after': first['next']}).json()
+        self.assertEqual([post['text'] for post in second['results']],
+                         ['Пост 0'])
+        self.assertIsNone(second['next'])
+        back = self.reader_client.get(url, {'before': second['previous']})
+        self.assertEqual(back.json()['results'], first['results'])
+
+    def test_follow_requires_login(self):
+        response = self.guest.get(reverse('posts:api_follow_index'))
+        self.assertEqual(response.status_code, 401)
+
+    def test_cursor_pages(self):
+        for _ in range(settings.POST_COUNT - 2):
+            Post.objects.create(text='Ещё пост', author=self.author)
+        url = reverse('posts:api_index')
+        first = self.guest.get(url).json()
+        self.assertIsNone(first['previous'])
+        second = self.guest.get(url, {'after': first['next']})
+        data = second.json()
+        self.assertEqual([post['text'] for post in data['results']],
+                         ['Пост 0'])
+        self.assertIsNone(data['next'])
+        self.assertNotEqual(second['ETag'], self.guest.get(url)['ETag'])
+
+    def test_post_comments_load_more(self):
+        for number in range(settings.COMMENTS_PER_PAGE + 1):
+            Comment.objects.create(
+                post=self.post,
+                author=self.reader,
+                text=f'Комментарий {number}',
+            )
+        url = reverse(
+            'posts:api_post_comments', kwargs={'post_id': self.post.pk}
+        )
+        first = self.guest.get(url).json()
+        self.assertEqual(len(first['results']), settings.COMMENTS_PER_PAGE)
+        self.assertEqual(first['results'][0]['text'], 'Комментарий 0')
+        self.assertEqual(
+            first['results'][0]['author']['username'], 'api-reader'
+        )
+        second = self.guest.get(url, {'after': first['next']}).json()
+        self.assertEqual(
+            [comment['text'] for comment in second['results']],
+            [f'Комментарий {settings.COMMENTS_PER_PAGE}'],
+        )
+        self.assertIsNone(second['next'])
+
+    def test_post_comments_etag_changes_with_new_comment(self):
+        url = reverse(
+            'posts:api_post_comments', kwargs={'post_id': self.post.pk}
+        )
+        etag = self.guest.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.guest.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Новый комментарий'
+        )
+        response = self.guest.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()['results'][0]['text'], 'Новый комментарий'
+        )
+
+
+@override_settings(
+    FOLLOW_POLL_TIMEOUT=5,
+    FOLLOW_STREAM_ENABLED=True,
+    FOLLOW_STREAM_HEARTBEAT=0.01,
+)
+class FollowUpdatesTests(TestCase):
+    """Long-poll и SSE с новыми постами подписок."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='live-reader')
+        cls.author = User.objects.create_user(username='live-writer')
+        cls.other = User.objects.create_user(username='live-other')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.post = Post.objects.create(text='Пост', author=cls.author)
+
+    def setUp(self):
+        self.client.force_login(self.reader)
+
+    def publish_later(self, author, post_id):
+        timer = threading.Timer(0.05, pubsub.broker().publish, args=(
+            f'author:{author.pk}', {'id': post_id, 'author': author.pk}
+        ))
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+    def test_missed_posts_returned_immediately(self):
+        newer = Post.objects.create(text='Новый пост', author=self.author)
+        Post.objects.create(text='Чужой пост', author=self.other)
+        response = self.client.get(
+            reverse('posts:api_follow_updates'), {'after': self.post.pk}
+        )
+        self.assertEqual(
+            response.json(),
+            {'posts': [{'id': newer.pk, 'author': self.author.pk}],
+             'last': newer.pk,
+             'poll': settings.FOLLOW_POLL_INTERVAL},
+        )
+
+    def test_wsgi_poll_does_not_wait(self):
+        self.publish_later(self.author, 1000)
+        response = self.client.get(
+            reverse('posts:api_follow_updates'), {'after': self.post.pk}
+        )
+        self.assertEqual(response.json()['posts'], [])
+        # без after клиент узнаёт, с какого поста опрашивать
+        response = self.client.get(reverse('posts:api_follow_updates'))
+        self.assertEqual(
+            response.json(),
+            {'posts': [], 'last': self.post.pk,
+             'poll': settings.FOLLOW_POLL_INTERVAL},
+        )
+
+    def test_asgi_poll_waits_for_publication(self):
+        self.publish_later(self.other, 999)
+        self.publish_later(self.author, 1000)
+        response = self.client.get(
+            reverse('posts:api_follow_updates'), {'after': self.post.pk},
+            **{ENVIRON_KEY: True},
+        )
+        self.assertEqual(response.json(), {
+            'posts': [{'id': 1000, 'author': self.author.pk}],
+            'last': 1000,
+            'poll': 0,
+        })
+
+    def test_poll_rejects_bad_cursor(self):
+        response = self.client.get(
+            reverse('posts:api_follow_updates'), {'after': 'x'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_stream_sends_events(self):
+        newer = Post.objects.create(text='Новый пост', author=self.author)
+        response = self.client.get(
+            reverse('posts:api_follow_stream'),
+            HTTP_LAST_EVENT_ID=str(self.post.pk),
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = iter(response.streaming_content)
+        self.assertEqual(next(events), b'retry: 3000\n\n')
+        self.assertIn(f'id: {newer.pk}\n'.encode(), next(events))
+        self.assertEqual(next(events), b': ping\n\n')
+        pubsub.broker().publish(
+            f'author:{self.author.pk}', {'id': 1000, 'author': self.author.pk}
+        )
+        self.assertIn(b'id: 1000\nevent: post\n', next(events))
+        response.close()
+        self.assertNotIn(
+            f'author:{self.author.pk}', pubsub.broker().subscribers
+        )
+
+    def test_stream_disabled_by_default(self):
+        """Без настройки страница ждёт посты long-poll-ом, поток закрыт."""
+        with self.settings(FOLLOW_STREAM_ENABLED=False):
+            response = self.client.get(reverse('posts:api_follow_stream'))
+            self.assertEqual(response.status_code, 404)
+            page = self.client.get(reverse('posts:follow_index'))
+        self.assertNotContains(page, 'EventSource(')
+        self.assertContains(page, reverse('posts:api_follow_updates'))
+        self.assertContains(page, f'data-after="{self.post.pk}"')
+
+    def test_guest_gets_401(self):
+        self.client.logout()
+        for name in ('posts:api_follow_updates', 'posts:api_follow_stream'):
+            with self.subTest(name=name):
+                response = self.client.get(reverse(name))
+                self.assertEqual(response.status_code, 401)
+
+
+class FollowBatchTests(TestCase):
+    """Подписка и отписка пачкой через api/follow/batch/."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='batch-reader')
+        cls.authors = [
+            User.objects.create_user(username=f'batch-author-{number}')
+            for number in range(3)
+        ]
+        cls.post = Post.objects.create(text='Пост', author=cls.authors[0])
+        Follow.objects.create(user=cls.reader, author=cls.authors[2])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+        self.url = reverse('posts:api_follow_batch')
+
+    def post_batch(self, data):
+        return self.client.post(
+            self.url, json.dumps(data), content_type='application/json'
+        )
+
+    def test_follow_and_unfollow(self):
+        counters.rebuild_counters(counters.stale_counters())
+        names = [author.username for author in self.authors]
+        response = self.post_batch({
+            'follow': names[:2] + ['batch-reader', 'nobody'],
+            'unfollow': names[2:],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'followed': names[:2],
+            'unfollowed': names[2:],
+            'unknown': ['nobody'],
+            'following_count': 2,
+        })
+        self.assertEqual(
+            set(self.reader.follower.values_list('author', flat=True)),
+            {self.authors[0].pk, self.authors[1].pk},
+        )
+        # ленты, счётчики и кэш подписок поправлены без сигналов
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=self.post
+        ).exists())
+        self.assertFalse(counters.stale_counters()['authors'].exists())
+        self.assertTrue(
+            follow_graph.is_following(self.reader.pk, self.authors[0].pk)
+        )
+        # повтор ничего не меняет
+        response = self.post_batch({'follow': names[:2]})
+        self.assertEqual(response.json()['followed'], [])
+        response = self.post_batch({'unfollow': names[:1]})
+        self.assertEqual(response.json()['unfollowed'], names[:1])
+        self.assertFalse(TimelineEntry.objects.filter(
+            user=self.reader, post=self.post
+        ).exists())
+        self.assertFalse(counters.stale_counters()['authors'].exists())
+
+    @override_settings(TIMELINE_BACKFILL_SIZE=1)
+    def test_batch_queries_do_not_grow_with_authors(self):
+        newer = Post.objects.create(text='Новый', author=self.authors[0])
+        Post.objects.create(text='Пост', author=self.authors[1])
+        readers = [
+            User.objects.create_user(username=f'batch-reader-{number}')
+            for number in range(2)
+        ]
+        author_ids = [author.pk for author in self.authors]
+        with self.assertNumQueries(9):
+            follows.follow_many(readers[0].pk, author_ids[:1])
+        with self.assertNumQueries(9):
+            follows.follow_many(readers[1].pk, author_ids)
+        # по TIMELINE_BACKFILL_SIZE последних постов каждого автора
+        self.assertEqual(
+            set(readers[1].timeline_entries.values_list('post', flat=True)),
+            {newer.pk, self.authors[1].posts.get().pk},
+        )
+        with self.assertNumQueries(7):
+            follows.unfollow_many(readers[1].pk, author_ids)
+        self.assertFalse(readers[1].timeline_entries.exists())
+        self.assertFalse(readers[1].follower.exists())
+
+    def test_bad_requests(self):
+        for body in ('не json', '[]', '{"follow": "batch-author-0"}'):
+            with self.subTest(body=body):
+                response = self.client.post(
+                    self.url, body, content_type='application/json'
+                )
+                self.assertEqual(response.status_code, 400)
+        response = self.post_batch(
+            {'follow': ['batch-author-0'], 'unfollow': ['batch-author-0']}
+        )
+        self.assertEqual(response.status_code, 400)
+        with self.settings(FOLLOW_BATCH_LIMIT=1):
+            response = self.post_batch(
+                {'follow': ['batch-author-0', 'batch-author-1']}
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+        self.client.logout()
+        self.assertEqual(self.post_batch({}).status_code, 401)
+
+
+class AnnouncePostTests(TransactionTestCase):
+    def test_new_post_published_after_commit(self):
+        author = User.objects.create_user(username='announcer')
+        channel = f'author:{author.pk}'
+        with pubsub.broker().subscribe([channel]) as updates:
+            post = Post.objects.create(text='Пост', author=author)
+            self.assertEqual(
+                updates.get(timeout=1),
+                [(channel, {'id': post.pk, 'author': author.pk})],
+            )
@@ -0,0 +1,330 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .. import benchmark, search
+from ..management.commands.explain_views import view_queries
+from ..models import (
+    AuthorStats, Comment, Follow, Group, Post, TableCount, TimelineEntry,
+)
+
+
+User = get_user_model()
+
+
+class ExplainViewsCommandTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='explain_user')
+        cls.author = User.objects.create_user(username='explain_author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='explain-group', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            text='Текст', author=cls.author, group=cls.group
+        )
+        Comment.objects.create(post=cls.post, author=cls.user, text='Текст')
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def test_view_queries_use_indexes(self):
+        """Запросы представлений не сканируют таблицы целиком."""
+        out = StringIO()
+        call_command('explain_views', stdout=out)
+        self.assertIn('Полных сканирований нет.', out.getvalue())
+
+    def test_follow_feed_is_index_range(self):
+        """Лента подписок читается отрезком индекса, без сортировки."""
+        plan = view_queries()['follow_index'].explain()
+        self.assertIn('timeline_user_feed_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_post_detail_queries_match_view(self):
+        """EXPLAIN получает те же запросы, что выполняет post_detail."""
+        client = Client()
+        client.force_login(self.user)
+        url = reverse('posts:post_detail', args=[self.post.pk])
+        with CaptureQueriesContext(connection) as served:
+            client.get(url)
+        served = [query['sql'] for query in served.captured_queries]
+        queries = view_queries()
+        for name in ('post_detail', 'post_detail comments'):
+            with self.subTest(query=name):
+                with CaptureQueriesContext(connection) as explained:
+                    list(queries[name])
+                self.assertIn(explained.captured_queries[0]['sql'], served)
+
+
+class RebuildCountersCommandTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='counter_author')
+        cls.reader = User.objects.create_user(username='counter_reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='counter-group', description='Описание'
+        )
+
+    def test_counters_follow_writes(self):
+        """Счётчики меняются вместе с постами, комментариями и подписками."""
+        post = Post.objects.create(
+            text='Текст', author=self.author, group=self.group
+        )
+        Comment.objects.create(post=post, author=self.reader, text='Текст')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        call_command('rebuild_counters', stdout=StringIO())
+        post.refresh_from_db()
+        self.group.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(self.author.stats.followers_count, 1)
+        follow.delete()
+        post.delete()
+        self.group.refresh_from_db()
+        self.author.stats.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 0)
+        self.assertEqual(self.author.stats.posts_count, 0)
+        self.assertEqual(self.author.stats.followers_count, 0)
+        call_command('rebuild_counters', '--check', stdout=StringIO())
+
+    def test_check_reports_and_rebuild_fixes_drift(self):
+        """--check находит расхождение, без флага команда его исправляет."""
+        Post.objects.bulk_create([
+            Post(text='Текст', author=self.author, group=self.group)
+        ])
+        with self.assertRaises(CommandError):
+            call_command('rebuild_counters', '--check', stdout=StringIO())
+        call_command('rebuild_counters', stdout=StringIO())
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 1)
+        call_command('rebuild_counters', '--check', stdout=StringIO())
+
+    def test_delete_with_zero_counter(self):
+        """Удаление строки, чей счётчик уже ноль, не нарушает CHECK."""
+        # bulk_create не шлёт сигналы: счётчики остаются нулями
+        Post.objects.bulk_create([
+            Post(text='Текст', author=self.author, group=self.group)
+        ])
+        post = Post.objects.get()
+        Comment.objects.bulk_create([
+            Comment(post=post, author=self.reader, text='Текст')
+        ])
+        Follow.objects.bulk_create(
+            [Follow(user=self.reader, author=self.author)]
+        )
+        for user in (self.author, self.reader):
+            AuthorStats.objects.create(user=user)
+        Comment.objects.get().delete()
+        post.delete()
+        Follow.objects.get().delete()
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 0)
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.author).posts_count, 0
+        )
+
+
+class TableCountTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(
+            username='table_author', is_staff=True, is_superuser=True
+        )
+
+    def rows(self, model):
+        return TableCount.objects.get(table=model._meta.db_table).rows
+
+    def test_triggers_follow_writes(self):
+        """Триггеры ведут число строк и при bulk_create, и при удалении."""
+        Post.objects.bulk_create(
+            Post(text='Текст', author=self.author) for _ in range(3)
+        )
+        post = Post.objects.create(text='Текст', author=self.author)
+        Comment.objects.create(post=post, author=self.author, text='Текст')
+        self.assertEqual(self.rows(Post), 4)
+        self.assertEqual(self.rows(Comment), 1)
+        post.delete()
+        self.assertEqual(self.rows(Post), 3)
+        self.assertEqual(self.rows(Comment), 0)
+
+    def test_refresh_fixes_drift(self):
+        Post.objects.create(text='Текст', author=self.author)
+        TableCount.objects.update(rows=100)
+        out = StringIO()
+        call_command('refresh_table_counts', stdout=out)
+        self.assertIn(f'{Post._meta.db_table}: 1', out.getvalue())
+        self.assertEqual(self.rows(Post), 1)
+
+    def test_admin_changelist(self):
+        Post.objects.create(text='Текст', author=self.author)
+        self.client.force_login(self.author)
+        response = self.client.get(reverse('admin:posts_post_changelist'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Текст')
+
+
+class ImportExportCommandTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='bulk_reader')
+        cls.author = User.objects.create_user(username='bulk_author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='bulk-group', description='Описание'
+        )
+        for number in range(5):
+            post = Post.objects.create(
+                text=f'Пост "{number}",\nс запятой',
+                author=cls.author,
+                group=cls.group if number % 2 else None,
+            )
+            Comment.objects.create(
+                post=post, author=cls.reader, text='Комментарий'
+            )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def dump(self, table, path):
+        call_command(
+            'export_data', table, output=path, batch_size=2, stderr=StringIO()
+        )
+
+    def load(self, table, path):
+        call_command('import_data', table, path, batch_size=2,
+                     stdout=StringIO())
+
+    def test_round_trip(self):
+        """Выгрузка и загрузка сохраняют строки, даты и ленты."""
+        before = {
+            'posts': list(Post.objects.order_by('pk').values_list(
+                'pk', 'text', 'pub_date', 'author_id', 'group_id')),
+            'comments': list(Comment.objects.order_by('pk').values_list(
+                'pk', 'post_id', 'text', 'created')),
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            paths = {
+                'posts': os.path.join(directory, 'posts.csv'),
+                'comments': os.path.join(directory, 'comments.ndjson'),
+                'follows': os.path.join(directory, 'follows.ndjson'),
+            }
+            for table, path in paths.items():
+                self.dump(table, path)
+            Follow.objects.all().delete()
+            Post.objects.all().delete()
+            for table, path in paths.items():
+                self.load(table, path)
+        self.assertEqual(
+            list(Post.objects.order_by('pk').values_list(
+                'pk', 'text', 'pub_date', 'author_id', 'group_id')),
+            before['posts'],
+        )
+        self.assertEqual(
+            list(Comment.objects.order_by('pk').values_list(
+                'pk', 'post_id', 'text', 'created')),
+            before['comments'],
+        )
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 5
+        )
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 2)
+        self.assertEqual(
+            set(Post.objects.values_list('comment_count', flat=True)), {1}
+        )
+
+    def test_ignored_conflicts_are_not_post_processed(self):
+        """Пропущенные строки не попадают ни в поиск, ни в ленты."""
+        post = Post.objects.first()
+        other = User.objects.create_user(username='bulk_other')
+        Follow.objects.create(user=self.reader, author=other)
+        rows = [
+            {'id': post.pk, 'text': 'Чужой текст', 'author_id': other.pk,
+             'group_id': None, 'pub_date': '2020-01-01T00:00:00Z',
+             'image': ''},
+        ]
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson') as source:
+            source.write(''.join(json.dumps(row) + '\n' for row in rows))
+            source.flush()
+            call_command('import_data', 'posts', source.name,
+                         '--ignore-conflicts', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertNotEqual(post.text, 'Чужой текст')
+        self.assertEqual(list(search.search_posts('Чужой')), [])
+        self.assertIn(post, list(search.search_posts('запятой')))
+        self.assertFalse(TimelineEntry.objects.filter(
+            user=self.reader, author=other
+        ).exists())
+
+    def test_export_reports_progress(self):
+        stderr = StringIO()
+        stdout = StringIO()
+        with mock.patch('sys.stdout', stdout):
+            call_command(
+                'export_data', 'posts', batch_size=2, stderr=stderr
+            )
+        self.assertEqual(len(stdout.getvalue().splitlines()), 5)
+        self.assertIn('posts: 4 строк', stderr.getvalue())
+        self.assertIn('строк/с', stderr.getvalue())
+
+    def test_bad_row_is_reported(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson') as source:
+            source.write('{"id": 1, "title": "Без slug"}\n')
+            source.flush()
+            with self.assertRaisesMessage(CommandError, 'нет колонок: slug'):
+                self.load('groups', source.name)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(dir=settings.BASE_DIR))
+class BenchmarkTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_seed_and_run(self):
+        dataset = benchmark.seed(
+            users=8, posts=30, comments=10, groups=2, images=1
+        )
+        self.assertEqual(Post.objects.count(), 30)
+        self.assertEqual(Follow.objects.count(), dataset['follows'])
+        results = benchmark.run(requests=3, warmup=1, memory_samples=1)
+        self.assertEqual(set(results), set(benchmark.VIEWS))
+        for view, result in results.items():
+            with self.subTest(view=view):
+                self.assertEqual(result['requests'], 3)
+                self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+                self.assertGreater(result['queries_max'], 0)
+                self.assertGreater(result['alloc_peak_kb'], 0)
+
+    def test_compare_reports_p95_regressions(self):
+        baseline = {'results': {'index': {'p95_ms': 10.0}}}
+        self.assertEqual(
+            benchmark.compare({'index': {'p95_ms': 13.0}}, baseline, 0.2),
+            [('index', 10.0, 13.0)],
+        )
+        self.assertEqual(
+            benchmark.compare({'index': {'p95_ms': 11.0}}, baseline, 0.2), []
+        )
+
+    def test_render_index_without_queries(self):
+        with self.assertNumQueries(0):
+            results = benchmark.render_index(sizes=(2, 5), repeat=2, warmup=1)
+        self.assertEqual(list(results), ['2', '5'])
+        renders = {
+            name: template['renders']
+            for name, template in results['5']['templates'].items()
+        }
+        self.assertEqual(renders['posts/includes/post_image.html'], 5)
+        self.assertEqual(renders['posts/index.html'], 1)
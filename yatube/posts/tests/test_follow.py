@@ -1,8 +1,13 @@
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.urls import reverse
 
-from posts.models import Follow, Post
+from posts import follow_graph
+from posts.feeds import feed_queryset
+from posts.models import Follow, Post, TimelineEntry
+from posts.paginators import CursorPaginator
+from posts.timeline import TIMELINE_ORDERING, timeline_posts
 
 User = get_user_model()
 
@@ -74,3 +79,166 @@ class FollowPagesTests(TestCase):
         response = self.unfollower_client.get(reverse('posts:follow_index'))
         new_count_posts = len(response.context['page_obj'])
         self.assertEqual(count_posts, new_count_posts)
+
+
+@override_settings(TIMELINE_FANOUT_LIMIT=1)
+class HybridTimelineTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.other_reader = User.objects.create_user(username='other_reader')
+        cls.author = User.objects.create_user(username='author')
+        cls.star = User.objects.create_user(username='star')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        Follow.objects.create(user=cls.reader, author=cls.star)
+        Follow.objects.create(user=cls.other_reader, author=cls.star)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def test_post_fanned_out_on_write(self):
+        """Пост обычного автора попадает в материализованную ленту."""
+        post = Post.objects.create(author=self.author, text='Текст')
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=post
+        ).exists())
+
+    def test_popular_author_read_on_request(self):
+        """Посты популярного автора читаются при запросе ленты."""
+        post = Post.objects.create(author=self.star, text='Текст')
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertIn(post, response.context['page_obj'])
+
+    def test_sources_merged_page_by_page(self):
+        """Источники гибридной ленты читаются отрезками индексов
+        и сливаются в общий порядок при любой пагинации."""
+        for number in range(7):
+            for author in (self.author, self.star):
+                Post.objects.create(author=author, text=f'Текст {number}')
+        expected = list(
+            Post.objects.order_by('-pub_date', '-pk')
+            .values_list('pk', flat=True)
+        )
+        url = reverse('posts:follow_index')
+        first = self.client.get(url).context['page_obj']
+        second = self.client.get(url, {'page': 2}).context['page_obj']
+        self.assertEqual(first.paginator.count, len(expected))
+        self.assertEqual(
+            [post.pk for post in first] + [post.pk for post in second],
+            expected,
+        )
+        with self.settings(FEED_PAGINATION='cursor'):
+            first = self.client.get(url).context['page_obj']
+            second = self.client.get(
+                url, {'after': first.next_cursor}
+            ).context['page_obj']
+        self.assertEqual(
+            [post.pk for post in first] + [post.pk for post in second],
+            expected,
+        )
+        paginator = CursorPaginator(
+            feed_queryset(timeline_posts(self.reader), TIMELINE_ORDERING),
+            10, TIMELINE_ORDERING,
+        )
+        plan = paginator._seek(
+            first[-1].pub_date, first[-1].pk, forward=True
+        ).order_by(*paginator.ordering)[:11].explain()
+        self.assertIn('timeline_user_feed_idx', plan)
+        self.assertIn('post_author_pub_date_idx', plan)
+        self.assertNotIn('MULTI-INDEX OR', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+        response = self.client.get(reverse('posts:api_follow_index'))
+        self.assertEqual(
+            [post['id'] for post in response.json()['results']],
+            expected[:10],
+        )
+
+    def test_unfollow_purges_timeline(self):
+        """Отписка чистит ленту, повторная подписка заполняет её снова."""
+        post = Post.objects.create(author=self.author, text='Текст')
+        self.client.get(
+            reverse('posts:profile_unfollow', args=[self.author.username])
+        )
+        self.assertFalse(TimelineEntry.objects.filter(
+            user=self.reader, post=post
+        ).exists())
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=post
+        ).exists())
+
+
+class FollowGraphTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        cls.friend = User.objects.create_user(username='friend')
+        cls.stranger = User.objects.create_user(
+            username='stranger', first_name='Имя', last_name='Фамилия'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        Follow.objects.create(user=cls.reader, author=cls.friend)
+        Follow.objects.create(user=cls.author, author=cls.stranger)
+        Follow.objects.create(user=cls.friend, author=cls.stranger)
+        Follow.objects.create(user=cls.friend, author=cls.reader)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def test_following_set_cached(self):
+        self.assertTrue(
+            follow_graph.is_following(self.reader.pk, self.author.pk)
+        )
+        with self.assertNumQueries(0):
+            self.assertFalse(
+                follow_graph.is_following(self.reader.pk, self.stranger.pk)
+            )
+            self.assertEqual(
+                list(follow_graph.following_ids(self.reader.pk)),
+                sorted([self.author.pk, self.friend.pk]),
+            )
+
+    def test_profile_follow_and_unfollow_invalidate(self):
+        """Кнопка подписки на профиле следует за подпиской и отпиской."""
+        url = reverse('posts:profile', args=[self.stranger.username])
+        self.assertFalse(self.client.get(url).context['following'])
+        self.client.get(
+            reverse('posts:profile_follow', args=[self.stranger.username])
+        )
+        response = self.client.get(url)
+        self.assertTrue(response.context['following'])
+        self.assertEqual(response.context['follow_counts']['followers'], 3)
+        self.client.get(
+            reverse('posts:profile_unfollow', args=[self.stranger.username])
+        )
+        self.assertFalse(self.client.get(url).context['following'])
+
+    def test_suggestions(self):
+        """Предлагаются авторы подписок, кроме себя и уже знакомых."""
+        self.assertEqual(
+            follow_graph.suggestions(self.reader.pk), [(self.stranger.pk, 2)]
+        )
+        response = self.client.get(reverse('posts:api_follow_suggestions'))
+        self.assertEqual(response.json()['results'], [{
+            'username': 'stranger', 'name': 'Имя Фамилия', 'followed_by': 2,
+        }])
+
+    def test_invalidate_all(self):
+        follow_graph.following_ids(self.reader.pk)
+        Follow.objects.bulk_create(
+            [Follow(user=self.reader, author=self.stranger)]
+        )
+        follow_graph.invalidate_all()
+        self.assertTrue(
+            follow_graph.is_following(self.reader.pk, self.stranger.pk)
+        )
@@ -1,16 +1,25 @@
 import tempfile
+from io import StringIO
 
 from django.contrib.auth import get_user_model
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.conf import settings
+from django.core.management import call_command
 
+from .. import thumbnails
 from ..models import Group, Post, Comment
 from ..forms import PostForm
 
 User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (b'\x47\x49\x46\x38\x39\x61\x02\x00'
+             b'\x01\x00\x80\x00\x00\x00\x00\x00'
+             b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+             b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+             b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+             b'\x0A\x00\x3B')
 
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
@@ -147,3 +156,94 @@ class PostFormFormTests(TestCase):
             follow=True
         )
         self.assertEqual(Comment.objects.count(), comment_count)
+
+    def test_thumbnail_generated_and_rendered(self):
+        """Миниатюра сохраняется в посте и выводится без sorl."""
+        uploaded = SimpleUploadedFile(
+            name='thumb.gif',
+            content=SMALL_GIF,
+            content_type='image/gif')
+        self.authorized_author.post(
+            reverse('posts:create_post'),
+            data={'text': 'Пост с картинкой', 'image': uploaded},
+        )
+        post = Post.objects.get(text='Пост с картинкой')
+        self.assertEqual(post.thumbnail_url, '')
+        url = thumbnails.generate(post.pk)
+        post.refresh_from_db()
+        self.assertTrue(url)
+        self.assertEqual(post.thumbnail_url, url)
+        self.assertIn('image/webp', post.image_sources)
+        self.assertIn('320w', post.image_sources)
+        response = self.authorized_author.get(reverse('posts:index'))
+        self.assertContains(response, url)
+        self.assertContains(response, 'srcset=')
+
+    def test_clearing_image_drops_sources(self):
+        """Без картинки пост не ссылается на её миниатюру и srcset."""
+        post = Post.objects.create(
+            text='Пост с картинкой',
+            author=self.author,
+            image=SimpleUploadedFile('clear.gif', SMALL_GIF, 'image/gif'),
+        )
+        thumbnails.generate(post.pk)
+        self.authorized_author.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+            data={'text': post.text, 'image-clear': 'on'},
+        )
+        post.refresh_from_db()
+        self.assertFalse(post.image)
+        self.assertEqual(post.thumbnail_url, '')
+        self.assertEqual(post.sources, [])
+        response = self.authorized_author.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'srcset=')
+
+    @override_settings(POST_IMAGE_MAX_BYTES=10)
+    def test_oversized_upload_rejected(self):
+        """Файл больше лимита обрывается обработчиком загрузки."""
+        posts_count = Post.objects.count()
+        response = self.authorized_author.post(
+            reverse('posts:create_post'),
+            data={
+                'text': 'Слишком большой файл',
+                'image': SimpleUploadedFile('big.gif', SMALL_GIF, 'image/gif'),
+            },
+        )
+        self.assertEqual(Post.objects.count(), posts_count)
+        self.assertFormError(
+            response, 'form', 'image', 'Файл больше 10\xa0байт.'
+        )
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=1)
+    def test_upload_with_too_many_pixels_rejected(self):
+        """Разрешение проверяется по заголовку, до декодирования."""
+        response = self.authorized_author.post(
+            reverse('posts:create_post'),
+            data={
+                'text': 'Слишком большая картинка',
+                'image': SimpleUploadedFile('px.gif', SMALL_GIF, 'image/gif'),
+            },
+        )
+        self.assertFalse(
+            Post.objects.filter(text='Слишком большая картинка').exists()
+        )
+        self.assertIn(
+            'Разрешение 2x1', response.context['form'].errors['image'][0]
+        )
+
+    def test_derivatives_backfill_command(self):
+        """Команда делает производные для уже загруженных картинок."""
+        post = Post.objects.create(
+            text='Старый пост',
+            author=self.author,
+            image=SimpleUploadedFile('old.gif', SMALL_GIF, 'image/gif'),
+        )
+        call_command('build_image_derivatives', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(
+            [source['type'] for source in post.sources][-2:],
+            ['image/webp', 'image/jpeg'],
+        )
@@ -1,8 +1,13 @@
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
-from ..models import Post, Group
+from .. import counters
+from ..feeds import feed_queryset
+from ..models import Group, Post, TableCount
+from ..paginators import CursorPaginator, FeedPaginator, WindowedPaginator
+from ..timeline import TIMELINE_ORDERING, timeline_posts
 
 
 User = get_user_model()
@@ -29,6 +34,9 @@ class PaginatorViewsTest(TestCase):
             for post_number in range(13)
         ]
         Post.objects.bulk_create(cls.posts)
+        # bulk_create не шлёт сигналы, а страница группы берёт число
+        # постов из счётчика Group.posts_count
+        counters.rebuild_counters(counters.stale_counters())
 
     def setUp(self):
         self.authorized_client = Client()
@@ -83,3 +91,175 @@ class PaginatorViewsTest(TestCase):
             )
         )
         self.assertEqual(len(response.context['page_obj']), 3)
+
+
+@override_settings(FEED_PAGINATION='cursor')
+class CursorPaginatorViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='cursor_author')
+        cls.group = Group.objects.create(
+            title='cursor_group_title',
+            slug='cursor_group_slug',
+            description='Тестовое описание группы',
+        )
+        Post.objects.bulk_create(
+            Post(
+                text=f'Текст №{post_number}',
+                author=cls.user,
+                group=cls.group,
+            )
+            for post_number in range(13)
+        )
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+        self.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+        )
+
+    def test_cursor_pages_walk_forward_and_back(self):
+        """Курсоры ведут вперёд и назад без пропусков и повторов."""
+        expected = list(
+            Post.objects.order_by('-pub_date', '-pk')
+            .values_list('pk', flat=True)
+        )
+        for url in self.urls:
+            with self.subTest(url=url):
+                first = self.client.get(url).context['page_obj']
+                self.assertEqual(len(first), 10)
+                self.assertFalse(first.has_previous())
+                second = self.client.get(
+                    url, {'after': first.next_cursor}
+                ).context['page_obj']
+                self.assertEqual(len(second), 3)
+                self.assertFalse(second.has_next())
+                self.assertEqual(
+                    [post.pk for post in first] + [post.pk for post in second],
+                    expected,
+                )
+                back = self.client.get(
+                    url, {'before': second.previous_cursor}
+                ).context['page_obj']
+                self.assertEqual(list(back), list(first))
+
+    def test_cursor_page_skips_count_query(self):
+        """Курсорная страница не выполняет COUNT(*)."""
+        response = self.client.get(reverse('posts:index'))
+        page_obj = response.context['page_obj']
+        with self.assertNumQueries(1):
+            page_obj.paginator.get_page(after=page_obj.next_cursor)
+
+    def test_seek_is_single_index_range(self):
+        """Страница после курсора — отрезок индекса без сортировки."""
+        post = Post.objects.order_by('pub_date').first()
+        feeds = {
+            'index': (feed_queryset(), None),
+            'group': (feed_queryset(self.group.posts.all()), None),
+            'profile': (feed_queryset(self.user.posts.all()), None),
+            'follow': (
+                feed_queryset(timeline_posts(self.user), TIMELINE_ORDERING),
+                TIMELINE_ORDERING,
+            ),
+        }
+        for name, (queryset, ordering) in feeds.items():
+            with self.subTest(feed=name):
+                paginator = CursorPaginator(queryset, 10, ordering)
+                for forward, order in (
+                    (True, paginator.ordering),
+                    (False, paginator.reverse_ordering),
+                ):
+                    plan = paginator._seek(
+                        post.pub_date, post.pk, forward
+                    ).order_by(*order)[:11].explain()
+                    self.assertRegex(plan, r'pub_date[<>]\?')
+                    self.assertNotIn('MULTI-INDEX OR', plan)
+                    self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_broken_cursor_returns_first_page(self):
+        """Битый курсор ведёт на первую страницу."""
+        response = self.client.get(reverse('posts:index'), {'after': '!!'})
+        self.assertEqual(len(response.context['page_obj']), 10)
+
+
+class WindowedPaginatorTest(TestCase):
+    def test_page_range_is_bounded(self):
+        paginator = WindowedPaginator(range(100000), 10)
+        ellipsis = paginator.ELLIPSIS
+        self.assertEqual(
+            paginator.page(5000).page_range,
+            [1, ellipsis, 4998, 4999, 5000, 5001, 5002, ellipsis, 10000],
+        )
+        self.assertEqual(
+            paginator.page(2).page_range, [1, 2, 3, 4, ellipsis, 10000]
+        )
+        self.assertEqual(
+            paginator.page(10000).page_range,
+            [1, ellipsis, 9998, 9999, 10000],
+        )
+        self.assertEqual(
+            WindowedPaginator(range(50), 10).page(3).page_range,
+            [1, 2, 3, 4, 5],
+        )
+
+    @override_settings(EXACT_COUNT_LIMIT=20)
+    def test_count_estimated_past_limit(self):
+        user = User.objects.create(username='estimated')
+        Post.objects.bulk_create(
+            Post(text=f'Пост {number}', author=user) for number in range(45)
+        )
+        paginator = FeedPaginator(
+            Post.objects.filter(author=user).order_by('pk'), 10
+        )
+        self.assertEqual(paginator.count, 21)
+        self.assertTrue(paginator.count_is_estimate)
+        # страницы за оценкой доступны, конец ленты виден по выборке
+        with self.assertNumQueries(1):
+            page = paginator.get_page(4)
+        self.assertEqual(len(page), 10)
+        self.assertTrue(page.has_next())
+        self.assertEqual(page.page_range, [1, 2, 3, 4, 5, paginator.ELLIPSIS])
+        self.assertEqual(paginator.count, 41)
+        page = paginator.get_page(5)
+        self.assertEqual(len(page), 5)
+        self.assertFalse(page.has_next())
+        self.assertEqual(page.page_range, [1, 2, 3, 4, 5])
+        # конец ленты найден: число постов теперь точное
+        self.assertEqual(paginator.count, 45)
+        self.assertFalse(paginator.count_is_estimate)
+
+    @override_settings(EXACT_COUNT_LIMIT=20)
+    def test_estimated_navigation_rendered(self):
+        user = User.objects.create(username='estimated')
+        Post.objects.bulk_create(
+            Post(text=f'Пост {number}', author=user) for number in range(45)
+        )
+        # без числа строк из TableCount — оценка по выборкам
+        TableCount.objects.all().delete()
+        response = self.client.get(reverse('posts:index'), {'page': 4})
+        self.assertContains(response, '?page=5')
+        self.assertNotContains(response, 'Последняя')
+
+    @override_settings(EXACT_COUNT_LIMIT=20)
+    def test_table_count_past_limit(self):
+        user = User.objects.create(username='counted')
+        Post.objects.bulk_create(
+            Post(text=f'Пост {number}', author=user) for number in range(45)
+        )
+        cache.clear()
+        paginator = FeedPaginator(Post.objects.order_by('-pk'), 10)
+        # число постов держат триггеры — точное, без COUNT по таблице
+        self.assertEqual(paginator.count, 45)
+        self.assertFalse(paginator.count_is_estimate)
+        self.assertEqual(paginator.num_pages, 5)
+        # пока число в кэше, таблицу не считают вовсе
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                FeedPaginator(Post.objects.order_by('-pk'), 10).count, 45
+            )
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Последняя')
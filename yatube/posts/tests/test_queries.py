@@ -0,0 +1,106 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+
+
+User = get_user_model()
+
+
+class FeedQueryCountTests(TestCase):
+    """Число запросов лент не зависит от количества постов на странице."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(
+            username='writer', first_name='Имя', last_name='Фамилия'
+        )
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='queries-group',
+            description='Описание группы',
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+        cls.urls = {
+            reverse('posts:index'): 4,
+            reverse('posts:group_posts', kwargs={'slug': cls.group.slug}): 4,
+            # плюс подписки читателя для кнопки при холодном кэше
+            reverse('posts:profile', kwargs={'username': cls.author}): 5,
+            # плюс пересчёт популярных авторов при холодном кэше
+            reverse('posts:follow_index'): 5,
+        }
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def add_posts(self, count):
+        for number in range(count):
+            post = Post.objects.create(
+                text=f'Пост {number}', author=self.author, group=self.group
+            )
+            Comment.objects.create(
+                post=post, author=self.user, text='Комментарий'
+            )
+
+    def assert_query_counts(self):
+        for url, queries in self.urls.items():
+            with self.subTest(url=url):
+                # первый запрос создаёт строку счётчиков автора
+                self.client.get(url)
+                cache.clear()
+                with self.assertNumQueries(queries):
+                    self.client.get(url)
+
+    def test_single_post_page(self):
+        self.add_posts(1)
+        self.assert_query_counts()
+
+    def test_full_page(self):
+        self.add_posts(15)
+        self.assert_query_counts()
+
+    def test_post_detail_skips_count_queries(self):
+        """Страница поста берёт число постов автора из счётчика."""
+        self.add_posts(3)
+        url = reverse(
+            'posts:post_detail', kwargs={'post_id': Post.objects.first().pk}
+        )
+        self.client.get(url)
+        # сессия, пользователь, пост с автором и счётчиками, комментарии
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertEqual(response.context['posts_counter'], 3)
+
+    def test_post_detail_comments_constant_queries(self):
+        """Комментарии с авторами — один запрос при любом их числе."""
+        self.add_posts(1)
+        post = Post.objects.first()
+        for number in range(30):
+            author = User.objects.create_user(username=f'commenter{number}')
+            Comment.objects.create(post=post, author=author, text='Текст')
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        self.client.get(url)
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        comments = response.context['comments']
+        self.assertEqual(len(comments), 20)
+        self.assertTrue(comments.has_next)
+        self.assertContains(response, 'commenter18')
+        response = self.client.get(
+            url, {'comments_after': comments.next_cursor}
+        )
+        self.assertEqual(len(response.context['comments']), 11)
+        self.assertContains(response, 'commenter29')
+
+    def test_comment_count_annotated(self):
+        """Лента отдаёт число комментариев каждого поста."""
+        self.add_posts(2)
+        response = self.client.get(reverse('posts:index'))
+        for post in response.context['page_obj']:
+            self.assertEqual(post.comment_count, 1)
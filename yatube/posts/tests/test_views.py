@@ -1,10 +1,14 @@
+import os
+
 from django.contrib.auth import get_user_model
 from django.test import Client, TestCase
 from django.urls import reverse
 from django import forms
 from django.db.models.fields.files import ImageFieldFile
 from django.core.cache import cache
+from django.conf import settings
 
+from core import metrics
 from ..models import Post, Group
 
 
@@ -189,11 +193,130 @@ class TaskPagesTests(TestCase):
     def test_cache_index(self):
         """Проверка работы кэширования."""
         cache.clear()
+        metrics.reset()
         response = self.authorized_client.get(
             reverse('posts:index')
         )
-        post = Post.objects.get(id=self.post.id)
         cache_save = response.content
-        post.delete()
+        Post.objects.filter(id=self.post.id).update(text='Без сигналов')
         response = self.authorized_client.get(reverse('posts:index'))
         self.assertEqual(response.content, cache_save)
+        self.assertIn(
+            f'{settings.METRICS_PREFIX}_cache_hits_total'
+            f'{{view="posts:index",worker="{os.getpid()}"}} 1',
+            metrics.prometheus(),
+        )
+
+    def test_cache_invalidated_on_post_delete(self):
+        """Удаление поста сбрасывает закэшированные ленты."""
+        post = Post.objects.create(
+            author=self.author, text='Удаляемый пост', group=self.group
+        )
+        pages = (
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.author}),
+        )
+        cache.clear()
+        for url in pages:
+            with self.subTest(url=url):
+                self.assertContains(
+                    self.authorized_client.get(url), 'Удаляемый пост'
+                )
+        post.delete()
+        for url in pages:
+            with self.subTest(url=url):
+                self.assertNotContains(
+                    self.authorized_client.get(url), 'Удаляемый пост'
+                )
+
+    def test_cache_key_depends_on_page(self):
+        """Вторая страница не отдаёт закэшированную первую."""
+        Post.objects.bulk_create(
+            Post(author=self.author, text=f'Пост {number}')
+            for number in range(settings.POST_COUNT)
+        )
+        cache.clear()
+        first = self.authorized_client.get(reverse('posts:index'))
+        second = self.authorized_client.get(
+            reverse('posts:index'), {'page': 2}
+        )
+        self.assertNotEqual(first.content, second.content)
+        self.assertContains(second, self.post.text)
+
+    def test_cache_key_uses_resolved_page(self):
+        """Варианты ?page=, ведущие на одну страницу, делят её фрагмент."""
+        cache.clear()
+        keys = {
+            self.authorized_client.get(
+                reverse('posts:index'), {'page': page}
+            ).context['feed_cache_key']
+            for page in ('1', '01', 'abc', '999999')
+        }
+        self.assertEqual(len(keys), 1)
+        after = self.authorized_client.get(
+            reverse('posts:index'), {'after': '!!'}
+        ).context['feed_cache_key']
+        self.assertNotIn('!!', after)
+
+
+class SearchViewTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='search_author')
+        self.exact = Post.objects.create(
+            text='Котики и <b>котики</b>: всё про котиков',
+            author=self.author,
+        )
+        self.once = Post.objects.create(
+            text='Собаки, кошки и один котик', author=self.author
+        )
+        Post.objects.create(text='Про погоду', author=self.author)
+
+    def search(self, query, **params):
+        return self.client.get(
+            reverse('posts:search'), {'q': query, **params}
+        )
+
+    def test_results_ranked_and_highlighted(self):
+        response = self.search('котик')
+        posts = list(response.context['page_obj'])
+        self.assertEqual(posts, [self.exact, self.once])
+        self.assertIn('<mark>Котики</mark>', posts[0].snippet)
+        self.assertIn('&lt;b&gt;', posts[0].snippet)
+        self.assertContains(response, 'Найдено записей: 2')
+
+    def test_index_follows_edits_and_deletes(self):
+        self.once.text = 'Только собаки'
+        self.once.save()
+        self.assertEqual(
+            list(self.search('котик').context['page_obj']), [self.exact]
+        )
+        self.exact.delete()
+        self.assertEqual(list(self.search('котик').context['page_obj']), [])
+        self.assertEqual(
+            list(self.search('собаки').context['page_obj']), [self.once]
+        )
+
+    def test_fts_syntax_in_query_is_harmless(self):
+        response = self.search('"котик" OR (NEAR')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['page_obj'].paginator.count, 0)
+        response = self.search('')
+        self.assertEqual(response.context['page_obj'].paginator.count, 0)
+
+    def test_pagination_keeps_query(self):
+        for number in range(settings.POST_COUNT):
+            Post.objects.create(text=f'котик {number}', author=self.author)
+        response = self.search('котик', page=2)
+        self.assertEqual(len(response.context['page_obj']), 2)
+        self.assertContains(response, 'href="?q=%D0%BA')
+
+    def test_admin_search_uses_index(self):
+        admin = User.objects.create_superuser(
+            'search_admin', 'admin@example.com', 'password'
+        )
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'погод'}
+        )
+        self.assertEqual(response.context['cl'].result_count, 1)
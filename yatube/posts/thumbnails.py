@@ -0,0 +1,132 @@
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from sorl.thumbnail import get_thumbnail
+
+from posts import derivatives, page_cache
+from posts.models import Post
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_process_pool = None
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def process_pool():
+    """Пул процессов для ресайза: Pillow упирается в CPU."""
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(
+            max_workers=settings.IMAGE_PROCESS_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+    return _process_pool
+
+
+def derivative_args(image_name):
+    width, height = settings.POST_THUMBNAIL_GEOMETRY.split('x')
+    stem = os.path.basename(image_name).replace('.', '_')
+    return (
+        default_storage.path(image_name),
+        settings.MEDIA_ROOT,
+        stem,
+        settings.POST_IMAGE_WIDTHS,
+        derivatives.supported_formats(settings.POST_IMAGE_FORMATS),
+        int(width) / int(height),
+    )
+
+
+def sources_json(rendered) -> str:
+    """[(format, width, name), ...] -> JSON для Post.image_sources."""
+    sources = []
+    for image_format in settings.POST_IMAGE_FORMATS:
+        srcset = ', '.join(
+            f'{default_storage.url(name)} {width}w'
+            for name_format, width, name in rendered
+            if name_format == image_format
+        )
+        if srcset:
+            sources.append({
+                'type': derivatives.MIME_TYPES[image_format],
+                'srcset': srcset,
+            })
+    return json.dumps(sources)
+
+
+def render_derivatives(image_names):
+    """Сделать производные пачки картинок: {name: JSON источников}."""
+    jobs = [derivative_args(name) for name in image_names]
+    if settings.IMAGE_PROCESS_WORKERS and jobs:
+        results = process_pool().map(derivatives.render_or_none, *zip(*jobs))
+    else:
+        results = [derivatives.render_or_none(*job) for job in jobs]
+    return {
+        name: sources_json(rendered)
+        for name, rendered in zip(image_names, results)
+        if rendered
+    }
+
+
+def store_derivatives(sources_by_name):
+    for name, sources in sources_by_name.items():
+        Post.objects.filter(image=name).update(image_sources=sources)
+
+
+def generate(post_id):
+    """Миниатюра и производные картинки поста, адреса — в строку Post."""
+    post = Post.objects.filter(pk=post_id).only(
+        'image', 'author', 'group'
+    ).first()
+    if post is None or not post.image:
+        return None
+    try:
+        derivatives.strip_metadata(post.image.path)
+        thumbnail = get_thumbnail(
+            post.image,
+            settings.POST_THUMBNAIL_GEOMETRY,
+            crop='center',
+            upscale=True,
+        )
+    except Exception:
+        logger.exception('Не удалось сделать миниатюру поста %s', post_id)
+        return None
+    Post.objects.filter(pk=post_id, image=post.image.name).update(
+        thumbnail_url=thumbnail.url
+    )
+    store_derivatives(render_derivatives([post.image.name]))
+    page_cache.invalidate(*page_cache.post_scopes(post))
+    return thumbnail.url
+
+
+def _generate_in_worker(post_id):
+    close_old_connections()
+    try:
+        return generate(post_id)
+    finally:
+        close_old_connections()
+
+
+def schedule(post):
+    """Поставить миниатюру в очередь после коммита транзакции запроса."""
+    if not settings.THUMBNAIL_ASYNC:
+        transaction.on_commit(lambda: generate(post.pk))
+        return
+    transaction.on_commit(
+        lambda: executor().submit(_generate_in_worker, post.pk)
+    )
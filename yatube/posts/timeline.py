@@ -0,0 +1,312 @@
+import heapq
+from collections import defaultdict
+from itertools import chain, islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Max, Min, Sum
+
+from posts import follow_graph
+from posts.models import Follow, Post, TimelineEntry
+
+PULL_AUTHORS_KEY = 'timeline:pull_authors'
+# Лента подписок сортируется и листается по колонкам TimelineEntry:
+# страница — отрезок индекса (user, -pub_date, -post)
+TIMELINE_ORDERING = ('feed_date', 'feed_pk')
+
+
+def fanout_author_ids(author_ids) -> set:
+    """Авторы, чьи посты раскладываем по лентам, — одним запросом.
+
+    Слишком популярных авторов не раскладываем: их посты лента
+    добавляет при чтении.
+    """
+    author_ids = set(author_ids)
+    popular = (
+        Follow.objects
+        .filter(author_id__in=author_ids)
+        .values('author')
+        .annotate(followers=Count('pk'))
+        .filter(followers__gt=settings.TIMELINE_FANOUT_LIMIT)
+        .values_list('author', flat=True)
+    )
+    return author_ids.difference(popular)
+
+
+def latest_posts(author_ids, limit):
+    """По limit последних постов каждого автора одним запросом."""
+    if not author_ids:
+        return []
+    placeholders = ', '.join(['%s'] * len(author_ids))
+    return Post.objects.raw(
+        'SELECT id, author_id, pub_date FROM ('
+        ' SELECT id, author_id, pub_date, ROW_NUMBER() OVER ('
+        '  PARTITION BY author_id ORDER BY pub_date DESC, id DESC'
+        ' ) AS position'
+        f' FROM {Post._meta.db_table} WHERE author_id IN ({placeholders})'
+        ') AS latest WHERE position <= %s',
+        [*author_ids, limit],
+    )
+
+
+def fan_out_post(post):
+    """Положить новый пост в ленты всех подписчиков автора."""
+    fan_out_posts([post])
+
+
+def fan_out_posts(posts):
+    """fan_out_post() для пачки постов, например при импорте."""
+    author_ids = {post.author_id for post in posts}
+    fanout_ids = fanout_author_ids(author_ids)
+    for author_id in author_ids - fanout_ids:
+        mark_pull_author(author_id)
+    if not fanout_ids:
+        return
+    followers = defaultdict(list)
+    for author_id, user_id in Follow.objects.filter(
+        author_id__in=fanout_ids
+    ).values_list('author_id', 'user_id'):
+        followers[author_id].append(user_id)
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(
+                user_id=user_id,
+                post_id=post.pk,
+                author_id=post.author_id,
+                pub_date=post.pub_date,
+            )
+            for post in posts
+            for user_id in followers[post.author_id]
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавить в ленту последние посты автора после подписки."""
+    backfill_many([(user_id, author_id)])
+
+
+def backfill_many(follows):
+    """backfill() для пачки пар (user_id, author_id)."""
+    readers = defaultdict(list)
+    for user_id, author_id in follows:
+        readers[author_id].append(user_id)
+    posts = latest_posts(
+        sorted(fanout_author_ids(readers)), settings.TIMELINE_BACKFILL_SIZE
+    )
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(
+                user_id=user_id,
+                post_id=post.pk,
+                author_id=post.author_id,
+                pub_date=post.pub_date,
+            )
+            for post in posts
+            for user_id in readers[post.author_id]
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def purge(user_id, author_id):
+    """Убрать из ленты посты автора после отписки."""
+    purge_many(user_id, [author_id])
+
+
+def purge_many(user_id, author_ids):
+    """purge() для нескольких авторов одним DELETE."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, author_id__in=author_ids
+    ).delete()
+
+
+def pull_author_ids() -> frozenset:
+    """Авторы, у которых подписчиков больше TIMELINE_FANOUT_LIMIT.
+
+    Множество общее для всех пользователей и живёт в кэше, чтобы
+    не пересчитывать подписчиков на каждый запрос ленты.
+    """
+    author_ids = cache.get(PULL_AUTHORS_KEY)
+    if author_ids is None:
+        author_ids = frozenset(
+            Follow.objects
+            .values('author')
+            .annotate(followers=Count('pk'))
+            .filter(followers__gt=settings.TIMELINE_FANOUT_LIMIT)
+            .values_list('author', flat=True)
+        )
+        cache.set(
+            PULL_AUTHORS_KEY, author_ids, settings.TIMELINE_PULL_CACHE_TTL
+        )
+    return author_ids
+
+
+def mark_pull_author(author_id):
+    cache.set(
+        PULL_AUTHORS_KEY,
+        pull_author_ids() | {author_id},
+        settings.TIMELINE_PULL_CACHE_TTL,
+    )
+
+
+class HybridTimeline:
+    """Лента подписок из нескольких источников, слитая в Python.
+
+    Материализованная лента и посты каждого популярного автора
+    читаются отдельными запросами — каждый отрезком своего индекса
+    и с тем же LIMIT, что у страницы, — а heapq.merge сливает их
+    по TIMELINE_ORDERING. Один запрос с OR по источникам сортировал
+    бы во временном B-дереве все их строки.
+
+    Повторяет ту часть интерфейса QuerySet, которой пользуются
+    feed_queryset, пагинаторы и api.feed_state.
+    """
+    AGGREGATES = {Count: sum, Max: max, Min: min, Sum: sum}
+
+    def __init__(self, querysets, ordering=(), bounds=(0, None)):
+        self.querysets = list(querysets)
+        self.ordering = tuple(ordering)
+        self.bounds = bounds
+        self.model = self.querysets[0].model
+        self._result = None
+
+    def _chain(self, method, *args, **kwargs):
+        return HybridTimeline(
+            [getattr(queryset, method)(*args, **kwargs)
+             for queryset in self.querysets],
+            self.ordering,
+        )
+
+    def filter(self, *args, **kwargs):
+        return self._chain('filter', *args, **kwargs)
+
+    def exclude(self, *args, **kwargs):
+        return self._chain('exclude', *args, **kwargs)
+
+    def annotate(self, *args, **kwargs):
+        return self._chain('annotate', *args, **kwargs)
+
+    def select_related(self, *fields):
+        return self._chain('select_related', *fields)
+
+    def only(self, *fields):
+        return self._chain('only', *fields)
+
+    def values(self, *fields):
+        return self._chain('values', *fields)
+
+    def order_by(self, *fields):
+        timeline = self._chain('order_by', *fields)
+        timeline.ordering = fields
+        return timeline
+
+    @property
+    def ordered(self):
+        return bool(self.ordering)
+
+    def _sources(self):
+        stop = self.bounds[1]
+        if stop is None:
+            return self.querysets
+        return [queryset[:stop] for queryset in self.querysets]
+
+    def _sort_key(self):
+        names = [field.lstrip('-') for field in self.ordering]
+
+        def key(row):
+            if isinstance(row, dict):
+                return tuple(row[name] for name in names)
+            return tuple(getattr(row, name) for name in names)
+        return key
+
+    def _fetch(self):
+        if self._result is None:
+            if self.ordering:
+                rows = heapq.merge(
+                    *self._sources(),
+                    key=self._sort_key(),
+                    reverse=self.ordering[0].startswith('-'),
+                )
+            else:
+                rows = chain(*self._sources())
+            self._result = list(islice(rows, *self.bounds))
+        return self._result
+
+    def __iter__(self):
+        return iter(self._fetch())
+
+    def __len__(self):
+        return len(self._fetch())
+
+    def __bool__(self):
+        return bool(self._fetch())
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return list(self[index:index + 1])[0]
+        offset, limit = self.bounds
+        start = offset + (index.start or 0)
+        stop = None if index.stop is None else offset + index.stop
+        if limit is not None:
+            stop = limit if stop is None else min(stop, limit)
+        return HybridTimeline(self.querysets, self.ordering, (start, stop))
+
+    def count(self):
+        start, stop = self.bounds
+        total = sum(source.count() for source in self._sources())
+        if stop is not None:
+            total = min(total, stop)
+        return max(total - start, 0)
+
+    def aggregate(self, **aggregates):
+        results = [
+            queryset.aggregate(**aggregates) for queryset in self.querysets
+        ]
+        combined = {}
+        for name, aggregate in aggregates.items():
+            values = [
+                result[name] for result in results
+                if result[name] is not None
+            ]
+            combine = self.AGGREGATES[type(aggregate)]
+            combined[name] = combine(values) if values else None
+        return combined
+
+    def explain(self):
+        return '\n'.join(
+            source.explain() for source in self._sources()
+        )
+
+
+def timeline_posts(user):
+    """Посты ленты подписок с полями TIMELINE_ORDERING.
+
+    Обычно это один проход по индексу материализованной ленты; посты
+    популярных авторов добавляются при чтении, см. HybridTimeline.
+    """
+    # annotate после filter берёт тот же JOIN, что и фильтр по user
+    pushed = Post.objects.filter(timeline_entries__user=user).annotate(
+        feed_date=F('timeline_entries__pub_date'),
+        feed_pk=F('timeline_entries__post'),
+    )
+    pull_ids = pull_author_ids()
+    if not pull_ids:
+        return pushed
+    pulled = [
+        author_id for author_id in follow_graph.following_ids(user.pk)
+        if author_id in pull_ids
+    ]
+    if not pulled:
+        return pushed
+    # записи, разложенные до того, как автор стал популярным, дали бы
+    # повторы: его посты приходят только из его собственного отрезка
+    return HybridTimeline(
+        [pushed.exclude(author_id__in=pulled)] + [
+            Post.objects.filter(author_id=author_id).annotate(
+                feed_date=F('pub_date'), feed_pk=F('pk')
+            )
+            for author_id in pulled
+        ]
+    )
@@ -0,0 +1,76 @@
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.template.defaultfilters import filesizeformat
+from PIL import Image
+
+# Заголовки JPEG/PNG/GIF/WebP с размерами укладываются в первые килобайты
+HEADER_LIMIT = 64 * 1024
+
+
+def pixel_limit_error(width, height):
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        return (
+            f'Разрешение {width}x{height} больше допустимых '
+            f'{settings.POST_IMAGE_MAX_PIXELS} пикселей.'
+        )
+    return None
+
+
+def inspect_header(head: bytes):
+    """Проверить размеры картинки по заголовку, не декодируя пиксели.
+
+    Возвращает (прочитан ли заголовок, причина отказа или None).
+    """
+    try:
+        with Image.open(BytesIO(head)) as image:
+            width, height = image.size
+    except Image.DecompressionBombError:
+        return True, 'Слишком большое разрешение картинки.'
+    except (OSError, SyntaxError, ValueError):
+        return False, None
+    return True, pixel_limit_error(width, height)
+
+
+class ImageLimitUploadHandler(FileUploadHandler):
+    """Первый обработчик загрузок: режет слишком большие файлы на лету.
+
+    Данные передаются дальше по цепочке (в память, а после
+    FILE_UPLOAD_MAX_MEMORY_SIZE — во временный файл на диске), но
+    загрузка обрывается, как только превышен POST_IMAGE_MAX_BYTES или
+    заголовок картинки обещает больше POST_IMAGE_MAX_PIXELS пикселей.
+    Причина отказа остаётся в request.rejected_uploads для формы.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.head = b''
+        self.check_header = (self.content_type or '').startswith('image/')
+
+    def reject(self, message):
+        rejected = getattr(self.request, 'rejected_uploads', {})
+        rejected[self.field_name] = message
+        self.request.rejected_uploads = rejected
+        raise SkipFile(message)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.POST_IMAGE_MAX_BYTES:
+            self.reject(
+                'Файл больше '
+                f'{filesizeformat(settings.POST_IMAGE_MAX_BYTES)}.'
+            )
+        if self.check_header:
+            self.head += raw_data
+            done, error = inspect_header(self.head)
+            if error:
+                self.reject(error)
+            if done or len(self.head) >= HEADER_LIMIT:
+                self.check_header = False
+                self.head = b''
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
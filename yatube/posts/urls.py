@@ -1,6 +1,6 @@
 from django.urls import path
 
-from . import views
+from . import api, views
 
 app_name = 'posts'
 
@@ -14,8 +14,23 @@ urlpatterns = [
     path('posts/<int:post_id>/comment/',
          views.add_comment, name='add_comment'),
     path('follow/', views.follow_index, name='follow_index'),
+    path('search/', views.search, name='search'),
     path('profile/<str:username>/follow/',
          views.profile_follow, name='profile_follow'),
     path('profile/<str:username>/unfollow/',
          views.profile_unfollow, name='profile_unfollow'),
+    path('api/posts/', api.index, name='api_index'),
+    path('api/group/<slug:slug>/', api.group_posts, name='api_group_posts'),
+    path('api/profile/<str:username>/', api.profile, name='api_profile'),
+    path('api/posts/<int:post_id>/',
+         api.post_detail, name='api_post_detail'),
+    path('api/posts/<int:post_id>/comments/',
+         api.post_comments, name='api_post_comments'),
+    path('api/follow/', api.follow_index, name='api_follow_index'),
+    path('api/follow/updates/',
+         api.follow_updates, name='api_follow_updates'),
+    path('api/follow/stream/', api.follow_stream, name='api_follow_stream'),
+    path('api/follow/batch/', api.follow_batch, name='api_follow_batch'),
+    path('api/follow/suggestions/',
+         api.follow_suggestions, name='api_follow_suggestions'),
 ]
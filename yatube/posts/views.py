@@ -1,66 +1,102 @@
+from urllib.parse import urlencode
+
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
 from django.shortcuts import get_object_or_404, render, redirect
 from django.conf import settings
+from django.db import transaction
 
-from posts.models import Post, Group, User, Comment, Follow
+from posts import follow_graph, thumbnails
+from posts.search import search_posts
+from posts.models import Post, Group, User, Follow
 from posts.forms import PostForm, CommentForm
-
-
-def pagination(posts,
-               page_number: int,
-               paginator_count_of_posts: int = settings.POST_COUNT
-               ) -> int:
-    paginator = Paginator(posts, paginator_count_of_posts)
-    page_obj = paginator.get_page(page_number)
+from posts.counters import author_stats
+from posts.feeds import (
+    FEED_ORDERING, comment_queryset, feed_queryset, post_queryset,
+)
+from posts.page_cache import page_key
+from posts.paginators import (
+    CommentPaginator, CursorPaginator, FeedPaginator, WindowedPaginator,
+)
+from posts.timeline import TIMELINE_ORDERING, timeline_posts
+
+
+def pagination(request,
+               posts,
+               paginator_count_of_posts: int = settings.POST_COUNT,
+               count: int = None,
+               ordering=FEED_ORDERING):
+    """Страница ленты: ?page=N или курсоры ?after=/?before=."""
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    if settings.FEED_PAGINATION == 'cursor' or after or before:
+        paginator = CursorPaginator(
+            posts, paginator_count_of_posts, ordering=ordering
+        )
+        return paginator.get_page(after=after, before=before)
+    paginator = FeedPaginator(posts, paginator_count_of_posts, count=count)
+    page_obj = paginator.get_page(request.GET.get('page'))
     return page_obj
 
 
 def index(request):
-    posts = Post.objects.all().order_by('-pub_date')
-    page_number = request.GET.get('page')
-    page_obj = pagination(posts, page_number)
+    posts = feed_queryset()
+    page_obj = pagination(request, posts)
 
     context = {
         'page_obj': page_obj,
         'posts': posts,
+        'feed_cache_key': page_key(page_obj, 'index', 'index'),
     }
     return render(request, 'posts/index.html', context)
 
 
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    page_number = request.GET.get('page')
-    page_obj = pagination(posts, page_number)
+    posts = feed_queryset(group.posts.all())
+    # число постов — из счётчика, который ведут сигналы Post
+    page_obj = pagination(request, posts, count=group.posts_count)
     context = {
         'group': group,
         'page_obj': page_obj,
+        'feed_cache_key': page_key(
+            page_obj, 'group_posts', f'group:{group.pk}'
+        ),
     }
     return render(request, 'posts/group_list.html', context)
 
 
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    post_list = author.posts.all()
-    posts_counter = post_list.count()
-    page_number = request.GET.get('page')
-    page_obj = pagination(post_list, page_number)
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
+    post_list = feed_queryset(author.posts.all())
+    posts_counter = author_stats(author).posts_count
+    page_obj = pagination(request, post_list, count=posts_counter)
+    following = (
+        request.user.is_authenticated
+        and follow_graph.is_following(request.user.pk, author.pk)
+    )
     context = {
         'author': author,
         'page_obj': page_obj,
         'posts_counter': posts_counter,
+        'following': following,
+        'follow_counts': follow_graph.counts(author),
+        'feed_cache_key': page_key(
+            page_obj, 'profile', f'author:{author.pk}'
+        ),
     }
     return render(request, 'posts/profile.html', context)
 
 
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
-    username_obj = User.objects.get(username=post.author)
-    posts_counter = username_obj.posts.count()
+    post = get_object_or_404(post_queryset(), id=post_id)
+    posts_counter = author_stats(post.author).posts_count
     template = 'posts/post_detail.html'
     form = CommentForm()
-    comments = Comment.objects.filter(post_id=post_id)
+    comments = CommentPaginator(
+        comment_queryset(post_id), settings.COMMENTS_PER_PAGE
+    ).get_page(after=request.GET.get('comments_after'))
     context = {
         'post': post,
         'posts_counter': posts_counter,
@@ -71,16 +107,20 @@ def post_detail(request, post_id):
 
 
 @login_required()
+@transaction.atomic
 def create_post(request):
     template = 'posts/create_post.html'
     form = PostForm(
         request.POST or None,
         files=request.FILES or None,
+        rejected_uploads=getattr(request, 'rejected_uploads', None),
     )
     if form.is_valid():
         new_post = form.save(commit=False)
         new_post.author = request.user
         new_post.save()
+        if new_post.image:
+            thumbnails.schedule(new_post)
         return redirect('posts:profile', username=request.user.username)
     context = {
         'form': form,
@@ -97,9 +137,12 @@ def post_edit(request, post_id):
     form = PostForm(
         request.POST or None,
         files=request.FILES or None,
-        instance=post)
+        instance=post,
+        rejected_uploads=getattr(request, 'rejected_uploads', None))
     if form.is_valid():
-        form.save()
+        post = form.save()
+        if 'image' in form.changed_data and post.image:
+            thumbnails.schedule(post)
         return redirect('posts:post_detail', post_id=post_id)
     context = {
         'form': form,
@@ -109,6 +152,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     form = CommentForm(request.POST or None)
     post = get_object_or_404(Post, id=post_id)
@@ -122,14 +166,33 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user).all()
-    page_obj = pagination(post_list, request)
-    context = {'page_obj': page_obj}
+    post_list = feed_queryset(
+        timeline_posts(request.user), TIMELINE_ORDERING
+    )
+    page_obj = pagination(request, post_list, ordering=TIMELINE_ORDERING)
+    context = {
+        'page_obj': page_obj,
+        'follow_stream': settings.FOLLOW_STREAM_ENABLED,
+        'follow_poll_interval': settings.FOLLOW_POLL_INTERVAL,
+        'follow_poll_max_interval': settings.FOLLOW_POLL_MAX_INTERVAL,
+    }
     template = 'posts/follow.html'
     return render(request, template, context)
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    paginator = WindowedPaginator(search_posts(query), settings.POST_COUNT)
+    context = {
+        'query': query,
+        'page_obj': paginator.get_page(request.GET.get('page')),
+        'page_query': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     """Подписаться на автора"""
     user = request.user
@@ -143,6 +206,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     template = 'posts:profile'
     get_object_or_404(
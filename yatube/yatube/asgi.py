@@ -0,0 +1,20 @@
+"""
+ASGI config for yatube project.
+
+It exposes the ASGI callable as a module-level variable named ``application``,
+e.g. ``uvicorn yatube.asgi:application``. Views stay synchronous and run in
+a pool of ASGI_THREADS threads, see core.asgi.
+"""
+
+import os
+
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+
+from core.asgi import ASGIHandler
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+application = ASGIHandler(
+    get_wsgi_application(), max_workers=settings.ASGI_THREADS
+)
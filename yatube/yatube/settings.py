@@ -45,11 +45,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -57,12 +59,20 @@ MIDDLEWARE = [
 ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
+# Вне DEBUG скомпилированные шаблоны живут в памяти процесса, а
+# core.template_loaders.Loader ещё и меряет рендеринг каждого шаблона
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+if not DEBUG:
+    TEMPLATE_LOADERS = [('core.template_loaders.Loader', TEMPLATE_LOADERS)]
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.template_backends.InstrumentedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': TEMPLATE_LOADERS,
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -80,12 +90,61 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
-DATABASES = {
+# Профиль БД: default — SQLite как есть, production — WAL и настройки
+# для конкурентных писателей (YATUBE_DB_PROFILE=production)
+DATABASE_PROFILE = os.getenv('YATUBE_DB_PROFILE', 'default')
+DATABASE_PROFILES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+    },
+    'production': {
+        'ENGINE': 'core.sqlite_backend',
+        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {
+            # секунды ожидания блокировки (busy timeout)
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+        },
+        # core.signals.apply_pragmas, на каждое новое соединение
+        'PRAGMAS': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 20000,
+            'mmap_size': 256 * 1024 * 1024,
+            'cache_size': -64 * 1024,
+            'temp_store': 'MEMORY',
+        },
+    },
 }
+DATABASES = {
+    'default': DATABASE_PROFILES[DATABASE_PROFILE],
+}
+# Реплики только для чтения, через запятую: YATUBE_DB_REPLICAS=a.sqlite3,...
+# Локально реплику-файл обновляет manage.py sync_replicas
+DATABASE_REPLICAS = []
+for number, path in enumerate(
+    filter(None, os.getenv('YATUBE_DB_REPLICAS', '').split(',')), 1
+):
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'NAME': path,
+        # в тестах реплика — то же соединение, что и primary
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+REPLICA_VIEWS = [
+    'posts:index',
+    'posts:group_posts',
+    'posts:profile',
+    'posts:post_detail',
+    'posts:follow_index',
+]
+# Сколько секунд после записи читать с primary (больше лага реплик)
+REPLICA_PIN_SECONDS = 5
+REPLICA_PIN_COOKIE = 'read_primary_until'
 
 
 # Password validation
@@ -139,10 +198,119 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
-CACHES = {
-    'default': {
+# locmem — свой кэш у каждого процесса; sqlite и file — общий для всех
+# воркеров на машине, без внешних сервисов
+CACHE_BACKEND = os.getenv('YATUBE_CACHE_BACKEND', 'locmem')
+CACHE_BACKENDS = {
+    'locmem': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    },
+    'sqlite': {
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+            'MAX_SIZE': 256 * 1024 * 1024,
+        },
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+    },
+}
+CACHES = {
+    'default': CACHE_BACKENDS[CACHE_BACKEND],
 }
 
 POST_COUNT = 10
+COMMENTS_PER_PAGE = 20
+
+# Дальше стольких строк Paginator не считает COUNT(*): у таблиц целиком
+# число строк берётся из TableCount (кэш на TABLE_COUNT_TTL), у выборок
+# число страниц — оценка снизу
+EXACT_COUNT_LIMIT = 10000
+TABLE_COUNT_TTL = 60
+
+# 'offset' — классический ?page=N, 'cursor' — keyset-пагинация ?after=/?before=
+FEED_PAGINATION = 'offset'
+
+# Лента подписок: авторы с большим числом подписчиков не раскладываются
+# по лентам при публикации, а читаются при запросе
+TIMELINE_FANOUT_LIMIT = 1000
+TIMELINE_BACKFILL_SIZE = 200
+TIMELINE_PULL_CACHE_TTL = 60 * 5
+
+# Подписки пользователей в кэше (posts.follow_graph): их сбрасывает
+# подписка и отписка, так что живут долго
+FOLLOW_GRAPH_TTL = 60 * 60
+FOLLOW_SUGGESTIONS_LIMIT = 10
+FOLLOW_SUGGESTIONS_SOURCES = 100
+# Сколько авторов можно подписать и отписать одним api/follow/batch/
+FOLLOW_BATCH_LIMIT = 100
+
+# Фрагменты лент живут долго: их сбрасывает смена версии при записи
+FEED_CACHE_TTL = 60 * 60
+
+# Миниатюры постов делает пул потоков после сохранения формы;
+# шаблоны читают готовый адрес из Post.thumbnail_url
+POST_THUMBNAIL_GEOMETRY = '960x339'
+THUMBNAIL_ASYNC = True
+THUMBNAIL_WORKERS = 2
+
+# Производные картинок для srcset: ширины и форматы в порядке
+# предпочтения (недоступные в установленном Pillow пропускаются)
+POST_IMAGE_WIDTHS = (320, 640, 960)
+POST_IMAGE_FORMATS = ('AVIF', 'WEBP', 'JPEG')
+IMAGE_PROCESS_WORKERS = 2
+
+# Загрузка картинок: файл больше FILE_UPLOAD_MAX_MEMORY_SIZE уходит во
+# временный файл, а ImageLimitUploadHandler обрывает загрузку сверх лимитов
+FILE_UPLOAD_HANDLERS = [
+    'posts.uploads.ImageLimitUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+FILE_UPLOAD_MAX_MEMORY_SIZE = 1024 * 1024
+POST_IMAGE_MAX_BYTES = 10 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+
+# Новые посты подписок (posts.live): LocalBroker — подписчики в памяти
+# процесса, CacheBroker — через общий кэш между воркерами
+PUBSUB_BACKEND = os.getenv('YATUBE_PUBSUB_BACKEND', 'core.pubsub.LocalBroker')
+# Под WSGI api/follow/updates/ отвечает сразу, и страница повторяет
+# запрос через FOLLOW_POLL_INTERVAL секунд, удваивая паузу до
+# FOLLOW_POLL_MAX_INTERVAL, пока новых постов нет. Ждать публикации
+# до FOLLOW_POLL_TIMEOUT секунд запрос может только под core.asgi
+FOLLOW_POLL_INTERVAL = 15
+FOLLOW_POLL_MAX_INTERVAL = 5 * 60
+FOLLOW_POLL_TIMEOUT = 25
+# SSE держит поток воркера на всё время соединения, поэтому включается
+# только под ASGI с запасом потоков; по умолчанию страница ждёт новые
+# посты long-poll-ом api/follow/updates/
+FOLLOW_STREAM_ENABLED = os.getenv('YATUBE_FOLLOW_STREAM', '') == '1'
+FOLLOW_STREAM_HEARTBEAT = 15
+FOLLOW_STREAM_MAX_SECONDS = 5 * 60
+FOLLOW_UPDATES_LIMIT = 50
+
+# yatube.asgi: потоков пула, в котором исполняются синхронные представления
+ASGI_THREADS = int(os.getenv('YATUBE_ASGI_THREADS', 8))
+
+# Метрики запросов: заголовок Server-Timing и /metrics/ для Prometheus
+METRICS_ENABLED = True
+# Server-Timing раскрывает число запросов и время БД: только при DEBUG
+# и для staff
+METRICS_SERVER_TIMING = True
+METRICS_PREFIX = 'yatube'
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+# Под gunicorn с несколькими воркерами задайте каталог: воркеры пишут
+# туда итоги, и /metrics/ отдаёт их сумму. Каталог очищают при деплое.
+# Пустой — /metrics/ отдаёт итоги ответившего процесса с меткой worker
+METRICS_DIR = os.getenv('YATUBE_METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = 1
+# /metrics/ видят staff и запросы с заголовком Authorization: Bearer
+# <METRICS_TOKEN>. Адреса из METRICS_ALLOWED_IPS — только если Django
+# видит адрес клиента: за nginx на той же машине REMOTE_ADDR у всех
+# запросов 127.0.0.1, поэтому по умолчанию список пуст
+METRICS_TOKEN = os.getenv('YATUBE_METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = []